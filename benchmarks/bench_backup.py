@@ -0,0 +1,31 @@
+"""
+Backup archive throughput by format, codec and number of compressing threads
+Usage: python benchmarks/bench_backup.py [world_dir]
+(without world_dir, a synthetic world of region-like files is generated)
+"""
+import os, sys, tempfile
+from mcservercontrol.backup.writer import ArchiveWriter
+
+def makeWorld(directory: str, n_files: int = 16, size: int = 8 * 1024 * 1024):
+    # half random (compressed chunk data), half zeros (unused sectors)
+    for i in range(n_files):
+        with open(os.path.join(directory, "r.{}.0.mca".format(i)), "wb") as fp:
+            for _ in range(size // 8192):
+                fp.write(os.urandom(4096) + b"\x00" * 4096)
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        if len(sys.argv) > 1:
+            world_dir = sys.argv[1]
+        else:
+            world_dir = os.path.join(tmp, "world")
+            os.mkdir(world_dir)
+            makeWorld(world_dir)
+        cores = os.cpu_count() or 1
+        cases = [("zip", "deflate", 1)] + [("tar", "deflate", n) for n in sorted({1, 2, 4, cores})] + [("tar", "lzma", cores)]
+        for fmt, codec, workers in cases:
+            writer = ArchiveWriter(fmt, codec, workers = workers)
+            stats = writer.write(world_dir, os.path.join(tmp, "backup" + writer.suffix))
+            print("{:>4} {:>8} x{:<3}: {:>8.1f} MB/s, ratio {:.2f}".format(
+                fmt, codec, workers, stats["mb_per_sec"], stats["bytes_out"] / max(stats["bytes_in"], 1)
+            ))
@@ -0,0 +1,40 @@
+"""
+Log line parsing throughput, legacy vs compiled parser
+Usage: python benchmarks/bench_parser.py [n_lines]
+"""
+import sys, time, random
+from mcservercontrol.listener import EventListener
+
+NAMES = ["Alex", "Steve", "Monsoon", "Notch", "jeb_"]
+TEMPLATES = [
+    "[12:00:00] [Server thread/INFO]: {name} joined the game\n",
+    "[12:00:00] [Server thread/INFO]: <{name}> some chat message from a chatty player\n",
+    "[12:00:00] [Server thread/INFO]: <{name}> \\online-time warn off\n",
+    "[12:00:00] [Server thread/WARN]: Can't keep up! Is the server overloaded? Running 2107ms or 42 ticks behind\n",
+    "[12:00:00] [Worker-Main-3/INFO]: [SomeMod] Loaded 1234 recipes for {name}\n",
+    "[12:00:00] [Server thread/INFO]: There are 5 of a max of 20 players online: Alex, Steve, Monsoon, Notch, jeb_\n",
+    "[12:00:00] [Server thread/INFO]: {name} left the game\n",
+]
+
+class _NoEmit(EventListener):
+    def emit(self, event):
+        ...
+
+def makeLines(n: int):
+    rng = random.Random(0)
+    lines = [tpl.format(name=name) for name in NAMES for tpl in TEMPLATES[:1]]     # everyone logs in first
+    lines += [rng.choice(TEMPLATES[1:-1]).format(name=rng.choice(NAMES)) for _ in range(n)]
+    return lines
+
+def bench(parser: str, lines):
+    listener = _NoEmit(parser)
+    t0 = time.perf_counter()
+    for line in lines:
+        listener.parse(line)
+    return len(lines) / (time.perf_counter() - t0)
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    lines = makeLines(n)
+    for parser in ["legacy", "compiled"]:
+        print("{:>10}: {:>12,.0f} lines/sec".format(parser, bench(parser, lines)))
@@ -1,9 +1,10 @@
 from .observer import PlayerObserver, PlayerCommandObserver, getDefaultObservers
 from .player import Player
 from .listener import EventListener
+from .asyncListener import AsyncEventListener
 from .server import Server
 
 __all__ = [
     "PlayerObserver", "PlayerCommandObserver", "getDefaultObservers",
-    "Player", "EventListener", "Server"
+    "Player", "EventListener", "AsyncEventListener", "Server"
 ]
\ No newline at end of file
@@ -1,19 +1,15 @@
 from typing import List
 from mcservercontrol.observer import PlayerCommandObserver
-from mcservercontrol.player import Player
+from mcservercontrol.player import Player, PlayerStatus
 from mcservercontrol.server import SCHEDULE_ID
 from mcservercontrol import globalVar
 
+PlayerStatus.register("kill_item_thread_ids", list, factory=list)
+
 class CommandKillItem(PlayerCommandObserver):
     """
     Command to kill all items
     """
-    def onPlayerLogin(self, player: Player):
-
-        player.status.setdefault("kill_item_thread_ids", [])
-
-        return super().onPlayerLogin(player)
-
 
     def onTriggered(self, player: Player, args: List[str]):
 
@@ -52,8 +48,7 @@ class CommandKillItem(PlayerCommandObserver):
             _checkAlive()
             if k_ids:
                 for t_id in k_ids:
-                    thread = globalVar.scheduled_threads[t_id]
-                    thread.stop()
+                    self.server.cancelSchedule(t_id)
                 player.status.set("kill_item_thread_ids", [])
 
                 self.server.say(f"Stopped kill item schedule ({player.name})")
@@ -1,8 +1,11 @@
 from typing import List
 from mcservercontrol.observer import Observer, PlayerObserver, PlayerCommandObserver
-from mcservercontrol.player import Player
+from mcservercontrol.player import Player, PlayerStatus
 from mcservercontrol.timeUtils import TimeUtils
 
+PlayerStatus.register("time_last_warn", (int, float), 0, persistent=True)
+PlayerStatus.register("time_warn_flag", bool, True, persistent=True)     # Indicates whether to show warning
+
 def getOnlineTime(player: Player):
     now_stamp = TimeUtils.nowStamp()
     time_since_last_login = now_stamp - player.status.time_login
@@ -71,10 +74,6 @@ class RemindAddictionCallback(PlayerObserver, flag = "RemindAddictionCallback"):
     Online time reminder
     Remind player if anyone plays too long
     """
-    def onPlayerLogin(self, player: Player):
-        player.status.setdefault("time_last_warn", 0, persistent=True)
-        player.status.setdefault("time_warn_flag", True, persistent=True)    # Indicates whether to show warning
-
     @classmethod
     def resetStatus(cls, player):
         player.status.set("time_last_warn", 0, persistent=True)
@@ -85,9 +84,8 @@ class RemindAddictionCallback(PlayerObserver, flag = "RemindAddictionCallback"):
         WARN_TOLERANCE =  3600
         WARN_INTERVAL = 1200
 
-        for player in self.players.values():
-            # "time_last_warn" is not in player status by default
-
+        for player in self.online.players():
+            # players only seen in the reply of /list have no session (time_login) to count from
             if player.status.is_online and player.status.get("time_warn_flag"):
                 online_time = getOnlineTime(player)
                 time_today = online_time["today"]
@@ -1,4 +1,5 @@
-from typing import List
+from typing import List, Optional
+from threading import Thread
 from mcservercontrol.player import Player
 from mcservercontrol.configReader import config
 from .. import PlayerCommandObserver
@@ -9,12 +10,19 @@ class CommandBackup(PlayerCommandObserver):
 
         if len(params) == 0:
             self.onInvalidArguments(player)
+            return
         
         cmd = params[0]
 
         if cmd == "now":
-            self.server.say("Backup the world (by - {})".format(player.name))
-            self.server.backupWorld(remove_more_than=config()["max_backup"])
+            job = self.server.backupWorld(remove_more_than=config()["max_backup"])
+            if job.requests == 1:
+                self.server.say("Backup the world (by - {})".format(player.name))
+            else:
+                self.server.tellraw(player, "A backup is already queued, joined it.", color="gold")
+        
+        elif cmd == "status":
+            self.server.tellraw(player, self.server.backups.status(), color="gold")
         
         elif cmd == "list":
             to_tell = "List of backups for this world: \n"
@@ -22,20 +30,52 @@ class CommandBackup(PlayerCommandObserver):
             self.server.tellraw(player, to_tell + "\n".join(self.server.listBackups()), color="gold")
         
         elif cmd == "rollback":
-            if len(params)!=2:
+            if len(params) < 2:
+                self.onInvalidArguments(player)
+                return
+            self.server.say("Restoring backup {} (by - {}), the server will restart shortly".format(params[1], player.name))
+            # the backup is extracted while the server is running, not on the listener thread
+            Thread(target=self._rollback, args=(params[1], params[2:] or None), daemon=True).start()
+        
+        elif cmd == "verify":
+            if len(params) < 2:
                 self.onInvalidArguments(player)
-            self.server.loadBackup(params[1])
+                return
+            self.server.tellraw(player, "Verifying backup {}...".format(params[1]), color="gold")
+            Thread(target=self._verify, args=(player, params[1]), daemon=True).start()
         
         else:
             self.onInvalidArguments(player)
     
+    def _verify(self, player: Player, backup_name: str):
+        try:
+            problems = self.server.backups.verify(backup_name)
+        except Exception as e:
+            self.server.tellraw(player, "Failed to verify backup {}: {}".format(backup_name, e), color="red")
+            return
+        if problems:
+            self.server.tellraw(player, "Backup {} is corrupted: \n{}".format(backup_name, "\n".join(problems)), color="red")
+        else:
+            self.server.tellraw(player, "Backup {} is valid.".format(backup_name), color="green")
+
+    def _rollback(self, backup_name: str, patterns: Optional[List[str]]):
+        try:
+            self.server.loadBackup(backup_name, patterns = patterns)
+        except Exception as e:
+            print("Failed to restore backup {}: {}".format(backup_name, e))
+            self.server.say("Failed to restore backup {}: {}".format(backup_name, e))
+
     def help(self) -> str:
         to_show = [
             "Save the world, and make a backup. ", 
-            f"Usage: {self.entry} [now] | [list] | [rollback <backup_name>]"
+            f"Usage: {self.entry} [now] | [status] | [list] | [verify <backup_name>] | [rollback <backup_name> [overworld|nether|end|<path pattern> ...]]"
             "Examples: ",
             f" - {self.entry} now",
+            f" - {self.entry} status",
             f" - {self.entry} list",
-            f" - {self.entry} rollback <backup_name>"
+            f" - {self.entry} verify <backup_name>",
+            f" - {self.entry} rollback <backup_name>",
+            f" - {self.entry} rollback <backup_name> nether",
+            f" - {self.entry} rollback <backup_name> region/r.0.*.mca"
         ]
         return "\n".join(to_show)
\ No newline at end of file
@@ -11,15 +11,14 @@ class CommandTeleportPlayer(PlayerCommandObserver):
             return super().onTriggered(player, args)
 
         name_raw = args[0]
-        name_pool: List[str] = [ p.name for p in self.players.values() if p.status.is_online ]
         dst_name = None
 
-        if name_raw in name_pool:
+        if name_raw in self.online:
             dst_name = name_raw
 
         else:
             # Name infer
-            possible_names = [ n for n in name_pool if n.startswith(name_raw)]
+            possible_names = self.online.withPrefix(name_raw)
 
             if len(possible_names) == 1:
                 dst_name = possible_names[0]
@@ -0,0 +1,338 @@
+"""
+Asyncio based event listener,
+the minecraft server, log reading, observers and scheduled calls all run on one event loop
+(console input is read on a daemon thread, see AsyncServer.scheduleRepeat for repeated calls).
+
+Observers may define their hooks with `async def`, e.g.
+```
+class MyObserver(PlayerObserver):
+    async def onPlayerLogin(self, player: Player):
+        await asyncio.sleep(3)
+        self.server.say(f"Welcome {player.name}")
+```
+synchronous hooks keep working, they are called directly on the event loop thread.
+Events of the same player are handled in order.
+"""
+from __future__ import annotations
+import os, sys, signal, inspect, asyncio
+from asyncio.subprocess import PIPE, STDOUT
+from threading import Thread
+from typing import Any, Callable, Coroutine, Dict, List, Optional
+
+from . import globalVar
+from .configReader import config
+from .listener import EventListener, PARSER_T
+from .listenerBase import EVENT_ALL
+from .observer import DaemonObserver, HOOK_T
+from .server import Server, SCHEDULE_ID, newScheduleID
+
+class AsyncScheduleHandle:
+    """
+    Compatible with ScheduledJob in globalVar.scheduled_threads, can be stopped from any thread
+    """
+    def __init__(self, sid: SCHEDULE_ID, loop: asyncio.AbstractEventLoop) -> None:
+        self.id = sid
+        self.loop = loop
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self.stopped = False
+        globalVar.scheduled_threads[self.id] = self
+
+    def _callLater(self, delay: float, callback: Callable[[], Any]):
+        # on the event loop thread
+        if not self.stopped:
+            self._handle = self.loop.call_later(delay, callback)
+
+    def _cancel(self):
+        if self._handle is not None:
+            self._handle.cancel()
+
+    def stop(self):
+        self._onStop()
+        try:
+            in_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            self._cancel()
+        elif not self.loop.is_closed():
+            # the timer handle is not thread safe, the callback checks self.stopped until it is cancelled
+            self.loop.call_soon_threadsafe(self._cancel)
+
+    def _onStop(self):
+        self.stopped = True
+        if self.id in globalVar.scheduled_threads:
+            del globalVar.scheduled_threads[self.id]
+
+class AsyncServer(Server):
+    """
+    Server running as an asyncio subprocess,
+    the methods can be called from the event loop or from other threads
+    (the synchronous stopMCServer and startMCServer only from other threads).
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        super().__init__(self._sendCommand)
+        self.loop = loop
+        self._aproc: asyncio.subprocess.Process
+        self._pending_cmds: List[str] = []          # commands sent while the server is not running
+        self._lifecycle = asyncio.Lock()            # start and stop, one at a time and in call order
+        self._restart_pending = False
+        self._changed = asyncio.Event()             # set on each start and stop, for nextProcAsync
+
+    @property
+    def proc(self) -> asyncio.subprocess.Process:       # type: ignore
+        if hasattr(self, "_aproc"):
+            return self._aproc
+        else:
+            raise Exception("mc server not started.")
+
+    def _inLoop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def _runSync(self, coro: Coroutine):
+        if self._inLoop():
+            coro.close()
+            raise RuntimeError(
+                "Can not wait synchronously inside the event loop, await the async method instead, "
+                "or call it from another thread."
+            )
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def _sendCommand(self, x: str):
+        if not self._inLoop():
+            self.loop.call_soon_threadsafe(self._sendCommand, x)
+            return
+        if not x.endswith("\n"):
+            x += "\n"
+        if not hasattr(self, "_aproc") or self._aproc.returncode is not None:
+            self._pending_cmds.append(x)
+            return
+        assert self._aproc.stdin is not None
+        self._aproc.stdin.write(x.encode("utf-8"))
+
+    async def startMCServerAsync(self):
+        async with self._lifecycle:
+            self._aproc = await asyncio.create_subprocess_exec(
+                *config()["entry"].split(" "), stdout = PIPE, stdin = PIPE, stderr = STDOUT
+            )
+            self._restart_pending = False
+            self._changed.set()
+            pending, self._pending_cmds = self._pending_cmds, []
+            for x in pending:
+                self._sendCommand(x)
+
+    async def stopMCServerAsync(self, restart: bool = False):
+        """
+         - restart: the server is started again afterwards, the listener waits for it
+        """
+        async with self._lifecycle:
+            self._restart_pending = restart
+            if self.proc.returncode is None:
+                assert self.proc.stdin is not None
+                self.proc.stdin.write(b"stop\n")
+                await self.proc.stdin.drain()
+            await self.proc.wait()
+            self._changed.set()
+            print("Stopped minecraft server.")
+
+    def startMCServer(self):
+        self._runSync(self.startMCServerAsync())
+
+    def stopMCServer(self, restart: bool = False):
+        self._runSync(self.stopMCServerAsync(restart = restart))
+
+    async def nextProcAsync(self, proc: asyncio.subprocess.Process) -> Optional[asyncio.subprocess.Process]:
+        """
+        The process started after proc exited, None if the server is not restarted
+        """
+        while self._aproc is proc:
+            if not self._restart_pending:
+                return None
+            self._changed.clear()
+            await self._changed.wait()
+        return self._aproc
+
+    def loadBackup(self, backup_name: str, patterns: Optional[List[str]] = None):
+        """
+        On the event loop thread, the restore runs in the default executor (it stops and starts the server),
+        return its future
+        """
+        if self._inLoop():
+            return self.loop.run_in_executor(None, super().loadBackup, backup_name, patterns)
+        return super().loadBackup(backup_name, patterns)
+
+    def schedule(self, func: Callable, delay: float, *args, **kwargs) -> SCHEDULE_ID:     # type: ignore
+        """
+        Delay execution of a function with loop.call_later,
+        func may be a coroutine function
+        """
+        job = AsyncScheduleHandle(newScheduleID(), self.loop)
+
+        def _run():
+            if job.stopped:
+                return
+            job._onStop()
+            res = func(*args, **kwargs)
+            if inspect.isawaitable(res):
+                asyncio.ensure_future(res)
+
+        if self._inLoop():
+            job._callLater(delay, _run)
+        else:
+            self.loop.call_soon_threadsafe(job._callLater, delay, _run)
+        return job.id
+
+    def scheduleRepeat(self, func: Callable, interval: float, *args, delay: Optional[float] = None, **kwargs) -> SCHEDULE_ID:   # type: ignore
+        """
+        Unlike schedule, func is called on the thread of the shared scheduler, not on the event loop:
+        the repeated jobs (backup scheduler and verifier) read the disk.
+        A coroutine function is run on the event loop.
+        """
+        def _call():
+            res = func(*args, **kwargs)
+            if inspect.iscoroutine(res):
+                asyncio.run_coroutine_threadsafe(res, self.loop)
+        return Server.scheduleRepeat(_call, interval, delay = delay)
+
+class AsyncDaemonObserver(DaemonObserver):
+    """
+    Daemon callbacks run on the event loop, callbacks may be coroutine functions
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        super().__init__()
+        self.loop = loop
+
+    def start(self):
+        def _tick():
+            for callback in self._callbacks:
+                res = callback()
+                if inspect.isawaitable(res):
+                    asyncio.ensure_future(res)
+            self.loop.call_later(self._ob_interval, _tick)
+        self.loop.call_soon_threadsafe(_tick)
+
+class AsyncEventListener(EventListener):
+    """
+    Drop-in alternative of EventListener: startServer(), register(...), listen()
+    """
+    def __init__(self, parser: PARSER_T = "compiled") -> None:
+        super().__init__(parser = parser)
+        self.loop = asyncio.new_event_loop()
+        # last dispatch task of each player, events of a player wait for the previous one
+        self._tails: Dict[str, asyncio.Task] = {}
+
+    def startServer(self):
+        os.chdir(config()["server_dir"])
+        asyncio.set_event_loop(self.loop)
+
+        self._setServer(AsyncServer(self.loop))
+        self._startServices()
+        self.daemon = AsyncDaemonObserver(self.loop)
+
+    @property
+    def cmd_interface(self) -> Callable[[str], Any]:
+        return self.mc_server.cmd
+
+    def listen(self):
+        try:
+            code = self.loop.run_until_complete(self._main())
+        finally:
+            self.loop.close()
+        exit(code)
+
+    async def _main(self) -> Optional[int]:
+        server = self.mc_server
+        assert isinstance(server, AsyncServer)
+        await server.startMCServerAsync()
+        self.loop.add_signal_handler(signal.SIGINT, lambda: asyncio.ensure_future(self._stop()))
+        self._startJobs()
+        # console input, a blocking read is the only portable way to read stdin
+        Thread(target=self._readInput, daemon=True).start()
+
+        proc: Optional[asyncio.subprocess.Process] = server.proc
+        while proc is not None:
+            assert proc.stdout is not None
+            while True:
+                line = await proc.stdout.readline()
+                if not line:
+                    break
+                self.parse(line.decode("utf-8"))
+            await proc.wait()
+            # stopped for a restart, e.g. restoring a backup
+            proc = await server.nextProcAsync(proc)
+
+        if self._tails:
+            await asyncio.gather(*self._tails.values(), return_exceptions=True)
+        return await server.proc.wait()
+
+    def _readInput(self):
+        while True:
+            line = sys.stdin.readline()
+            if not line:
+                return
+            # thread safe
+            self.mc_server.cmd(line)
+
+    async def _stop(self):
+        print("Stopping gracefully...")
+        try:
+            await self.mc_server.stopMCServerAsync()
+            self._stopWebserver()
+        except Exception as e:
+            print("Error: {}".format(e))
+
+    def emit(self, event: EVENT_ALL):
+        # print to console
+        if self.echo:
+            print(event["log_line"], end="")
+
+        # send to broadcast server
+        if hasattr(self, "_web_proc"):
+            self.event_queue.put(event)
+
+        self.mc_server.queries.feed(event["log_line"])
+        self.mc_server.load.feed(event)
+        self.online.feed(event)
+
+        if "player" not in event:
+            # no observer hooks for these
+            self.dispatch(event)
+            return
+
+        name = event["player"].name
+        task = self.loop.create_task(self._dispatchAfter(event, self._tails.get(name)))
+        self._tails[name] = task
+
+        def _done(t: asyncio.Task):
+            if self._tails.get(name) is t:
+                del self._tails[name]
+        task.add_done_callback(_done)
+
+    async def _dispatchAfter(self, event: EVENT_ALL, prev: Optional[asyncio.Task]):
+        if prev is not None:
+            await asyncio.wait([prev])
+        try:
+            await self.dispatchAsync(event)
+        except Exception as e:
+            self._onDispatchError(event, e)
+
+    async def dispatchAsync(self, event: EVENT_ALL):
+        """
+        Pass the event to the observers as `dispatch` does, awaiting async hooks
+        """
+        steps = self._dispatchSteps(event)
+        try:
+            res = next(steps)
+            while True:
+                if inspect.isawaitable(res):
+                    try:
+                        await res
+                    except Exception as e:
+                        # handled (or not) where the observer was called
+                        res = steps.throw(e)
+                        continue
+                res = steps.send(None)
+        except StopIteration:
+            return
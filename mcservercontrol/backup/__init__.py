@@ -0,0 +1,6 @@
+"""
+World backups, made on a background worker thread
+"""
+from .manager import BackupManager, BackupJob
+
+__all__ = ["BackupManager", "BackupJob"]
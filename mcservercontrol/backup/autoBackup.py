@@ -0,0 +1,94 @@
+"""
+Periodic backups, taken when the server is quiet
+"""
+import os, time
+from typing import TYPE_CHECKING, Optional
+
+from ..configReader import config
+from ..scheduler import SCHEDULE_ID
+
+if TYPE_CHECKING:
+    from .manager import BackupJob, BackupManager
+
+class BackupScheduler:
+    """
+    Every `backup_interval` seconds a backup is due. A due backup starts as soon as the server is empty,
+    or, after waiting `backup_max_delay` seconds for that, as soon as the server keeps up
+    (at the latest after twice that delay).
+    It is skipped if no region file changed since the last backup,
+    and never started while another backup is queued or running.
+    """
+    CHECK_INTERVAL = 60
+
+    def __init__(self, manager: "BackupManager") -> None:
+        self.manager = manager
+        self._sid: Optional[SCHEDULE_ID] = None
+        self._started = time.time()
+        self._skipped: Optional[float] = None       # time of the last backup, when the skip was reported
+
+    def start(self):
+        if config()["backup_interval"] > 0 and self._sid is None:
+            self._sid = self.manager.server.scheduleRepeat(self.tick, self.CHECK_INTERVAL)
+
+    def stop(self):
+        if self._sid is not None:
+            self.manager.server.cancelSchedule(self._sid)
+            self._sid = None
+
+    def lastBackupTime(self) -> Optional[float]:
+        latest = self.manager.catalog.latest
+        return latest["time"] if latest is not None else None
+
+    def dueSince(self) -> Optional[float]:
+        """
+        Time the next backup is due, None if no backup is due yet
+        """
+        last = self.lastBackupTime()
+        if last is None:
+            return self._started
+        due = last + config()["backup_interval"]
+        return due if due <= time.time() else None
+
+    def worldChangedSince(self, t: float) -> bool:
+        """
+        If a chunk was written to disk after t
+        """
+        for root, _, names in os.walk(config()["world_dir"]):
+            for name in names:
+                if not name.endswith(".mca"):
+                    continue
+                try:
+                    if os.stat(os.path.join(root, name)).st_mtime > t:
+                        return True
+                except FileNotFoundError:
+                    ...
+        return False
+
+    def tick(self) -> Optional["BackupJob"]:
+        """
+        Called every CHECK_INTERVAL seconds, return the backup queued if any
+        """
+        manager = self.manager
+        if manager.current is not None or manager.pending is not None or manager.restoring:
+            return None
+        due = self.dueSince()
+        if due is None:
+            return None
+
+        last = self.lastBackupTime()
+        if last is not None and not self.worldChangedSince(last):
+            if self._skipped != last:
+                print("Automatic backup skipped, the world did not change since the last backup")
+                self._skipped = last
+            return None
+
+        load = manager.server.load
+        waited = time.time() - due
+        if not load.empty:
+            # wait for a quieter moment, but not forever
+            if waited < config()["backup_max_delay"]:
+                return None
+            if load.lagging and waited < 2 * config()["backup_max_delay"]:
+                return None
+        print("Automatic backup ({} player(s) online, due {:.0f}s ago)".format(len(load.online), waited))
+        return manager.backup(remove_more_than = config()["max_backup"])
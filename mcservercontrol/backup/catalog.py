@@ -0,0 +1,160 @@
+"""
+Index of the backups of a world, kept in one json file updated atomically,
+so that listing, lookup and retention do not scan the backup directory
+"""
+import os, json, time, tempfile
+from threading import RLock
+from typing import Any, Callable, Dict, List, Optional, TypedDict
+
+class CATALOG_ENTRY_T(TypedDict):
+    name: str
+    path: str                   # of the archive or snapshot manifest, relative to the backup home
+    format: str                 # "zip" | "tar" | "store"
+    codec: Optional[str]
+    time: float                 # time stamp of the backup
+    size: int                   # bytes added to the disk by the backup
+    bytes_in: int               # size of the world
+    files: Optional[int]        # number of files of the world
+    checksum: Optional[str]     # sha256 of the archive or manifest
+    parent: Optional[str]       # name of the backup the unchanged files were taken from (store format)
+    verified: Optional[float]   # time of the last verification
+    valid: Optional[bool]       # result of the last verification
+
+class RETENTION_T(TypedDict, total = False):
+    last: int           # keep the newest backups
+    hourly: int         # keep the newest backup of each of the last hours having a backup
+    daily: int
+    weekly: int
+
+# time buckets of the retention tiers
+_TIERS = [("hourly", "%Y-%m-%d %H"), ("daily", "%Y-%m-%d"), ("weekly", "%G-%V")]
+
+def selectExpired(entries: List[CATALOG_ENTRY_T], policy: RETENTION_T) -> List[str]:
+    """
+    Names of the backups no tier of the policy keeps, in one pass from the newest backup
+    """
+    if not policy:
+        return []
+    kept_last = 0
+    kept = {tier: 0 for tier, _ in _TIERS}
+    last_bucket: Dict[str, Optional[str]] = {tier: None for tier, _ in _TIERS}
+    expired = []
+    for entry in sorted(entries, key = lambda e: (e["time"], e["name"]), reverse = True):
+        keep = False
+        if kept_last < policy.get("last", 0):
+            kept_last += 1
+            keep = True
+        t = time.localtime(entry["time"])
+        for tier, fmt in _TIERS:
+            if kept[tier] >= policy.get(tier, 0):
+                continue
+            bucket = time.strftime(fmt, t)
+            if bucket != last_bucket[tier]:
+                # the newest backup of the bucket
+                last_bucket[tier] = bucket
+                kept[tier] += 1
+                keep = True
+        if not keep:
+            expired.append(entry["name"])
+    return expired
+
+class BackupCatalog:
+    """
+    Safe to use from several threads, the entries returned are copies
+    """
+    VERSION = 1
+
+    def __init__(self, path: str, scan: Callable[[], List[CATALOG_ENTRY_T]]) -> None:
+        """
+         - scan: build the entries from the backup directory, when there is no catalog file yet
+        """
+        self.path = path
+        self._lock = RLock()
+        self._entries: Dict[str, CATALOG_ENTRY_T] = {}
+        self._latest: Optional[str] = None
+        if os.path.exists(path):
+            with open(path, "r") as fp:
+                data = json.load(fp)
+            self._entries = data["backups"]
+            self._latest = data["latest"]
+        else:
+            for entry in scan():
+                self._entries[entry["name"]] = entry
+            if self._entries:
+                self._latest = self.names()[-1]
+            self._save()
+
+    def _save(self):
+        data = {"version": self.VERSION, "latest": self._latest, "backups": self._entries}
+        fd, tmp_path = tempfile.mkstemp(dir = os.path.dirname(self.path), prefix = ".tmp-")
+        try:
+            with os.fdopen(fd, "w") as fp:
+                json.dump(data, fp, indent = 1)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def names(self) -> List[str]:
+        """
+        From the oldest to the newest
+        """
+        with self._lock:
+            return [e["name"] for e in sorted(self._entries.values(), key = lambda e: (e["time"], e["name"]))]
+
+    @property
+    def latest(self) -> Optional[CATALOG_ENTRY_T]:
+        with self._lock:
+            return self._copy(self._latest) if self._latest is not None else None
+
+    def get(self, name: str) -> Optional[CATALOG_ENTRY_T]:
+        """
+        "latest" for the latest backup
+        """
+        with self._lock:
+            if name == "latest" and name not in self._entries:
+                return self.latest
+            return self._copy(name)
+
+    def _copy(self, name: str) -> Optional[CATALOG_ENTRY_T]:
+        entry = self._entries.get(name)
+        return CATALOG_ENTRY_T(**entry) if entry is not None else None
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def entries(self) -> List[CATALOG_ENTRY_T]:
+        with self._lock:
+            return [CATALOG_ENTRY_T(**self._entries[name]) for name in self.names()]
+
+    def add(self, entry: CATALOG_ENTRY_T):
+        """
+        Record a new backup, as the latest one
+        """
+        with self._lock:
+            self._entries[entry["name"]] = entry
+            self._latest = entry["name"]
+            self._save()
+
+    def update(self, name: str, fields: Dict[str, Any]):
+        with self._lock:
+            if name not in self._entries:
+                return
+            self._entries[name].update(fields)      # type: ignore
+            self._save()
+
+    def remove(self, names: List[str]):
+        with self._lock:
+            for name in names:
+                self._entries.pop(name, None)
+            if self._latest not in self._entries:
+                self._latest = self.names()[-1] if self._entries else None
+            self._save()
+
+    def expired(self, policy: RETENTION_T) -> List[str]:
+        """
+        Backups to remove by the retention policy, never the latest one
+        """
+        with self._lock:
+            entries, latest = list(self._entries.values()), self._latest
+        return [name for name in selectExpired(entries, policy) if name != latest]
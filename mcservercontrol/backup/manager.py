@@ -0,0 +1,557 @@
+"""
+Backup jobs, run one at a time by a worker thread so that packing the world never blocks the listener
+"""
+import os, time, queue, shutil, fnmatch, itertools
+from concurrent.futures import Future
+from threading import Lock, Thread
+from typing import TYPE_CHECKING, Dict, List, Literal, Optional, Tuple
+
+from ..configReader import config
+from .writer import ARCHIVE_SUFFIXES, THROTTLE_T, ArchiveWriter, archiveCodec, extractArchive, fileChecksum
+from .catalog import CATALOG_ENTRY_T, RETENTION_T, BackupCatalog
+from .store import SnapshotStore
+from .snapshot import snapshotTree
+from .throttle import RateLimiter, adaptiveRate, lowerPriority
+from .verify import verifyArchive, verifySnapshot
+from .autoBackup import BackupScheduler
+
+if TYPE_CHECKING:
+    from ..server import Server
+
+JOB_STATUS_T = Literal["pending", "saving", "snapshotting", "packing", "done", "failed"]
+
+# files of each dimension in the world directory, for partial restores
+DIMENSIONS: Dict[str, List[str]] = {
+    "overworld": ["region/*", "entities/*", "poi/*"],
+    "nether": ["DIM-1/*"],
+    "end": ["DIM1/*"],
+}
+
+class BackupJob:
+    """
+    A requested backup, the requests made while it is pending join it
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, remove_more_than: Optional[int], save_timeout: float) -> None:
+        self.id = next(self._ids)
+        self.remove_more_than = remove_more_than
+        self.save_timeout = save_timeout
+        self.status: JOB_STATUS_T = "pending"
+        self.requests = 1
+        self.name: Optional[str] = None             # backup name, once packing started
+        self.error: Optional[str] = None
+        self.bytes_total = 0
+        self.bytes_done = 0
+        self.time_requested = time.time()
+        self.time_started: Optional[float] = None
+        self.time_finished: Optional[float] = None
+        self.stats: Dict[str, float] = {}          # of the archive writer
+        self.save_off_seconds: Optional[float] = None
+        self.time_saved: Optional[float] = None       # the time of the world in the backup
+        self.parent: Optional[str] = None
+        self.checksum: Optional[str] = None         # sha256 of the archive or manifest
+        # resolved with the backup name, or fails with the error
+        self.future: "Future[str]" = Future()
+
+    @property
+    def progress(self) -> float:
+        """
+        0 ~ 1, of the bytes packed
+        """
+        if self.status == "done":
+            return 1.
+        if self.bytes_total == 0:
+            return 0.
+        return self.bytes_done / self.bytes_total
+
+    def describe(self) -> str:
+        if self.status == "packing":
+            return "{} ({:.0%} of {:.1f} MB)".format(self.status, self.progress, self.bytes_total / 1e6)
+        if self.status == "done":
+            assert self.time_started is not None and self.time_finished is not None
+            return "done: {} ({:.1f}s, {:.1f} MB/s, saving off for {:.1f}s)".format(
+                self.name, self.time_finished - self.time_started, self.stats.get("mb_per_sec", 0), self.save_off_seconds or 0
+            )
+        if self.status == "failed":
+            return "failed: {}".format(self.error)
+        return self.status
+
+class BackupManager:
+    """
+    Backups of the world of a server.
+    `backup()` only queues a job, the worker thread turns off auto-saving, flushes the world to disk,
+    packs it, and turns auto-saving back on.
+    """
+    PROGRESS_STEP = 0.25        # announce the progress in game at every step
+
+    def __init__(self, server: "Server") -> None:
+        self.server = server
+        self._queue: "queue.SimpleQueue[BackupJob]" = queue.SimpleQueue()
+        self._lock = Lock()
+        # held while backups are read back (verification, restore) and while they are removed (and the store gc-ed),
+        # so that reading never sees the objects of the store being collected
+        self._removal_lock = Lock()
+        # held by a restore from staging to restart, and by the backup worker while it runs a job
+        self._restore_lock = Lock()
+        self._thread: Optional[Thread] = None
+        self.pending: Optional[BackupJob] = None
+        self.current: Optional[BackupJob] = None
+        self.last: Optional[BackupJob] = None
+        self.scheduler = BackupScheduler(self)
+
+    @property
+    def backup_home(self):
+        backup_home = os.path.join(config()["server_dir"], "backups")
+        if not os.path.exists(backup_home):
+            os.mkdir(backup_home)
+        return backup_home
+
+    def backup(self, remove_more_than: Optional[int] = None, save_timeout: float = 10) -> BackupJob:
+        """
+        Queue a backup of the world, or join the one not yet started
+         - remove_more_than: if not None, remove old backups if there are more than this number
+         - save_timeout: seconds to wait for the server to save the world
+        """
+        with self._lock:
+            if self.pending is not None:
+                self.pending.requests += 1
+                return self.pending
+            job = BackupJob(remove_more_than, save_timeout)
+            self.pending = job
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="backup-worker", daemon=True)
+                self._thread.start()
+        self._queue.put(job)
+        return job
+
+    def status(self) -> str:
+        lines = []
+        if self.current is not None:
+            lines.append("Running: " + self.current.describe())
+        if self.pending is not None:
+            lines.append("Queued ({} request(s))".format(self.pending.requests))
+        if self.last is not None:
+            lines.append("Last: " + self.last.describe())
+        if not lines:
+            lines.append("No backup made since start.")
+        return "\n".join(lines)
+
+    @property
+    def restoring(self) -> bool:
+        """
+        If a restore (or a backup) holds the world, background jobs skip their turn
+        """
+        return self._restore_lock.locked()
+
+    def _run(self):
+        # the compressing threads inherit the priority
+        lowerPriority(config()["backup_nice"])
+        while True:
+            job = self._queue.get()
+            # a restore in progress finishes first, the job stays pending meanwhile
+            with self._restore_lock:
+                self._runJob(job)
+
+    def _runJob(self, job: BackupJob):
+        with self._lock:
+            self.pending = None
+            self.current = job
+        job.time_started = time.time()
+        try:
+            name = self._backup(job)
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            job.future.set_exception(e)
+            print("Backup failed: {}".format(e))
+            self.server.say("Backup failed: {}".format(e))
+        else:
+            job.status = "done"
+            job.future.set_result(name)
+        job.time_finished = time.time()
+        with self._lock:
+            self.current = None
+            self.last = job
+
+    @property
+    def store(self) -> SnapshotStore:
+        """
+        Content-addressed store of the "store" backup format, at backups/store
+        """
+        if not hasattr(self, "_store"):
+            self._store = SnapshotStore(
+                os.path.join(self.backup_home, "store"), config()["backup_codec"], config()["backup_level"], config()["backup_workers"]
+            )
+        return self._store
+
+    def _backup(self, job: BackupJob) -> str:
+        world_dir = config()["world_dir"]
+        if not os.path.exists(world_dir):
+            raise FileNotFoundError("world (name:{}) not exists".format(config()["world_name"]))
+
+        for f in os.listdir(self.backup_home):
+            if f.startswith(".snapshot-"):
+                # left by an interrupted backup
+                shutil.rmtree(os.path.join(self.backup_home, f), ignore_errors = True)
+        snapshot_dir = os.path.join(self.backup_home, ".snapshot-{}".format(job.id)) if config()["backup_snapshot"] else None
+
+        try:
+            job.status = "saving"
+            # keep the server from writing the world while it is copied (or packed)
+            self.server.cmd("/save-off")
+            t_save_off = time.monotonic()
+            try:
+                try:
+                    self.server.query("/save-all flush", timeout = job.save_timeout).result()
+                except TimeoutError:
+                    raise TimeoutError("saving timeout ({}s)".format(job.save_timeout))
+
+                job.time_saved = time.time()
+                job.name = time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime(job.time_saved))
+                if job.name in self.catalog:
+                    # two backups within a second
+                    job.name += "_{}".format(job.id)
+                if snapshot_dir is None:
+                    new_backup_file = self._pack(job, world_dir)
+                else:
+                    job.status = "snapshotting"
+                    snapshot_stats = snapshotTree(world_dir, snapshot_dir)
+                    print("Snapshot of the world in {:.1f}s: {} hardlinked, {} reflinked, {} copied".format(
+                        snapshot_stats["seconds"], snapshot_stats["hardlinked"], snapshot_stats["reflinked"], snapshot_stats["copied"]
+                    ))
+            finally:
+                self.server.cmd("/save-on")
+                job.save_off_seconds = time.monotonic() - t_save_off
+                print("Saving was off for {:.1f}s".format(job.save_off_seconds))
+
+            if snapshot_dir is not None:
+                new_backup_file = self._pack(job, snapshot_dir)
+        finally:
+            if snapshot_dir is not None and os.path.exists(snapshot_dir):
+                shutil.rmtree(snapshot_dir, ignore_errors = True)
+        print("Backup {}: {:.1f} MB -> {:.1f} MB in {:.1f}s ({:.1f} MB/s, {} {})".format(
+            job.name, job.stats["bytes_in"] / 1e6, job.stats["bytes_out"] / 1e6, job.stats["seconds"],
+            job.stats["mb_per_sec"], config()["backup_format"], config()["backup_codec"]
+        ))
+
+        fmt = config()["backup_format"]
+        self.catalog.add({
+            "name": job.name,
+            "path": os.path.relpath(new_backup_file, self.backup_home),
+            "format": fmt,
+            "codec": config()["backup_codec"],
+            "time": job.time_saved,
+            "size": int(job.stats["bytes_out"]) if fmt == "store" else os.path.getsize(new_backup_file),
+            "bytes_in": int(job.stats["bytes_in"]),
+            "files": int(job.stats["files"]),
+            "checksum": job.checksum,
+            "parent": job.parent,
+            "verified": None,
+            "valid": None,
+        })
+        self._linkLatest(new_backup_file)
+        self._applyRetention(job.remove_more_than)
+
+        self.server.say("Saved to: {}".format(job.name))
+        return job.name
+
+    def _pack(self, job: BackupJob, src_dir: str) -> str:
+        """
+        Write the backup of the world in src_dir, return its path
+        """
+        fmt = config()["backup_format"]
+        job.status = "packing"
+        next_step = self.PROGRESS_STEP
+
+        def _onProgress(done: int, total: int):
+            nonlocal next_step
+            job.bytes_done, job.bytes_total = done, total
+            if total and done / total >= next_step and done < total:
+                self.server.say("Backup {:.0%}...".format(done / total))
+                while next_step <= done / total:
+                    next_step += self.PROGRESS_STEP
+
+        limiter = RateLimiter(adaptiveRate(self.server.load, config()["backup_rate_limit"]))
+        throttle = limiter if config()["backup_rate_limit"] > 0 else None
+
+        assert job.name is not None
+        if fmt == "store":
+            store = self.store
+            # files unchanged since the newest snapshot are not read again
+            snapshots = [e["name"] for e in self.catalog.entries() if e["format"] == "store"]
+            job.parent = snapshots[-1] if snapshots else None
+            job.stats = store.snapshot(
+                src_dir, self._storeKey(job.name), parent = self._storeKey(job.parent) if job.parent else None,
+                on_progress = _onProgress, throttle = throttle
+            )
+            job.stats["throttled_seconds"] = limiter.waited
+            job.checksum = fileChecksum(store.manifestPath(self._storeKey(job.name)))
+            return store.manifestPath(self._storeKey(job.name))
+
+        writer = ArchiveWriter(fmt, config()["backup_codec"], config()["backup_level"], config()["backup_workers"])
+        new_backup_file = os.path.join(self.backup_home, f"{config()['world_name']}_{job.name}{writer.suffix}")
+        # not listed as a backup until it is complete
+        job.stats = writer.write(src_dir, new_backup_file + ".part", _onProgress, throttle = throttle)
+        job.stats["throttled_seconds"] = limiter.waited
+        # computed while writing, the archive is not read again
+        job.checksum = writer.checksum
+        os.replace(new_backup_file + ".part", new_backup_file)
+        return new_backup_file
+
+    @property
+    def catalog(self) -> BackupCatalog:
+        """
+        Backups of the world, at backups/<world>_catalog.json
+        """
+        if not hasattr(self, "_catalog"):
+            self._catalog = BackupCatalog(os.path.join(self.backup_home, f"{config()['world_name']}_catalog.json"), self._scan)
+        return self._catalog
+
+    @staticmethod
+    def _storeKey(name: str) -> str:
+        return f"{config()['world_name']}_{name}"
+
+    def _applyRetention(self, remove_more_than: Optional[int]):
+        """
+        Remove the backups expired by the `backup_retention` policy,
+        and those beyond the newest `remove_more_than` ones unless the policy keeps them
+        """
+        policy: RETENTION_T = dict(config()["backup_retention"] or {})      # type: ignore
+        if remove_more_than:
+            policy.setdefault("last", remove_more_than)
+        expired = self.catalog.expired(policy)
+        if not expired:
+            return
+        print("removing old backups: {}".format(", ".join(expired)))
+        with self._removal_lock:
+            self._remove(expired)
+
+    def _remove(self, expired: List[str]):
+        has_snapshot = False
+        for name in expired:
+            entry = self.catalog.get(name)
+            assert entry is not None
+            try:
+                if entry["format"] == "store":
+                    has_snapshot = True
+                    self.store.delete(self._storeKey(name))
+                else:
+                    os.remove(os.path.join(self.backup_home, entry["path"]))
+            except FileNotFoundError:
+                # removed by hand
+                ...
+        self.catalog.remove(expired)
+        if has_snapshot:
+            n_objects, n_bytes = self.store.gc()
+            if n_objects:
+                print("removed {} unreferenced object(s), {:.1f} MB".format(n_objects, n_bytes / 1e6))
+
+    def _linkLatest(self, backup_file: str):
+        """
+        Make `<world>_latest` a link of the backup, in place of the previous one of whatever format.
+        Only for the convenience of other tools, backups are looked up in the catalog.
+        """
+        try:
+            for path in self._latestLinks():
+                os.remove(path)
+            suffix = next(s for s in [".json"] + ARCHIVE_SUFFIXES if backup_file.endswith(s))
+            os.symlink(backup_file, os.path.join(os.path.dirname(backup_file), f"{config()['world_name']}_latest{suffix}"))
+        except OSError as e:
+            print("Failed to link the latest backup: {}".format(e))
+
+    def _latestLinks(self) -> List[str]:
+        candidates = [os.path.join(self.backup_home, f"{config()['world_name']}_latest{s}") for s in ARCHIVE_SUFFIXES]
+        candidates.append(self.store.manifestPath(f"{config()['world_name']}_latest"))
+        return [path for path in candidates if os.path.lexists(path)]
+
+    def _scan(self) -> List[CATALOG_ENTRY_T]:
+        """
+        Catalog entries of the backups found in the backup directory, for the backups made before the catalog
+        """
+        prefix = config()["world_name"] + "_"
+
+        def _time(name: str, path: str) -> float:
+            try:
+                return time.mktime(time.strptime(name[:19], '%Y-%m-%d_%H-%M-%S'))
+            except ValueError:
+                return os.path.getmtime(path)
+
+        entries: List[CATALOG_ENTRY_T] = []
+        for f in os.listdir(self.backup_home):
+            suffix = next((s for s in ARCHIVE_SUFFIXES if f.endswith(s)), None)
+            if not f.startswith(prefix) or suffix is None or f == prefix + "latest" + suffix:
+                continue
+            path = os.path.join(self.backup_home, f)
+            name = f[len(prefix):-len(suffix)]
+            codec = archiveCodec(path)
+            entries.append({
+                "name": name, "path": f, "format": "zip" if codec is None else "tar", "codec": None if codec is None else codec.name,
+                "time": _time(name, path), "size": os.path.getsize(path), "bytes_in": 0, "files": None, "checksum": None, "parent": None,
+                "verified": None, "valid": None,
+            })
+        for key in self.store.keys():
+            if not key.startswith(prefix) or key == prefix + "latest":
+                continue
+            manifest = self.store.manifest(key)
+            parent = manifest["parent"]
+            entries.append({
+                "name": key[len(prefix):], "path": os.path.relpath(self.store.manifestPath(key), self.backup_home),
+                "format": "store", "codec": None, "time": manifest["time"], "size": 0,
+                "bytes_in": sum(e["size"] for e in manifest["files"].values()), "files": len(manifest["files"]),
+                "checksum": None, "parent": parent[len(prefix):] if parent else None,
+                "verified": None, "valid": None,
+            })
+        return entries
+
+    def listBackups(self) -> List[str]:
+        names = self.catalog.names()
+        if names:
+            names.append("latest")
+        return names
+
+    def verify(self, backup_name: str, throttle: Optional[THROTTLE_T] = None) -> List[str]:
+        """
+        Read the backup back and check it against the checksums recorded when it was made,
+        the result is recorded in the catalog, backups are not removed meanwhile
+        return the problems found, empty if the backup is valid
+        """
+        with self._removal_lock:
+            return self._verify(backup_name, throttle)
+
+    def _verify(self, backup_name: str, throttle: Optional[THROTTLE_T]) -> List[str]:
+        entry = self.catalog.get(backup_name)
+        if entry is None:
+            raise FileNotFoundError("Backup file not found")
+        t_start = time.monotonic()
+        if entry["format"] == "store":
+            problems, checksum = verifySnapshot(self.store, self._storeKey(entry["name"]), throttle)
+        else:
+            problems, checksum = verifyArchive(os.path.join(self.backup_home, entry["path"]), throttle)
+        if checksum is not None and entry["checksum"] is not None and checksum != entry["checksum"]:
+            problems.append("checksum mismatch: {}".format(entry["path"]))
+        self.catalog.update(entry["name"], {"verified": time.time(), "valid": not problems})
+        print("Verified backup {} in {:.1f}s: {}".format(
+            entry["name"], time.monotonic() - t_start, "; ".join(problems) if problems else "ok"
+        ))
+        return problems
+
+    def startVerifier(self):
+        """
+        Verify a backup every `backup_verify_interval` seconds, when the server is idle
+        """
+        interval = config()["backup_verify_interval"]
+        if interval > 0 and not hasattr(self, "_verifier"):
+            self._verifier = self.server.scheduleRepeat(self._verifyIdle, interval)
+
+    def _verifyIdle(self):
+        """
+        Start verifying the backup verified the longest ago (never verified first)
+        """
+        if self.current is not None or self.pending is not None or self.restoring or not self.server.load.empty:
+            return
+        if hasattr(self, "_verify_thread") and self._verify_thread.is_alive():
+            return
+        entries = self.catalog.entries()
+        if not entries:
+            return
+        entry = min(entries, key = lambda e: e.get("verified") or 0)
+        limiter = RateLimiter(lambda: config()["backup_verify_rate"])
+
+        def _verify():
+            lowerPriority(config()["backup_nice"])
+            try:
+                problems = self.verify(entry["name"], limiter)
+            except Exception as e:
+                print("Failed to verify backup {}: {}".format(entry["name"], e))
+                return
+            if problems and entry["name"] in self.catalog:
+                self.server.say("Backup {} is corrupted: {}".format(entry["name"], "; ".join(problems[:3])))
+
+        self._verify_thread = Thread(target = _verify, name = "backup-verifier", daemon = True)
+        self._verify_thread.start()
+
+    def loadBackup(self, backup_name: str, patterns: Optional[List[str]] = None):
+        """
+        Restore the world from a backup.
+        The backup is extracted to a staging directory while the server is running,
+        the server is then stopped only for the time to swap the directories.
+        If the swap or the restart fails, the previous world is put back.
+        One restore at a time, never while a backup is running.
+         - patterns: restore only these files of the world, glob patterns of paths relative to the world directory,
+            or names of DIMENSIONS; None for the whole world
+        """
+        entry = self.catalog.get(backup_name)
+        if entry is None:
+            raise FileNotFoundError("Backup file not found")
+        if self.server.attached:
+            raise RuntimeError("Can not restore in attach mode, the server is not started by this program")
+        if not self._restore_lock.acquire(blocking = False):
+            raise RuntimeError("A backup or restore is running, try again later")
+        try:
+            self._restore(entry, patterns)
+        finally:
+            self._restore_lock.release()
+
+    def _restore(self, entry: CATALOG_ENTRY_T, patterns: Optional[List[str]]):
+        backup_name = entry["name"]
+        backup_file = os.path.join(self.backup_home, entry["path"])
+
+        world_dir = config()['world_dir']
+        staging_dir = world_dir + ".restore-staging"
+        old_dir = world_dir + ".restore-old"
+        for d in (staging_dir, old_dir):
+            if os.path.exists(d):
+                shutil.rmtree(d)
+
+        include = None
+        if patterns:
+            globs = [g for p in patterns for g in DIMENSIONS.get(p, [p])]
+            include = lambda path: any(fnmatch.fnmatchcase(path.replace(os.sep, "/"), g) for g in globs)
+
+        t_start = time.monotonic()
+        if entry["format"] == "store":
+            with self._removal_lock:
+                n_files = self.store.restore(self._storeKey(entry["name"]), staging_dir, include)
+        else:
+            n_files = extractArchive(backup_file, staging_dir, include, config()["backup_workers"])
+        if n_files == 0:
+            shutil.rmtree(staging_dir, ignore_errors = True)
+            raise FileNotFoundError("No file of the backup matches: {}".format(patterns))
+        print("Extracted {} file(s) of backup {} in {:.1f}s".format(n_files, backup_name, time.monotonic() - t_start))
+
+        t_stop = time.monotonic()
+        self.server.stopMCServer(restart = True)
+        moved: List[Tuple[str, str]] = []       # renames done, undone in reverse order on failure
+
+        def _move(src: str, dst: str):
+            os.makedirs(os.path.dirname(dst), exist_ok = True)
+            os.rename(src, dst)
+            moved.append((src, dst))
+
+        try:
+            if include is None:
+                _move(world_dir, old_dir)
+                _move(staging_dir, world_dir)
+            else:
+                # the files of the dimension not in the backup are removed as well
+                for rel_path in _relFiles(world_dir):
+                    if include(rel_path):
+                        _move(os.path.join(world_dir, rel_path), os.path.join(old_dir, rel_path))
+                for rel_path in _relFiles(staging_dir):
+                    _move(os.path.join(staging_dir, rel_path), os.path.join(world_dir, rel_path))
+            self.server.startMCServer()
+        except Exception as e:
+            print("Restore failed ({}), rolling back...".format(e))
+            for src, dst in reversed(moved):
+                os.makedirs(os.path.dirname(src), exist_ok = True)
+                os.rename(dst, src)
+            self.server.startMCServer()
+            raise
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors = True)
+        print("Restored backup {} to {}, server down for {:.1f}s".format(backup_name, world_dir, time.monotonic() - t_stop))
+        shutil.rmtree(old_dir, ignore_errors = True)
+
+def _relFiles(directory: str) -> List[str]:
+    return [os.path.relpath(path, directory) for path, _ in ArchiveWriter.listFiles(directory)]
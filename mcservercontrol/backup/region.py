@@ -0,0 +1,59 @@
+"""
+Anvil region files (.mca): an 8 KB header and the chunks in 4 KB sectors.
+The header is 1024 locations (3 bytes sector offset, 1 byte sector count) followed by 1024 timestamps (4 bytes),
+a chunk is a 4 bytes length, 1 byte compression type and the compressed payload.
+"""
+import struct
+from typing import Iterable, List, NamedTuple, Optional
+
+SECTOR = 4096
+N_CHUNKS = 1024
+HEADER_SIZE = 2 * SECTOR
+
+class RegionChunk(NamedTuple):
+    index: int              # x + z * 32 in the region
+    offset: int             # in sectors
+    sectors: int
+    timestamp: int
+    data: bytes             # length, compression type and payload, as in the file
+
+def parseRegion(data: bytes) -> Optional[List[RegionChunk]]:
+    """
+    The chunks of the region, None if the data is not a well-formed region file
+    """
+    if len(data) < HEADER_SIZE or len(data) % SECTOR != 0:
+        return None
+    locations = struct.unpack_from(">1024I", data, 0)
+    timestamps = struct.unpack_from(">1024I", data, SECTOR)
+    chunks = []
+    for index, location in enumerate(locations):
+        if location == 0:
+            continue
+        offset, sectors = location >> 8, location & 0xFF
+        start = offset * SECTOR
+        if offset < 2 or sectors == 0 or start + 5 > len(data):
+            return None
+        length, = struct.unpack_from(">I", data, start)
+        if length == 0 or 4 + length > sectors * SECTOR or start + 4 + length > len(data):
+            return None
+        chunks.append(RegionChunk(index, offset, sectors, timestamps[index], data[start: start + 4 + length]))
+    return chunks
+
+def buildRegion(chunks: Iterable[RegionChunk], size: int) -> bytes:
+    """
+    Region file of the chunks at their sectors, the sectors not used by any chunk are zeroed
+     - size: of the file, at least the end of the last chunk
+    """
+    chunks = list(chunks)
+    end = max([HEADER_SIZE] + [(c.offset + c.sectors) * SECTOR for c in chunks])
+    buf = bytearray(max(size, end))
+    locations = [0] * N_CHUNKS
+    timestamps = [0] * N_CHUNKS
+    for c in chunks:
+        locations[c.index] = (c.offset << 8) | c.sectors
+        timestamps[c.index] = c.timestamp
+        start = c.offset * SECTOR
+        buf[start: start + len(c.data)] = c.data
+    struct.pack_into(">1024I", buf, 0, *locations)
+    struct.pack_into(">1024I", buf, SECTOR, *timestamps)
+    return bytes(buf)
@@ -0,0 +1,70 @@
+"""
+Point-in-time copy of the world directory, made while saving is off so that the world can be packed afterwards.
+Files the server replaces on write (writes a new file then renames it) are hardlinked,
+the other files are reflinked where the filesystem supports it (btrfs, xfs...), copied otherwise.
+"""
+import os, sys, time, shutil, fnmatch
+from typing import Dict
+
+# files written to a temporary file then renamed over the old one, a hardlink keeps the old content
+REPLACED_ON_WRITE = ["level.dat", "level.dat_old", "playerdata/*.dat", "playerdata/*.dat_old"]
+
+_FICLONE = 0x40049409
+
+def reflink(src: str, dst: str) -> bool:
+    """
+    Copy-on-write clone of the file, return False if not supported
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            ok = False
+        else:
+            ok = True
+    if not ok:
+        os.remove(dst)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+def snapshotTree(src_dir: str, dst_dir: str) -> Dict[str, float]:
+    """
+    return stats: number of files hardlinked, reflinked, copied, and seconds
+    """
+    t_start = time.monotonic()
+    n = {"hardlinked": 0, "reflinked": 0, "copied": 0}
+    can_reflink = True
+    for root, _, names in os.walk(src_dir):
+        dst_root = os.path.join(dst_dir, os.path.relpath(root, src_dir))
+        os.makedirs(dst_root, exist_ok=True)
+        for name in names:
+            src = os.path.join(root, name)
+            dst = os.path.join(dst_root, name)
+            rel_path = os.path.relpath(src, src_dir).replace(os.sep, "/")
+            try:
+                if any(fnmatch.fnmatchcase(rel_path, p) for p in REPLACED_ON_WRITE):
+                    try:
+                        os.link(src, dst)
+                        n["hardlinked"] += 1
+                        continue
+                    except OSError:
+                        # e.g. another filesystem
+                        ...
+                if can_reflink:
+                    if reflink(src, dst):
+                        n["reflinked"] += 1
+                        continue
+                    # not supported by the filesystem, do not try for every file
+                    can_reflink = False
+                shutil.copy2(src, dst)
+                n["copied"] += 1
+            except FileNotFoundError:
+                # removed in the meantime
+                ...
+    stats: Dict[str, float] = dict(n)
+    stats["seconds"] = time.monotonic() - t_start
+    return stats
@@ -0,0 +1,288 @@
+"""
+Content-addressed backup store, each file content is kept once whatever the number of snapshots referring to it.
+    store/objects/<sha256[:2]>/<sha256><codec suffix>      compressed file contents
+    store/snapshots/<key>.json                              manifest of a snapshot: path -> size, mtime, hash
+Region files are stored chunk by chunk, a chunk not modified since the parent snapshot is not stored again.
+"""
+import os, json, time, hashlib, tempfile
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypedDict
+
+from .writer import CODECS, PROGRESS_CB_T, THROTTLE_T, ArchiveWriter, Codec, getCodec
+from .region import RegionChunk, buildRegion, parseRegion
+
+# [index, offset, sectors, timestamp, hash, length] of a chunk of a region file
+CHUNK_ENTRY_T = List[Any]
+
+class FILE_ENTRY_T(TypedDict, total=False):
+    size: int
+    mtime_ns: int
+    hash: str                       # object of the content, of plain files
+    chunks: List[CHUNK_ENTRY_T]     # objects of the chunks, of region files
+
+def entryObjects(entry: FILE_ENTRY_T) -> List[str]:
+    """
+    Hashes of the objects the file is made of
+    """
+    if "chunks" in entry:
+        return [c[4] for c in entry["chunks"]]
+    return [entry["hash"]]
+
+class MANIFEST_T(TypedDict):
+    key: str
+    time: float
+    parent: Optional[str]       # key of the snapshot the unchanged files were taken from
+    files: Dict[str, FILE_ENTRY_T]
+
+def _writeAtomic(path: str, data: bytes):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+class SnapshotStore:
+    """
+    Snapshots of directories, files unchanged since the parent snapshot (same size and mtime) are not read again,
+    the contents already in the store are not written again.
+    """
+    def __init__(self, root: str, codec: str = "deflate", level: Optional[int] = None, workers: int = 0) -> None:
+        """
+         - codec, level: compression of the new objects
+         - workers: threads hashing and compressing files, 0 for the number of cores
+        """
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.snapshots_dir = os.path.join(root, "snapshots")
+        for d in (self.objects_dir, self.snapshots_dir):
+            if not os.path.exists(d):
+                os.makedirs(d)
+        self.codec = getCodec(codec)
+        self.level = self.codec.default_level if level is None else level
+        self.workers = workers or os.cpu_count() or 1
+        self._lock = Lock()
+        self._objects: Optional[Dict[str, str]] = None          # hash -> object file name
+
+    # ---------------- objects ----------------
+
+    def _objectIndex(self) -> Dict[str, str]:
+        if self._objects is None:
+            objects = {}
+            for sub in os.listdir(self.objects_dir):
+                sub_dir = os.path.join(self.objects_dir, sub)
+                if not os.path.isdir(sub_dir):
+                    continue
+                for f in os.listdir(sub_dir):
+                    if not f.startswith(".tmp-"):
+                        objects[f[:64]] = f
+            self._objects = objects
+        return self._objects
+
+    def _objectPath(self, digest: str, file_name: Optional[str] = None) -> str:
+        if file_name is None:
+            file_name = self._objectIndex()[digest]
+        return os.path.join(self.objects_dir, digest[:2], file_name)
+
+    @staticmethod
+    def _objectCodec(file_name: str) -> Codec:
+        suffix = file_name[64:]
+        for codec in CODECS.values():
+            if codec.suffix == suffix:
+                return codec
+        raise ValueError("Unknown object: {}".format(file_name))
+
+    def hasObject(self, digest: str) -> bool:
+        return digest in self._objectIndex()
+
+    def putObject(self, data: bytes, digest: Optional[str] = None) -> Tuple[str, int]:
+        """
+        return (hash, bytes written), nothing is written if the content is in the store already
+        """
+        if digest is None:
+            digest = hashlib.sha256(data).hexdigest()
+        if self.hasObject(digest):
+            return digest, 0
+        compressed = self.codec.compress(data, self.level)
+        file_name = digest + self.codec.suffix
+        sub_dir = os.path.join(self.objects_dir, digest[:2])
+        os.makedirs(sub_dir, exist_ok=True)
+        _writeAtomic(os.path.join(sub_dir, file_name), compressed)
+        with self._lock:
+            self._objectIndex()[digest] = file_name
+        return digest, len(compressed)
+
+    def getObject(self, digest: str) -> bytes:
+        file_name = self._objectIndex()[digest]
+        with self._objectCodec(file_name).open_read(self._objectPath(digest, file_name)) as fp:
+            return fp.read()
+
+    # ---------------- snapshots ----------------
+
+    def manifestPath(self, key: str) -> str:
+        return os.path.join(self.snapshots_dir, key + ".json")
+
+    def keys(self) -> List[str]:
+        return sorted(f[:-5] for f in os.listdir(self.snapshots_dir) if f.endswith(".json"))
+
+    def manifest(self, key: str) -> MANIFEST_T:
+        with open(self.manifestPath(key), "r") as fp:
+            return json.load(fp)
+
+    def snapshot(
+            self, directory: str, key: str, parent: Optional[str] = None,
+            on_progress: PROGRESS_CB_T = lambda done, total: None, throttle: Optional[THROTTLE_T] = None
+            ) -> Dict[str, float]:
+        """
+        Record the directory as snapshot `key`
+         - parent: key of a previous snapshot of the directory
+         - throttle: called by the worker threads before reading a file, e.g. throttle.RateLimiter
+        return stats: bytes in, bytes out (new objects), files reused, seconds and MB/s
+        """
+        t_start = time.monotonic()
+        parent_files: Dict[str, FILE_ENTRY_T] = {}
+        if parent is not None:
+            parent_files = self.manifest(parent)["files"]
+
+        self._objectIndex()
+        files = ArchiveWriter.listFiles(directory)
+        total = sum(size for _, size in files)
+        on_progress(0, total)
+
+        entries: Dict[str, FILE_ENTRY_T] = {}
+        changed: List[Tuple[str, str, os.stat_result]] = []
+        reused_bytes = 0
+        for file_path, _ in files:
+            rel_path = os.path.relpath(file_path, directory)
+            try:
+                st = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            old = parent_files.get(rel_path)
+            if old is not None and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns \
+                    and all(self.hasObject(h) for h in entryObjects(old)):
+                entries[rel_path] = old
+                reused_bytes += st.st_size
+            else:
+                changed.append((rel_path, file_path, st))
+
+        n_chunks = [0, 0]           # reused, stored
+
+        def _store(item: Tuple[str, str, os.stat_result]) -> Tuple[str, FILE_ENTRY_T, int]:
+            rel_path, file_path, st = item
+            if throttle is not None:
+                throttle(st.st_size)
+            with open(file_path, "rb") as fp:
+                data = fp.read()
+            chunks = parseRegion(data) if rel_path.endswith(".mca") else None
+            if chunks is None:
+                digest, written = self.putObject(data)
+                return rel_path, {"size": len(data), "mtime_ns": st.st_mtime_ns, "hash": digest}, written
+
+            # a chunk is reused if its payload is the one in the parent snapshot, by hash:
+            # the timestamp (in seconds) and the length stay the same when a chunk is saved twice within a second
+            old_chunks = {c[0]: c for c in parent_files.get(rel_path, {}).get("chunks", [])}
+            entries, written = [], 0
+            for c in chunks:
+                old = old_chunks.get(c.index)
+                digest = hashlib.sha256(c.data).hexdigest()
+                if old is not None and old[4] == digest and self.hasObject(digest):
+                    n_chunks[0] += 1
+                else:
+                    digest, n = self.putObject(c.data, digest)
+                    written += n
+                    n_chunks[1] += 1
+                entries.append([c.index, c.offset, c.sectors, c.timestamp, digest, len(c.data)])
+            return rel_path, {"size": len(data), "mtime_ns": st.st_mtime_ns, "chunks": entries}, written
+
+        done = reused_bytes
+        bytes_out = 0
+        on_progress(done, total)
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="backup-store") as pool:
+            for rel_path, entry, written in pool.map(_store, changed):
+                entries[rel_path] = entry
+                bytes_out += written
+                done += entry["size"]
+                on_progress(min(done, total), total)
+
+        manifest: MANIFEST_T = {"key": key, "time": time.time(), "parent": parent, "files": entries}
+        _writeAtomic(self.manifestPath(key), json.dumps(manifest, indent=1).encode("utf-8"))
+
+        elapsed = max(time.monotonic() - t_start, 1e-6)
+        return {
+            "files": len(entries),
+            "bytes_in": total,
+            "bytes_out": bytes_out,
+            "files_reused": len(entries) - len(changed),
+            "chunks_reused": n_chunks[0],
+            "chunks_stored": n_chunks[1],
+            "seconds": elapsed,
+            "mb_per_sec": total / elapsed / 1e6,
+        }
+
+    def restore(self, key: str, directory: str, include: Optional[Callable[[str], bool]] = None) -> int:
+        """
+        Write the files of the snapshot to the directory
+         - include: called with the path of each file, restore only those it returns True for
+        return the number of files restored
+        """
+        files = self.manifest(key)["files"]
+        if include is not None:
+            files = {rel_path: entry for rel_path, entry in files.items() if include(rel_path)}
+
+        def _restore(item: Tuple[str, FILE_ENTRY_T]):
+            rel_path, entry = item
+            file_path = os.path.join(directory, rel_path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "wb") as fp:
+                if "chunks" in entry:
+                    fp.write(buildRegion(
+                        (RegionChunk(c[0], c[1], c[2], c[3], self.getObject(c[4])) for c in entry["chunks"]), entry["size"]
+                    ))
+                else:
+                    fp.write(self.getObject(entry["hash"]))
+            # unchanged files of the next snapshot are recognised by their mtime
+            os.utime(file_path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+
+        os.makedirs(directory, exist_ok=True)
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="backup-restore") as pool:
+            for _ in pool.map(_restore, files.items()):
+                ...
+        return len(files)
+
+    def delete(self, key: str):
+        """
+        Remove the snapshot, its objects are removed by gc()
+        """
+        os.remove(self.manifestPath(key))
+
+    def gc(self) -> Tuple[int, int]:
+        """
+        Remove the objects no snapshot refers to
+        return (number of objects, bytes) removed
+        """
+        referenced = set()
+        for key in self.keys():
+            for entry in self.manifest(key)["files"].values():
+                referenced.update(entryObjects(entry))
+        n_removed, bytes_removed = 0, 0
+        with self._lock:
+            self._objects = None
+            for digest, file_name in list(self._objectIndex().items()):
+                if digest in referenced:
+                    continue
+                path = self._objectPath(digest, file_name)
+                bytes_removed += os.path.getsize(path)
+                os.remove(path)
+                del self._objectIndex()[digest]
+                n_removed += 1
+        return n_removed, bytes_removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "snapshots": len(self.keys()),
+            "objects": len(self._objectIndex()),
+        }
@@ -0,0 +1,92 @@
+"""
+Keep backups from competing with the minecraft server for disk and CPU
+"""
+import os, sys, time, ctypes, ctypes.util, platform, threading
+from threading import Lock
+from typing import Callable, Optional
+
+from ..serverLoad import ServerLoad
+
+class RateLimiter:
+    """
+    Token bucket, `consume(n)` blocks until n bytes are allowed.
+    The rate is read at every call, so that it can follow the load of the server.
+    Shared by the threads of a backup.
+    """
+    def __init__(self, rate_getter: Callable[[], float], burst: float = 1.) -> None:
+        """
+         - rate_getter: bytes/sec, 0 for unlimited
+         - burst: seconds of the rate that can be consumed at once
+        """
+        self._rate_getter = rate_getter
+        self.burst = burst
+        self._lock = Lock()
+        self._tokens = 0.
+        self._last = time.monotonic()
+        self.waited = 0.                # seconds spent waiting, in all threads
+
+    def consume(self, n: int):
+        with self._lock:
+            while True:
+                rate = self._rate_getter()
+                now = time.monotonic()
+                if rate <= 0:
+                    self._tokens, self._last = 0., now
+                    return
+                self._tokens = min(self._tokens + (now - self._last) * rate, rate * self.burst)
+                self._last = now
+                if self._tokens >= 0:
+                    # may go into debt for large reads, paid back by the next calls
+                    self._tokens -= n
+                    return
+                wait = min(-self._tokens / rate, 1.)
+                self.waited += wait
+                time.sleep(wait)
+
+    __call__ = consume
+
+def adaptiveRate(load: ServerLoad, rate: float) -> Callable[[], float]:
+    """
+    - rate: bytes/sec while players are online, 0 for unlimited
+    return the rate getter of RateLimiter: a quarter of the rate while the server can not keep up,
+        unlimited while the server is empty
+    """
+    def _rate() -> float:
+        if rate <= 0:
+            return 0
+        if load.lagging:
+            return rate / 4
+        if load.empty:
+            return 0
+        return rate
+    return _rate
+
+# ioprio_set syscall numbers
+_SYS_IOPRIO_SET = {"x86_64": 251, "i386": 289, "i686": 289, "aarch64": 30, "armv7l": 314}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_BE = 2
+_IOPRIO_CLASS_SHIFT = 13
+
+def lowerPriority(nice: int, tid: Optional[int] = None) -> bool:
+    """
+    Lower the CPU and IO priority of a thread (of the calling thread by default),
+    the threads it creates afterwards inherit them (linux).
+     - nice: 1 ~ 19, the IO priority is set to the matching best-effort level
+    return False if not supported
+    """
+    if nice <= 0 or not sys.platform.startswith("linux"):
+        return False
+    if tid is None:
+        tid = threading.get_native_id()
+    try:
+        os.setpriority(os.PRIO_PROCESS, tid, min(nice, 19))
+    except OSError as e:
+        print("Failed to lower the CPU priority of the backup: {}".format(e))
+        return False
+    nr = _SYS_IOPRIO_SET.get(platform.machine())
+    if nr is not None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        level = min(7, nice * 8 // 20)
+        if libc.syscall(nr, _IOPRIO_WHO_PROCESS, tid, (_IOPRIO_CLASS_BE << _IOPRIO_CLASS_SHIFT) | level) < 0:
+            print("Failed to lower the IO priority of the backup: errno {}".format(ctypes.get_errno()))
+    return True
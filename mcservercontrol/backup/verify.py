@@ -0,0 +1,133 @@
+"""
+Check that backups can be read back: every file against the checksum recorded when it was packed,
+and the whole archive or snapshot manifest against the checksum of the catalog
+"""
+import io, json, zlib, hashlib, tarfile, zipfile
+from typing import IO, Dict, List, Optional, Tuple
+
+from .store import SnapshotStore, entryObjects
+from .writer import CHECKSUMS_MEMBER, THROTTLE_T, archiveCodec, crc32Hex, fileChecksum
+
+# problems found, sha256 of the archive or manifest
+VERIFY_RESULT_T = Tuple[List[str], Optional[str]]
+
+_READ_SIZE = 1024 * 1024
+
+class _HashingReader(io.RawIOBase):
+    """
+    sha256 of the raw file, while it is read by the decompressor
+    """
+    def __init__(self, fp: IO[bytes], throttle: Optional[THROTTLE_T]) -> None:
+        self._fp = fp
+        self._throttle = throttle
+        self.sha256 = hashlib.sha256()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if self._throttle is not None:
+            self._throttle(len(b))
+        n = self._fp.readinto(b)        # type: ignore
+        self.sha256.update(memoryview(b)[:n])
+        return n
+
+def _compare(computed: Dict[str, str], recorded: Optional[Dict[str, str]]) -> List[str]:
+    if recorded is None:
+        # packed before checksums were recorded, it could at least be read
+        return []
+    problems = []
+    for path, checksum in recorded.items():
+        if path not in computed:
+            problems.append("missing file: {}".format(path))
+        elif computed[path] != checksum:
+            problems.append("checksum mismatch: {}".format(path))
+    for path in computed:
+        if path not in recorded:
+            problems.append("unexpected file: {}".format(path))
+    return problems
+
+def _readCrc(fp: IO[bytes], throttle: Optional[THROTTLE_T]) -> str:
+    crc = 0
+    while True:
+        if throttle is not None:
+            throttle(_READ_SIZE)
+        chunk = fp.read(_READ_SIZE)
+        if not chunk:
+            return crc32Hex(crc)
+        crc = zlib.crc32(chunk, crc)
+
+def verifyArchive(archive_path: str, throttle: Optional[THROTTLE_T] = None) -> VERIFY_RESULT_T:
+    """
+    Read the archive through, tar archives in a single pass
+     - throttle: called with the number of bytes about to be read
+    """
+    computed: Dict[str, str] = {}
+    recorded: Optional[Dict[str, str]] = None
+    codec = archiveCodec(archive_path)
+    try:
+        if codec is None:
+            checksum = fileChecksum(archive_path)
+            with zipfile.ZipFile(archive_path, "r") as zipf:
+                for info in zipf.infolist():
+                    if info.is_dir():
+                        continue
+                    # zipfile checks the CRC of the member as well
+                    with zipf.open(info) as fp:
+                        if info.filename == CHECKSUMS_MEMBER:
+                            recorded = json.load(fp)["files"]
+                        else:
+                            computed[info.filename] = _readCrc(fp, throttle)
+        else:
+            with open(archive_path, "rb") as raw:
+                reader = _HashingReader(raw, throttle)
+                with codec.open_read(io.BufferedReader(reader, _READ_SIZE)) as fp:       # type: ignore
+                    with tarfile.open(fileobj=fp, mode="r|") as tar:       # type: ignore
+                        for member in tar:
+                            if not member.isfile():
+                                continue
+                            f = tar.extractfile(member)
+                            assert f is not None
+                            if member.name == CHECKSUMS_MEMBER:
+                                recorded = json.load(f)["files"]
+                            else:
+                                computed[member.name] = _readCrc(f, None)
+                    # the end of the stream, for the checksum of the whole file
+                    while fp.read(_READ_SIZE):
+                        ...
+                while reader.read(_READ_SIZE):
+                    ...
+                checksum = reader.sha256.hexdigest()
+    except Exception as e:
+        return ["unreadable: {}".format(e)], None
+    return _compare(computed, recorded), checksum
+
+def verifySnapshot(store: SnapshotStore, key: str, throttle: Optional[THROTTLE_T] = None) -> VERIFY_RESULT_T:
+    """
+    Every object of the snapshot is read and checked against its hash
+    """
+    try:
+        checksum = fileChecksum(store.manifestPath(key))
+        files = store.manifest(key)["files"]
+    except Exception as e:
+        return ["unreadable manifest: {}".format(e)], None
+    problems = []
+    checked = set()
+    for path, entry in files.items():
+        for digest in entryObjects(entry):
+            if digest in checked:
+                continue
+            checked.add(digest)
+            if not store.hasObject(digest):
+                problems.append("missing object {} of {}".format(digest, path))
+                continue
+            try:
+                data = store.getObject(digest)
+            except Exception as e:
+                problems.append("unreadable object {} of {}: {}".format(digest, path, e))
+                continue
+            if throttle is not None:
+                throttle(len(data))
+            if hashlib.sha256(data).hexdigest() != digest:
+                problems.append("corrupted object {} of {}".format(digest, path))
+    return problems, checksum
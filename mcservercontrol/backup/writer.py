@@ -0,0 +1,363 @@
+"""
+Backup archive writers and readers.
+A tar archive is compressed in blocks by a pool of threads (the compressors release the GIL),
+the compressed blocks are concatenated members/frames of a standard .tar.gz/.tar.xz/.tar.bz2/.tar.zst file.
+The CRC32 of each file, computed while it is packed, is written to the archive as its last member CHECKSUMS_MEMBER.
+"""
+import os, io, bz2, gzip, json, lzma, time, zlib, hashlib, tarfile, zipfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import IO, Callable, Deque, Dict, List, Literal, Optional, Tuple, Union
+
+try:
+    import zstandard        # type: ignore
+except ImportError:
+    zstandard = None
+
+FORMAT_T = Literal["zip", "tar"]
+SOURCE_T = Union[str, IO[bytes]]            # a path or a file object
+PROGRESS_CB_T = Callable[[int, int], None]
+THROTTLE_T = Callable[[int], None]          # called with the number of bytes about to be processed, may block
+
+class Codec:
+    """
+    - suffix: of the tar file, e.g. ".gz" for .tar.gz
+    - zip_method: zipfile compression method, None if not supported by zip
+    """
+    def __init__(
+            self, name: str, suffix: str, default_level: int,
+            compress: Callable[[bytes, int], bytes],
+            open_read: Callable[[SOURCE_T], IO[bytes]],
+            zip_method: Optional[int] = None
+            ) -> None:
+        self.name = name
+        self.suffix = suffix
+        self.default_level = default_level
+        self.compress = compress
+        self.open_read = open_read
+        self.zip_method = zip_method
+
+def _openRaw(src: SOURCE_T) -> IO[bytes]:
+    return open(src, "rb") if isinstance(src, str) else src
+
+def _openZstd(src: SOURCE_T) -> IO[bytes]:
+    assert zstandard is not None
+    return zstandard.ZstdDecompressor().stream_reader(_openRaw(src), read_across_frames=True, closefd=True)
+
+CODECS: Dict[str, Codec] = {
+    "store": Codec("store", "", 0, lambda data, level: data, _openRaw, zipfile.ZIP_STORED),
+    "deflate": Codec(
+        "deflate", ".gz", 6, lambda data, level: gzip.compress(data, compresslevel=level, mtime=0),
+        lambda src: gzip.open(src, "rb"), zipfile.ZIP_DEFLATED
+    ),
+    "bz2": Codec("bz2", ".bz2", 9, lambda data, level: bz2.compress(data, level), lambda src: bz2.open(src, "rb"), zipfile.ZIP_BZIP2),
+    "lzma": Codec(
+        "lzma", ".xz", 6, lambda data, level: lzma.compress(data, preset=level),
+        lambda src: lzma.open(src, "rb"), zipfile.ZIP_LZMA
+    ),
+}
+if zstandard is not None:
+    CODECS["zstd"] = Codec(
+        "zstd", ".zst", 3, lambda data, level: zstandard.ZstdCompressor(level=level).compress(data), _openZstd
+    )
+
+def getCodec(name: str) -> Codec:
+    if name not in CODECS:
+        raise ValueError("Unknown or unavailable backup codec: {} (available: {})".format(name, ", ".join(CODECS)))
+    return CODECS[name]
+
+def archiveSuffix(fmt: FORMAT_T, codec: Codec) -> str:
+    if fmt == "zip":
+        return ".zip"
+    return ".tar" + codec.suffix
+
+# every suffix a backup may have, longest first
+ARCHIVE_SUFFIXES = [".tar" + c.suffix for c in CODECS.values() if c.suffix] + [".tar", ".zip"]
+
+# {"algorithm": "crc32", "files": {path: checksum}}, not extracted
+CHECKSUMS_MEMBER = ".backup-checksums.json"
+
+def fileChecksum(path: str) -> str:
+    """
+    sha256 of the file
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as fp:
+        while True:
+            chunk = fp.read(1024 * 1024)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+def crc32Hex(crc: int) -> str:
+    return "{:08x}".format(crc & 0xFFFFFFFF)
+
+class _CrcReader(io.RawIOBase):
+    """
+    Compute the CRC32 of what is read through it
+    """
+    def __init__(self, fp: IO[bytes]) -> None:
+        self._fp = fp
+        self.crc = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._fp.read(size)
+        self.crc = zlib.crc32(data, self.crc)
+        return data
+
+class _HashingWriter(io.RawIOBase):
+    """
+    Write-only stream, not seekable, compute the sha256 of what is written through it
+    """
+    def __init__(self, fp: IO[bytes]) -> None:
+        self._fp = fp
+        self.sha256 = hashlib.sha256()
+        self.bytes_out = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._fp.write(data)
+        self.sha256.update(data)
+        self.bytes_out += len(data)
+        return len(data)
+
+class _BlockCompressor(io.RawIOBase):
+    """
+    Write-only stream, the data is cut into blocks compressed in parallel and written in order
+    """
+    def __init__(
+            self, fp: IO[bytes], codec: Codec, level: int, pool: ThreadPoolExecutor, block_size: int, max_pending: int,
+            throttle: Optional[THROTTLE_T] = None
+            ) -> None:
+        self._fp = fp
+        self._throttle = throttle
+        self._codec = codec
+        self._level = level
+        self._pool = pool
+        self._block_size = block_size
+        self._max_pending = max_pending
+        self._chunks: List[bytes] = []
+        self._buffered = 0
+        self._pending: Deque[Future] = deque()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.sha256 = hashlib.sha256()          # of the archive
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._buffered += len(data)
+        if self._buffered >= self._block_size:
+            self._submit(b"".join(self._chunks))
+            self._chunks, self._buffered = [], 0
+        return len(data)
+
+    def _submit(self, block: bytes):
+        if self._throttle is not None:
+            self._throttle(len(block))
+        self.bytes_in += len(block)
+        self._pending.append(self._pool.submit(self._codec.compress, block, self._level))
+        # bound the memory held by blocks in flight
+        while len(self._pending) >= self._max_pending:
+            self._writeOne()
+
+    def _writeOne(self):
+        compressed = self._pending.popleft().result()
+        self._fp.write(compressed)
+        self.sha256.update(compressed)
+        self.bytes_out += len(compressed)
+
+    def finish(self):
+        if self._chunks:
+            self._submit(b"".join(self._chunks))
+            self._chunks, self._buffered = [], 0
+        while self._pending:
+            self._writeOne()
+
+class ArchiveWriter:
+    """
+    Pack a directory into a backup archive
+    """
+    BLOCK_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, fmt: FORMAT_T = "tar", codec: str = "deflate", level: Optional[int] = None, workers: int = 0) -> None:
+        """
+         - fmt: "tar" (compressed in parallel) or "zip" (one file at a time, for compatibility)
+         - level: compression level of the codec, default to the codec default
+         - workers: compressing threads of tar archives, 0 for the number of cores
+        """
+        if fmt not in ("zip", "tar"):
+            raise ValueError("Unknown backup format: {}".format(fmt))
+        self.fmt: FORMAT_T = fmt
+        self.codec = getCodec(codec)
+        if fmt == "zip" and self.codec.zip_method is None:
+            raise ValueError("Codec {} can not be used with zip".format(codec))
+        self.level = self.codec.default_level if level is None else level
+        self.workers = workers or os.cpu_count() or 1
+        self.stats: Dict[str, float] = {}
+        self.checksums: Dict[str, str] = {}     # CRC32 of the files packed by the last write
+        self.checksum: Optional[str] = None     # sha256 of the archive written by the last write
+
+    @property
+    def suffix(self) -> str:
+        return archiveSuffix(self.fmt, self.codec)
+
+    @staticmethod
+    def listFiles(directory: str) -> List[Tuple[str, int]]:
+        """
+        (path, size) of the files under the directory
+        """
+        files = []
+        for root, _, names in os.walk(directory):
+            for name in names:
+                file_path = os.path.join(root, name)
+                try:
+                    files.append((file_path, os.path.getsize(file_path)))
+                except OSError:
+                    # removed in the meantime
+                    ...
+        return files
+
+    def write(
+            self, directory: str, archive_path: str,
+            on_progress: PROGRESS_CB_T = lambda done, total: None, throttle: Optional[THROTTLE_T] = None
+            ) -> Dict[str, float]:
+        """
+         - throttle: e.g. throttle.RateLimiter
+        return stats: bytes in, bytes out, seconds and MB/s (of the uncompressed data)
+        """
+        files = self.listFiles(directory)
+        total = sum(size for _, size in files)
+        on_progress(0, total)
+        t_start = time.monotonic()
+        self.checksums = {}
+        if self.fmt == "zip":
+            bytes_out = self._writeZip(directory, files, total, archive_path, on_progress, throttle)
+        else:
+            bytes_out = self._writeTar(directory, files, total, archive_path, on_progress, throttle)
+        elapsed = max(time.monotonic() - t_start, 1e-6)
+        self.stats = {
+            "files": len(files),
+            "bytes_in": total,
+            "bytes_out": bytes_out,
+            "seconds": elapsed,
+            "mb_per_sec": total / elapsed / 1e6,
+        }
+        return self.stats
+
+    def _writeZip(
+            self, directory: str, files: List[Tuple[str, int]], total: int, archive_path: str,
+            on_progress: PROGRESS_CB_T, throttle: Optional[THROTTLE_T]
+            ) -> int:
+        done = 0
+        with open(archive_path, "wb") as fp:
+            # not seekable: the entries are written once and in order (sizes and CRC after the data),
+            # hashed as they are written
+            sink = _HashingWriter(fp)
+            with zipfile.ZipFile(sink, "w", compression=self.codec.zip_method, compresslevel=self.level) as zipf:      # type: ignore
+                for file_path, size in files:
+                    if throttle is not None:
+                        throttle(size)
+                    arcname = os.path.relpath(file_path, directory).replace(os.sep, "/")
+                    try:
+                        zipf.write(file_path, arcname=arcname)
+                    except FileNotFoundError:
+                        continue
+                    finally:
+                        done += size
+                        on_progress(done, total)
+                    # computed by zipfile while compressing
+                    self.checksums[arcname] = crc32Hex(zipf.getinfo(arcname).CRC)
+                zipf.writestr(CHECKSUMS_MEMBER, self._checksumsData())
+        self.checksum = sink.sha256.hexdigest()
+        return sink.bytes_out
+
+    def _checksumsData(self) -> bytes:
+        return json.dumps({"algorithm": "crc32", "files": self.checksums}).encode("utf-8")
+
+    def _writeTar(
+            self, directory: str, files: List[Tuple[str, int]], total: int, archive_path: str,
+            on_progress: PROGRESS_CB_T, throttle: Optional[THROTTLE_T]
+            ) -> int:
+        done = 0
+        with open(archive_path, "wb") as fp, ThreadPoolExecutor(self.workers, thread_name_prefix="backup-compress") as pool:
+            sink = _BlockCompressor(fp, self.codec, self.level, pool, self.BLOCK_SIZE, max_pending=2 * self.workers, throttle=throttle)
+            # blocks are buffered by the sink, a large tarfile buffer would be copied over at each write
+            with tarfile.open(fileobj=sink, mode="w|") as tar:      # type: ignore
+                for file_path, size in files:
+                    arcname = os.path.relpath(file_path, directory).replace(os.sep, "/")
+                    try:
+                        tarinfo = tar.gettarinfo(file_path, arcname=arcname)
+                        with open(file_path, "rb") as f:
+                            reader = _CrcReader(f)
+                            tar.addfile(tarinfo, reader)        # type: ignore
+                        self.checksums[arcname] = crc32Hex(reader.crc)
+                    except FileNotFoundError:
+                        ...
+                    done += size
+                    on_progress(done, total)
+                data = self._checksumsData()
+                tarinfo = tarfile.TarInfo(CHECKSUMS_MEMBER)
+                tarinfo.size, tarinfo.mtime = len(data), int(time.time())
+                tar.addfile(tarinfo, io.BytesIO(data))
+            sink.finish()
+            self.checksum = sink.sha256.hexdigest()
+            return sink.bytes_out
+
+def archiveCodec(archive_path: str) -> Optional[Codec]:
+    """
+    Codec of a tar archive by its suffix, None for zip
+    """
+    if archive_path.endswith(".zip"):
+        return None
+    for codec in CODECS.values():
+        if codec.suffix and archive_path.endswith(".tar" + codec.suffix):
+            return codec
+    if archive_path.endswith(".tar"):
+        return CODECS["store"]
+    raise ValueError("Unknown backup archive: {}".format(archive_path))
+
+def _extractZipMembers(archive_path: str, names: List[str], directory: str):
+    # a ZipFile per thread, the members are read concurrently
+    with zipfile.ZipFile(archive_path, 'r') as zipref:
+        for name in names:
+            zipref.extract(name, path=directory)
+
+def extractArchive(archive_path: str, directory: str, include: Optional[Callable[[str], bool]] = None, workers: int = 0) -> int:
+    """
+    Extract the files of a backup archive
+     - include: called with the path of each file in the archive, extract only those it returns True for
+     - workers: threads extracting zip archives, 0 for the number of cores (tar archives are read as a stream)
+    return the number of files extracted
+    """
+    codec = archiveCodec(archive_path)
+    if codec is None:
+        with zipfile.ZipFile(archive_path, 'r') as zipref:
+            names = [info.filename for info in zipref.infolist() if not info.is_dir() and info.filename != CHECKSUMS_MEMBER]
+        if include is not None:
+            names = [name for name in names if include(name)]
+        workers = min(workers or os.cpu_count() or 1, max(len(names), 1))
+        with ThreadPoolExecutor(workers, thread_name_prefix="backup-extract") as pool:
+            for f in [pool.submit(_extractZipMembers, archive_path, names[i::workers], directory) for i in range(workers)]:
+                f.result()
+        return len(names)
+
+    n = 0
+    with codec.open_read(archive_path) as fp, tarfile.open(fileobj=fp, mode="r|") as tar:      # type: ignore
+        for member in tar:
+            if not member.isfile() or member.name == CHECKSUMS_MEMBER or (include is not None and not include(member.name)):
+                continue
+            if hasattr(tarfile, "data_filter"):
+                tar.extract(member, path=directory, filter="data")
+            else:
+                tar.extract(member, path=directory)
+            n += 1
+    return n
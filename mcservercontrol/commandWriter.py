@@ -0,0 +1,107 @@
+"""
+Single writer of the minecraft server stdin
+"""
+import time, queue
+from collections import deque
+from threading import Event, Lock, Thread
+from typing import IO, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+class CommandWriter:
+    """
+    Commands from all threads are queued and written by one writer thread,
+    the commands pending within a flush window are joined into a single write + flush.
+    A command is always written as whole lines, never interleaved with other commands.
+    """
+    RATE_WINDOW = 10        # seconds, for commands/sec
+
+    def __init__(self, stream_getter: Callable[[], IO[bytes]], flush_window: float = 0.002) -> None:
+        """
+         - stream_getter: returns the stdin of the minecraft server
+         - flush_window: seconds to wait for more commands after the first one, 0 to only take the queued ones
+        """
+        self._stream_getter = stream_getter
+        self.flush_window = flush_window
+        self._queue: "queue.SimpleQueue[Union[bytes, Event]]" = queue.SimpleQueue()
+        self._thread: Optional[Thread] = None
+        self._start_lock = Lock()
+
+        self._n_commands = 0
+        self._n_writes = 0
+        self._history: Deque[Tuple[float, int]] = deque()       # (time, number of commands) of each write
+
+    def write(self, x: str):
+        lines = [line for line in x.split("\n") if line.strip()]
+        if not lines:
+            return
+        self._ensureStarted()
+        self._queue.put(("\n".join(lines) + "\n").encode("utf-8"))
+
+    __call__ = write
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until the commands queued before are written
+        """
+        self._ensureStarted()
+        done = Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _ensureStarted(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="command-writer", daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> List[Union[bytes, Event]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_window
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                ...
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return batch
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            cmds = [item for item in batch if isinstance(item, bytes)]
+            if cmds:
+                try:
+                    stream = self._stream_getter()
+                    stream.write(b"".join(cmds))
+                    stream.flush()
+                except Exception as e:
+                    print("Failed to send {} command(s): {}".format(len(cmds), e))
+                else:
+                    self._record(len(cmds))
+            for item in batch:
+                if isinstance(item, Event):
+                    item.set()
+
+    def _record(self, n: int):
+        now = time.monotonic()
+        self._n_commands += n
+        self._n_writes += 1
+        self._history.append((now, n))
+        while self._history and self._history[0][0] < now - self.RATE_WINDOW:
+            self._history.popleft()
+
+    def stats(self) -> Dict[str, float]:
+        now = time.monotonic()
+        recent = sum(n for t, n in list(self._history) if t >= now - self.RATE_WINDOW)
+        return {
+            "commands": self._n_commands,
+            "writes": self._n_writes,
+            "commands_per_sec": recent / self.RATE_WINDOW,
+        }
@@ -1,6 +1,6 @@
 import json
 import os, sys
-from typing import TypedDict
+from typing import Dict, Optional, TypedDict
 
 WORK_DIR = os.path.abspath(os.path.realpath(os.getcwd()))
 
@@ -15,10 +15,54 @@ class CONF_T(TypedDict):
     broadcast_port: int
     max_backup: int
 
+    # Optional entries, see CONF_DEFAULTS
+    attach: bool                # attach to a running server instead of starting one
+    command_transport: str      # "stdin" | "rcon"
+    rcon_host: str
+    rcon_port: int
+    rcon_password: str
+    status_backend: str         # "sqlite" | "memory", where the player status is saved
+    status_flush_interval: int  # seconds between saves of the player status changed, and of the players online
+    backup_format: str          # "tar" | "zip" | "store"
+    backup_codec: str           # "deflate" | "lzma" | "bz2" | "zstd" | "store"
+    backup_level: Optional[int] # compression level, None for the codec default
+    backup_workers: int         # compressing threads, 0 for the number of cores
+    backup_snapshot: bool       # copy the world while saving is off, and pack the copy after saving is on again
+    backup_rate_limit: int      # bytes/sec read by backups while players are online, 0 for unlimited
+    backup_nice: int            # lower the CPU and IO priority of backups, 0 ~ 19
+    backup_retention: Optional[Dict[str, int]]  # backups to keep: {"last": n, "hourly": n, "daily": n, "weekly": n}
+    backup_interval: int        # seconds between automatic backups, 0 to disable
+    backup_max_delay: int       # seconds a due automatic backup waits for the server to be empty
+    backup_verify_interval: int # seconds between verifications of the backups while the server is empty, 0 to disable
+    backup_verify_rate: int     # bytes/sec read by verifications, 0 for unlimited
+
     # Entries inferred from config file
     world_dir: str              # /server_dir/world_name
     world_conf_dir: str         # /server_dir/world_name/.mcservercontrol
 
+# Default values of the optional entries
+CONF_DEFAULTS = {
+    "attach": False,
+    "command_transport": "stdin",
+    "rcon_host": "localhost",
+    "rcon_port": 25575,
+    "rcon_password": "",
+    "status_backend": "sqlite",
+    "status_flush_interval": 60,
+    "backup_format": "tar",
+    "backup_codec": "deflate",
+    "backup_level": None,
+    "backup_workers": 0,
+    "backup_snapshot": True,
+    "backup_rate_limit": 0,
+    "backup_nice": 10,
+    "backup_retention": None,
+    "backup_interval": 3 * 3600,
+    "backup_max_delay": 3600,
+    "backup_verify_interval": 3600,
+    "backup_verify_rate": 16 * 1024 * 1024,
+}
+
 __config_cache = None
 def config():
     global __config_cache
@@ -32,6 +76,8 @@ def config():
 
     # world directory
     cfg: CONF_T = config_raw.copy()
+    for k, v in CONF_DEFAULTS.items():
+        cfg.setdefault(k, v)
     cfg["world_dir"] = os.path.join(cfg["server_dir"], cfg["world_name"])
     if not os.path.exists(cfg["world_dir"]):
         print("Created world directory...")
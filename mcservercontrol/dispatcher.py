@@ -0,0 +1,133 @@
+"""
+Run observers on a pool of worker threads,
+so that reading the server log is never blocked by slow observers
+"""
+from __future__ import annotations
+import time, queue
+from threading import Thread
+from typing import Any, Callable, Dict, List, Literal, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .listenerBase import EVENT_ALL
+
+OVERFLOW_T = Literal[
+    "block",        # the reader waits until there is room in the queue (backpressure)
+    "drop",         # general events are dropped when the queue is full, player events still block
+]
+
+class EventDispatcher:
+    """
+    Events of the same player are always handled by the same worker, hence in order;
+    events without a single player (general, listplayer) go to the first worker.
+    There is no order across workers: e.g. a /list reply may be handled before the login of a player it lists
+    if that login is on another worker, the players online are therefore kept by the listener (OnlineIndex)
+    on the reading thread, before dispatching
+    """
+    def __init__(
+            self,
+            handler: Callable[[EVENT_ALL], Any],
+            n_workers: int = 2,
+            queue_size: int = 1024,
+            overflow: OVERFLOW_T = "block",
+            on_error: Optional[Callable[[EVENT_ALL, Exception], Any]] = None,
+            ) -> None:
+        """
+         - handler: called on worker threads for each event
+         - queue_size: max number of pending events per worker
+        """
+        assert n_workers > 0
+        self._handler = handler
+        self._on_error = on_error
+        self.overflow = overflow
+        self._queues: List[queue.Queue[Optional[EVENT_ALL]]] = [queue.Queue(maxsize=queue_size) for _ in range(n_workers)]
+        self._workers: List[Thread] = []
+
+        # only updated by the submitting thread
+        self._submitted = 0
+        self._dropped = 0
+        self._blocked = 0
+        self._blocked_time = 0.
+        self._max_depth = 0
+        # one counter per worker
+        self._handled = [0] * n_workers
+
+    @property
+    def n_workers(self) -> int:
+        return len(self._queues)
+
+    @property
+    def threads(self) -> List[Thread]:
+        """
+        The worker threads, once started
+        """
+        return list(self._workers)
+
+    def _shard(self, event: EVENT_ALL) -> int:
+        if "player" in event:
+            return hash(event["player"].name) % self.n_workers
+        return 0
+
+    def submit(self, event: EVENT_ALL) -> bool:
+        """
+        return False if the event is dropped
+        """
+        q = self._queues[self._shard(event)]
+        try:
+            q.put_nowait(event)
+        except queue.Full:
+            if self.overflow == "drop" and "player" not in event and "players" not in event:
+                self._dropped += 1
+                return False
+            self._blocked += 1
+            t_start = time.monotonic()
+            q.put(event)
+            self._blocked_time += time.monotonic() - t_start
+
+        self._submitted += 1
+        depth = q.qsize()
+        if depth > self._max_depth:
+            self._max_depth = depth
+        return True
+
+    def _work(self, idx: int):
+        q = self._queues[idx]
+        while True:
+            event = q.get()
+            if event is None:
+                break
+            try:
+                self._handler(event)
+            except Exception as e:
+                if self._on_error is not None:
+                    self._on_error(event, e)
+                else:
+                    print("Error on event dispatch: {}".format(e))
+            self._handled[idx] += 1
+
+    def start(self):
+        for i in range(self.n_workers):
+            t = Thread(target=self._work, args=(i, ), name="event-dispatch-{}".format(i), daemon=True)
+            t.start()
+            self._workers.append(t)
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Handle all pending events, then stop the workers
+        """
+        for q in self._queues:
+            q.put(None)
+        for t in self._workers:
+            t.join(timeout)
+        self._workers = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.n_workers,
+            "depth": sum(q.qsize() for q in self._queues),
+            "max_depth": self._max_depth,
+            "submitted": self._submitted,
+            "handled": sum(self._handled),
+            "dropped": self._dropped,
+            "blocked": self._blocked,               # times the reader had to wait for room in the queue
+            "blocked_time": self._blocked_time,     # seconds the reader waited in total
+        }
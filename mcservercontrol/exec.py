@@ -1,5 +1,6 @@
-from mcservercontrol.configReader import WORK_DIR, CONF_PATH, EXEC_PATH
+from mcservercontrol.configReader import WORK_DIR, CONF_PATH, EXEC_PATH, CONF_DEFAULTS
 import os, json, shutil, argparse
+from typing import List, Optional
 
 def init():
     if not os.path.exists(CONF_PATH):
@@ -10,8 +11,10 @@ def init():
                 "entry": "java -Xmx1024M -Xms1024M -jar server.jar nogui",
                 "world_name": "world",
                 "broadcast_port": 25566,
-                "max_backup": 16
+                "max_backup": 16,
             }
+            # the optional entries, with the defaults used when they are missing
+            _default_conf.update(dict(CONF_DEFAULTS))
             json.dump(_default_conf, fp, indent=1)
         print("Generated default configuration file at: ", CONF_PATH)
     
@@ -25,11 +28,52 @@ def init():
 
     print("Please edit configuration and run `python .`")
 
+def replay(paths: List[str], speed: float, quiet: bool):
+    from mcservercontrol import EventListener, getDefaultObservers
+    from mcservercontrol.configReader import config
+    from mcservercontrol.replay import LogReplayer, listLogFiles
+
+    if not paths:
+        paths = listLogFiles(os.path.join(config()["server_dir"], "logs"))
+
+    # Server commands are not sent anywhere
+    listener = EventListener()
+    listener.startReplay()
+    listener.echo = not quiet
+    listener.register(*getDefaultObservers())
+
+    LogReplayer(listener, speed = speed).replay(paths)
+
+def migrateStatus(src_dir: Optional[str]):
+    from mcservercontrol.statusStore import getStatusStore, legacyStatusDir, migrateStatus
+    if src_dir is None:
+        src_dir = legacyStatusDir()
+    if not os.path.isdir(src_dir):
+        print("No player status to import at: ", src_dir)
+        return
+    try:
+        n = migrateStatus(src_dir)
+    except ValueError as e:
+        print(e)
+        return
+    finally:
+        getStatusStore().close()
+    print("Imported the status of {} player(s) from {}, the directory can be removed".format(n, src_dir))
 
 def main():
     parser = argparse.ArgumentParser("MCServerControl")
     sp = parser.add_subparsers(dest="subparser")
     sp.add_parser("init", help = "initialization on current working directory.")
+    replay_parser = sp.add_parser("replay", help = "replay server logs through the listener and default observers, player status will be updated.")
+    replay_parser.add_argument("paths", nargs = "*", help = "log files (.log or .log.gz), default to all logs of the server in chronological order")
+    replay_parser.add_argument("-s", "--speed", type = float, default = 0, help = "time scale relative to the original log, 0 for full speed")
+    replay_parser.add_argument("-q", "--quiet", action = "store_true", help = "do not print log lines")
+    migrate_parser = sp.add_parser("migrate-status", help = "import the player status saved by previous versions (pickle files) into the status store.")
+    migrate_parser.add_argument("src_dir", nargs = "?", help = "default to <world>/.mcservercontrol/player_status")
     args = parser.parse_args()
     if args.subparser == "init":
         init()
+    if args.subparser == "replay":
+        replay(args.paths, args.speed, args.quiet)
+    if args.subparser == "migrate-status":
+        migrateStatus(args.src_dir)
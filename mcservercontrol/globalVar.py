@@ -2,13 +2,17 @@ from __future__ import annotations
 import sys
 from typing import List, TYPE_CHECKING, Optional, Dict
 if TYPE_CHECKING:
-    from .server import Server, ScheduleThread, SCHEDULE_ID
+    from .server import Server
+    from .scheduler import Scheduler, ScheduledJob, SCHEDULE_ID
+    from .statusStore import StatusStore
 
 __initialized: bool
 log_last_update: float
 log_content: List[str]
 server: Optional[Server]
-scheduled_threads: Dict[SCHEDULE_ID, ScheduleThread]
+scheduled_threads: Dict[SCHEDULE_ID, ScheduledJob]          # pending scheduled calls
+scheduler: Optional[Scheduler]
+status_store: Optional[StatusStore]
 
 def init():
     global __initialized
@@ -16,6 +20,8 @@ def init():
     global log_last_update
     global server
     global scheduled_threads
+    global scheduler
+    global status_store
 
     thismodule = sys.modules[__name__]
     if hasattr(thismodule, "__initialized") and __initialized:
@@ -27,3 +33,5 @@ def init():
     log_last_update = 0
     server = None
     scheduled_threads = {}
+    scheduler = None
+    status_store = None
@@ -1,24 +1,127 @@
 import re
-from typing import List
+from typing import List, Literal
 
 from .listenerBase import *
+from .logParser import LogLineParser
+from .logFollower import LogFollower
 from .timeUtils import TimeUtils
 from . import globalVar; globalVar.init()
 
+PARSER_T = Literal["compiled", "legacy"]
+
 class EventListener(EventListenerBase):
 
+    def __init__(
+            self, 
+            parser: PARSER_T = "compiled", 
+            workers: int = 0, 
+            queue_size: int = 1024, 
+            overflow: OVERFLOW_T = "block",
+            player_cache: int = 256
+            ) -> None:
+        """
+         - parser: log line parsing engine, 
+            "compiled" uses the single-pass precompiled parser, 
+            "legacy" splits the line by square brackets
+         - workers, queue_size, overflow, player_cache: see EventListenerBase
+        """
+        super().__init__(workers = workers, queue_size = queue_size, overflow = overflow, player_cache = player_cache)
+        self.parser = parser
+        self._line_parser = LogLineParser()
+
     def listen(self):
-        while self.mc_server.proc.poll() is None:
-            # Log listening loop
-            output = self.mc_server.proc.stdout.readline()
-            if output:
-                self.parse(output.decode("utf-8"))
+        if self.attached:
+            return self._followLog()
+
+        self._runReader(self._readLines)
 
         self.mc_server.proc.stdout.close()
         self.mc_server.proc.stdin.close()
         exit(self.mc_server.proc.poll())
 
+    def _runReader(self, read: Callable[[], None]):
+        if self.dispatcher is not None:
+            # dedicated reader thread, observers run on the dispatcher workers
+            reader = Thread(target=read, name="log-reader", daemon=True)
+            reader.start()
+            reader.join()
+            self.stopDispatcher()
+        else:
+            read()
+
+    def _followLog(self):
+        follower = LogFollower(self.log_path)
+        def _read():
+            for line in follower.lines():
+                self.parse(line)
+        try:
+            self._runReader(_read)
+        except KeyboardInterrupt:
+            # the server keeps running
+            print("Detached from the server.")
+            self._stopWebserver()
+        finally:
+            follower.close()
+
+    def _readLines(self):
+        proc = self.mc_server.proc
+        while proc is not None:
+            # Log listening loop, until the server exits
+            for output in iter(proc.stdout.readline, b""):
+                self.parse(output.decode("utf-8"))
+            proc.wait()
+            # stopped for a restart, e.g. restoring a backup
+            next_proc = self.mc_server.nextProc(proc)
+            if next_proc is not None:
+                proc.stdout.close()
+                proc.stdin.close()
+            proc = next_proc
+
     def parse(self, line: str):
+        if self.parser == "legacy":
+            return self._parseLegacy(line)
+        else:
+            return self._parseCompiled(line)
+
+    def _parseCompiled(self, line: str):
+        event: EVENT_ALL = {
+            "etype": "general",
+            "time": TimeUtils.nowStamp(),
+            "log_line": line
+        }
+
+        parsed = self._line_parser.parse(line)
+        if parsed is None:
+            # unknown
+            return event
+
+        if parsed.kind == "login":
+            # the status is loaded from the status store by the dispatch
+            event["player"] = self.players[parsed.names[0]]
+
+        elif parsed.kind == "logout":
+            event["player"] = self.players[parsed.names[0]]
+
+        elif parsed.kind == "listplayer":
+            event["players"] = [self.players[p_name] for p_name in parsed.names]
+
+        elif parsed.kind == "cmd":
+            assert parsed.cmd_split is not None
+            event["player"] = self.players[parsed.names[0]]
+            event["cmd_split"] = parsed.cmd_split
+
+        elif parsed.kind == "speak":
+            event["player"] = self.players[parsed.names[0]]
+            event["content"] = parsed.content
+
+        event["etype"] = parsed.kind
+
+        try:
+            self.emit(event)
+        except Exception as E:
+            self.mc_server.say("Error occured while processing event: {}".format(event))
+
+    def _parseLegacy(self, line: str):
         line_split = self._splitLogLineBySB(line)
 
         event: EVENT_ALL = {
@@ -43,11 +146,8 @@ class EventListener(EventListenerBase):
         if "joined the game" in content:
             event["etype"] = "login"
             name = content.split("joined the game")[0].strip()
-            if name not in self.players.keys():
-                # create the player object on their first login
-                self.players[name] = Player(name, status_dict={"is_online": True})
-            player = self.players[name]
-            event["player"] = player
+            # the status is loaded from the status store by the dispatch
+            event["player"] = self.players[name]
 
         # Player logout
         elif "left the game" in content:
@@ -58,7 +158,7 @@ class EventListener(EventListenerBase):
         elif re.match(r"^There are \d* of a max of \d* players online:.*", content):
             event["etype"] = "listplayer"
             player_names = content.split("players online:")[1].strip("\n").split(",")
-            event["players"] = [self.players[p_name.strip()] for p_name in player_names ]
+            event["players"] = [self.players[p_name.strip()] for p_name in player_names if p_name.strip()]
             
         #Player enter command or speak
         elif re.match(r"\<[^\<]*\>", content):
@@ -1,15 +1,21 @@
 from abc import abstractmethod
-from typing import Any, Callable, Dict, Literal, Tuple, TypedDict, List, Union
+from typing import Any, Callable, Dict, Iterator, Literal, Optional, Tuple, TypedDict, List, Union
 import os, warnings, signal
 from multiprocessing import Process, Queue
-from threading import Thread
+from threading import Lock, Thread
 
 from mcservercontrol import globalVar
 from mcservercontrol.server import Server, MCPopen
 
 from .configReader import config
 from .player import Player
-from .observer import PlayerObserver, PlayerCommandObserver, DaemonObserver
+from .statusStore import StatusFlusher
+from .playerRegistry import PlayerRegistry
+from .onlineIndex import OnlineIndex
+from .observer import PlayerObserver, PlayerCommandObserver, DaemonObserver, HOOK_T
+from .dispatcher import EventDispatcher, OVERFLOW_T
+from .commandWriter import CommandWriter
+from .rcon import RconClient
 from .broadcastServer import startServer as startBroadcastServer
 
 EVENT_TYPE = Literal[
@@ -56,13 +62,17 @@ class InputThread(Thread):
     """
     Thread listening to user input from console
     """
-    def __init__(self, mc_proc_getter: Callable[[], MCPopen]) -> None:
+    def __init__(self, mc_proc_getter: Callable[[], MCPopen], cmd_interface: Optional[Callable[[str], Any]] = None) -> None:
         """
          - mc_proc: minecraft server process
+         - cmd_interface: where the console input goes, default to the stdin of the server
         """
         # daemon thread will end when main thread exit
         super().__init__(daemon=True)
         self._proc_getter = mc_proc_getter
+        self._cmd_interface = cmd_interface
+        # all commands go through the writer, so that they are never interleaved
+        self.writer = CommandWriter(lambda: self.mc_proc.stdin)
 
     @property
     def mc_proc(self) -> MCPopen:
@@ -74,21 +84,59 @@ class InputThread(Thread):
             self.onInput(_usr_input)
 
     def onInput(self, x: str):
-        self.sendServerCommand(x)
+        if self._cmd_interface is not None:
+            self._cmd_interface(x)
+        else:
+            self.sendServerCommand(x)
 
     def sendServerCommand(self, x: str):
-        if not x.endswith("\n"):
-            x += "\n"
-        self.mc_proc.stdin.write(x.encode("utf-8"))
-        self.mc_proc.stdin.flush()
+        self.writer.write(x)
 
 class EventListenerBase:
 
-    def __init__(self) -> None:
-        self.players: Dict[str, Player] = {}
+    def __init__(
+            self, 
+            workers: int = 0, 
+            queue_size: int = 1024, 
+            overflow: OVERFLOW_T = "block",
+            player_cache: int = 256
+            ) -> None:
+        """
+         - workers: number of threads to run the observers on, 
+            0 to run them on the thread reading the log;
+            the events of a player are handled in order, but not in order with the events of other players
+            or without a player (e.g. a login and the /list after it), see EventDispatcher
+         - queue_size: max number of pending events per worker
+         - overflow: what to do when the queue of a worker is full
+         - player_cache: number of players kept in memory, beyond it offline players are dropped
+            (and loaded again from the status store when needed)
+        """
+        self.online = OnlineIndex()
+        self.players = PlayerRegistry(player_cache, online = self.online)
         self.player_observers: List[PlayerObserver] = []
         self.player_command_observers: Dict[str, PlayerCommandObserver] = {}
+        # per-hook dispatch tables, only observers implementing the hook are listed
+        self.hook_observers: Dict[HOOK_T, List[PlayerObserver]] = {hook: [] for hook in PlayerObserver.HOOKS}
+        self.dispatch_stats: Dict[str, int] = {
+            "calls": 0,         # hook calls made
+            "skipped": 0,       # hook calls skipped as the observer does not implement the hook
+        }
+        self._stats_lock = Lock()   # observers may run on several workers
         self.event_queue = Queue()
+        self.echo = True            # print log lines to console
+        self.attached = False       # following the log of a server started outside of this program
+        self.dispatcher: Optional[EventDispatcher] = None
+        if workers > 0:
+            self.dispatcher = EventDispatcher(
+                self.dispatch, 
+                n_workers = workers, 
+                queue_size = queue_size, 
+                overflow = overflow, 
+                on_error = self._onDispatchError
+            )
+
+        # saves the status of the players changed or online, in batches
+        self.status_flusher = StatusFlusher(lambda: self.players.values(), on_flushed = self.players.evict)
 
         self.input_thread: InputThread
         self.daemon: DaemonObserver
@@ -99,12 +147,23 @@ class EventListenerBase:
             return globalVar.server
         else:
             raise Exception("uninitialized")
+
+    def _setServer(self, server: Server):
+        """
+        Save server to global variable to be accessed by observers,
+        its load follows the players online of the listener
+        """
+        server.load.online = self.online
+        globalVar.server = server
     
     def register(self, *obs: Union[PlayerObserver, PlayerCommandObserver]):
         for ob in obs:
             ob._all_players = self.players
+            ob._online = self.online
             if isinstance(ob, PlayerObserver):
                 self.player_observers.append(ob)
+                for hook in ob.subscribedHooks():
+                    self.hook_observers[hook].append(ob)
             if isinstance(ob, PlayerCommandObserver):
                 self.player_command_observers[ob.entry] = ob
                 
@@ -118,36 +177,52 @@ class EventListenerBase:
     def emit(self, event: EVENT_ALL):
 
         # print to console
-        print(event["log_line"], end="")
+        if self.echo:
+            print(event["log_line"], end="")
 
         # send to broadcast server
-        self.event_queue.put(event)
+        if hasattr(self, "_web_proc"):
+            self.event_queue.put(event)
+
+        # resolve pending command queries, before the event waits for any observer
+        self.mc_server.queries.feed(event["log_line"])
+        # before the observers, so that they see the player online on login; the load of the server shares it
+        self.online.feed(event)
+        self.mc_server.load.feed(event)
 
-        if event["etype"] == "general":
-            if event["log_line"].strip().endswith("[Server thread/INFO]: Saved the game"):
-                self.mc_server.onWorldSaveCallback()
+        if self.dispatcher is not None:
+            self.dispatcher.submit(event)
+        else:
+            self.dispatch(event)
+
+    def dispatch(self, event: EVENT_ALL):
+        """
+        Pass the event to the observers
+        """
+        for _ in self._dispatchSteps(event):
+            ...
 
+    def _dispatchSteps(self, event: EVENT_ALL) -> Iterator[Any]:
+        """
+        Pass the event to the observers, one step per observer call, yielding what the call returned
+        (the async listener awaits it before the next step)
+        """
         if event["etype"] == "login":
             assert "player" in event
             # Load player status on login
             event["player"].loadStatus()
 
-            for p_ob in self.player_observers:
-                p_ob.onPlayerLogin(event["player"])
+            yield from self._notifySteps("onPlayerLogin", event["player"])
 
         if event["etype"] == "logout":
             assert "player" in event
-            for p_ob in self.player_observers:
-                p_ob.onPlayerLogout(event["player"])
-
-            # Save player status on logout
-            event["player"].saveStatus()
+            # the status is saved by the status flusher
+            yield from self._notifySteps("onPlayerLogout", event["player"])
 
         if event["etype"] == "speak":
             assert "player" in event
             assert "content" in event
-            for p_ob in self.player_observers:
-                p_ob.onPlayerSpeak(event["player"], event["content"].strip())
+            yield from self._notifySteps("onPlayerSpeak", event["player"], event["content"].strip())
 
         if event["etype"] == "cmd":
             assert "player" in event
@@ -155,7 +230,7 @@ class EventListenerBase:
             entry = event["cmd_split"][0]
             if entry in self.player_command_observers.keys():
                 try:
-                    self.player_command_observers[entry].onTriggered(
+                    yield self.player_command_observers[entry].onTriggered(
                         event["player"], event["cmd_split"][1]
                     )
                 except Exception as e:
@@ -167,6 +242,28 @@ class EventListenerBase:
                     color = "red"
                 )
 
+    def _notifySteps(self, hook: HOOK_T, *args) -> Iterator[Any]:
+        subscribers = self.hook_observers[hook]
+        with self._stats_lock:
+            self.dispatch_stats["calls"] += len(subscribers)
+            self.dispatch_stats["skipped"] += len(self.player_observers) - len(subscribers)
+        for p_ob in subscribers:
+            yield getattr(p_ob, hook)(*args)
+
+    def _onDispatchError(self, event: EVENT_ALL, e: Exception):
+        self.mc_server.say("Error occured while processing event: {}".format(event))
+
+    def _startDispatcher(self):
+        if self.dispatcher is not None:
+            self.dispatcher.start()
+
+    def stopDispatcher(self):
+        """
+        Wait for the pending events to be handled by the observers
+        """
+        if self.dispatcher is not None:
+            self.dispatcher.stop()
+
     @property
     def cmd_interface(self) -> Callable[[str], Any]:
         if hasattr(self, "input_thread"):
@@ -174,18 +271,38 @@ class EventListenerBase:
         else:
             return lambda x: warnings.warn("Minecraft command line interface not ready.")
 
-    def startServer(self):
+    def startServer(self, attach: Optional[bool] = None):
+        """
+         - attach: attach to a running server (started outside of this program) instead of starting one,
+            the log is followed from logs/latest.log and commands are sent through RCON, 
+            default to config()["attach"]
+        """
+        if attach is None:
+            attach = config()["attach"]
+        self.attached = attach
         os.chdir(config()["server_dir"])
 
-        # A thread that listen to user input
-        self.input_thread = InputThread(lambda: self.mc_server.proc)
-        # Save server to global variable to be accessed by observers
-        globalVar.server = Server(self.input_thread.sendServerCommand)
+        if attach:
+            # the stdin of the server is not ours
+            rcon = RconClient.fromConfig()
+            self.input_thread = InputThread(lambda: self.mc_server.proc, cmd_interface = rcon)
+            self._setServer(Server(rcon))
+            self.mc_server.attached = True
+        else:
+            # A thread that listen to user input
+            self.input_thread = InputThread(lambda: self.mc_server.proc)
+            cmd_interface: Callable[[str], Any] = self.input_thread.sendServerCommand
+            if config()["command_transport"] == "rcon":
+                cmd_interface = RconClient.fromConfig()
+            self._setServer(Server(cmd_interface, stdin_writer = self.input_thread.writer))
 
         # Start!
-        self._startWebserver()
+        self._startServices()
         self.input_thread.start()
-        self.mc_server.startMCServer()
+        if attach:
+            print("Attached to the running server, log: {}".format(self.log_path))
+        else:
+            self.mc_server.startMCServer()
 
         # Catch KeyboardInterruption
         def stop_handler(signum, frame):
@@ -197,13 +314,49 @@ class EventListenerBase:
             except Exception as e:
                 print("Error: {}".format(e))
             
-        # Handle interrupt signal
-        signal.signal(signal.SIGINT, stop_handler)
+        # Handle interrupt signal, the attached server keeps running when we exit
+        if not attach:
+            signal.signal(signal.SIGINT, stop_handler)
 
-        # Start daemon observer
         self.daemon = DaemonObserver()
+        self._startJobs()
+
+    def _startServices(self):
+        """
+        Before the minecraft server starts: the status flusher and the broadcast server
+        """
+        self.status_flusher.start()
+        self._startWebserver()
+
+    def _startJobs(self):
+        """
+        Once the minecraft server is started: the daemon observer, the backups and the dispatcher
+        """
         self.daemon.start()
+        # periodic backups, and checking them in the background while the server is empty
+        self.mc_server.backups.scheduler.start()
+        self.mc_server.backups.startVerifier()
+        self._startDispatcher()
     
+    @property
+    def log_path(self) -> str:
+        return os.path.join(config()["server_dir"], "logs", "latest.log")
+
+    def startReplay(self, cmd_interface: Optional[Callable[[str], Any]] = None):
+        """
+        Prepare the listener for replaying old logs instead of running the minecraft server,
+        observers can be registered afterwards as usual
+         - cmd_interface: receives the commands sent by observers, they are dropped by default
+        """
+        if cmd_interface is None:
+            cmd_interface = lambda x: None
+        self._setServer(Server(cmd_interface))
+
+        # created so that daemon callbacks can be added, but not started
+        self.daemon = DaemonObserver()
+
+        self._startDispatcher()
+
     def _startWebserver(self) -> Process:
         # Start broadcast server process
         self._web_proc = Process(
@@ -0,0 +1,138 @@
+"""
+Follow logs/latest.log of a running server, like `tail -F`
+"""
+import os, sys, time, struct, ctypes, ctypes.util
+from typing import BinaryIO, Iterator, List, Optional
+
+class Inotify:
+    """
+    Minimal inotify binding (linux), watching one directory
+    """
+    IN_MODIFY = 0x00000002
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+
+    _EVENT_HEADER = struct.Struct("iIII")       # wd, mask, cookie, len
+
+    def __init__(self, directory: str, mask: int) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, "inotify_add_watch failed: {}".format(directory))
+
+    def read(self) -> List[str]:
+        """
+        Block until there are events, return names of the files involved
+        """
+        data = os.read(self.fd, 64 * 1024)
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = self._EVENT_HEADER.unpack_from(data, offset)
+            offset += self._EVENT_HEADER.size
+            names.append(data[offset: offset + length].rstrip(b"\x00").decode("utf-8", errors="replace"))
+            offset += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+class LogFollower:
+    """
+    Yield lines appended to the log file, surviving rotation (the file being renamed and re-created)
+    and truncation.
+    Waits on inotify, falls back to polling where inotify is not available.
+    """
+    def __init__(self, path: str, from_start: bool = False, poll_interval: float = 0.5) -> None:
+        """
+         - from_start: yield the lines already in the file, otherwise start from its end
+        """
+        self.path = os.path.abspath(path)
+        self.from_start = from_start
+        self.poll_interval = poll_interval
+        self._fp: Optional[BinaryIO] = None
+        self._partial = b""
+        self._watcher: Optional[Inotify] = None
+
+        if sys.platform.startswith("linux"):
+            try:
+                self._watcher = Inotify(
+                    os.path.dirname(self.path),
+                    Inotify.IN_MODIFY | Inotify.IN_CREATE | Inotify.IN_MOVED_TO | Inotify.IN_MOVED_FROM | Inotify.IN_DELETE
+                )
+            except (OSError, AttributeError) as e:
+                print("inotify not available ({}), polling the log file instead".format(e))
+
+    def _wait(self):
+        if self._watcher is not None:
+            self._watcher.read()
+        else:
+            time.sleep(self.poll_interval)
+
+    def _open(self, seek_end: bool) -> bool:
+        try:
+            self._fp = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+        if seek_end:
+            self._fp.seek(0, os.SEEK_END)
+        self._partial = b""
+        return True
+
+    def _readAvailable(self) -> Iterator[str]:
+        assert self._fp is not None
+        while True:
+            chunk = self._fp.read(64 * 1024)
+            if not chunk:
+                return
+            lines = (self._partial + chunk).split(b"\n")
+            self._partial = lines.pop()
+            for line in lines:
+                yield line.decode("utf-8", errors="replace") + "\n"
+
+    def _replaced(self) -> bool:
+        """
+        Whether the path now refers to another file
+        """
+        assert self._fp is not None
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False        # wait for the new file
+        return st.st_ino != os.fstat(self._fp.fileno()).st_ino
+
+    def lines(self) -> Iterator[str]:
+        if not self._open(seek_end = not self.from_start):
+            # lines of a file created later are all new
+            while not self._open(seek_end = False):
+                self._wait()
+        try:
+            while True:
+                yield from self._readAvailable()
+                assert self._fp is not None
+                if self._replaced():
+                    # rotated, drain the old file then follow the new one from its start
+                    yield from self._readAvailable()
+                    self._fp.close()
+                    while not self._open(seek_end = False):
+                        self._wait()
+                    continue
+                if os.fstat(self._fp.fileno()).st_size < self._fp.tell():
+                    # truncated
+                    self._fp.seek(0)
+                    self._partial = b""
+                    continue
+                self._wait()
+        finally:
+            if self._fp is not None:
+                self._fp.close()
+
+    def close(self):
+        if self._watcher is not None:
+            self._watcher.close()
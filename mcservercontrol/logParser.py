@@ -0,0 +1,85 @@
+"""
+Single-pass parser for minecraft server log lines,
+all patterns are compiled once at import time
+"""
+import re
+from typing import List, Literal, NamedTuple, Optional, Tuple
+
+LINE_KIND = Literal[
+    "general",
+    "login",
+    "logout",
+    "speak",
+    "cmd",
+    "listplayer",
+]
+
+# [12:34:56] [Server thread/INFO]: <message>
+# the characters excluded from the brackets follow the legacy splitter
+_HEADER_RE = re.compile(r"\[([^\[\]^]*)\][^\[\]]+\[([^\[\]^/]*)(?:/([^\[\]^]*))?\]: ")
+_ONLINE_RE = re.compile(r"There are \d* of a max of \d* players online:(.*)", re.DOTALL)
+_CHAT_RE = re.compile(r"<([^<>^]*)>.?(.*)", re.DOTALL)
+
+class ParsedLine(NamedTuple):
+    kind: LINE_KIND
+    time: str
+    thread: str
+    level: str
+    message: str
+    names: Tuple[str, ...]                          # names of the players involved
+    content: str = ""                               # what the player said
+    cmd_split: Optional[Tuple[str, List[str]]] = None
+
+class LogLineParser:
+    """
+    Recognise the header, thread/level and message kind of a log line in one pass
+    """
+    def parseHeader(self, line: str) -> Optional[Tuple[str, str, str, str]]:
+        """
+        return (time, thread, level, message) or None for non-standard lines
+        """
+        m = _HEADER_RE.match(line)
+        if m is None:
+            return None
+        time, thread, level = m.groups()
+        return time, thread, level or "", line[m.end():]
+
+    def parse(self, line: str) -> Optional[ParsedLine]:
+        """
+        return None if the line does not have a standard header
+        """
+        m = _HEADER_RE.match(line)
+        if m is None:
+            return None
+        time, thread, level = m.groups()
+        level = level or ""
+        message = line[m.end():]
+
+        # join/leave markers take precedence anywhere in the message, as they always did;
+        # a plain substring search is cheaper than any regex for these literals
+        idx = message.find("joined the game")
+        if idx >= 0:
+            return ParsedLine("login", time, thread, level, message, (message[:idx].strip(), ))
+
+        idx = message.find("left the game")
+        if idx >= 0:
+            return ParsedLine("logout", time, thread, level, message, (message[:idx].strip(), ))
+
+        first = message[:1]
+        if first == "T":
+            m = _ONLINE_RE.match(message)
+            if m is not None:
+                names = tuple(n.strip() for n in m.group(1).strip("\n").split(",") if n.strip())
+                return ParsedLine("listplayer", time, thread, level, message, names)
+
+        elif first == "<":
+            m = _CHAT_RE.match(message)
+            if m is not None:
+                name, words = m.groups()
+                if words.startswith("\\"):
+                    cmd_raw_split: List[str] = words[1:].strip("\n").split(" ")
+                    cmd_split = (cmd_raw_split[0], cmd_raw_split[1:])
+                    return ParsedLine("cmd", time, thread, level, message, (name, ), cmd_split=cmd_split)
+                return ParsedLine("speak", time, thread, level, message, (name, ), content=words)
+
+        return ParsedLine("general", time, thread, level, message, ())
@@ -1,6 +1,6 @@
 from __future__ import annotations
 import json
-from typing import Any, Callable, Dict, List, Optional, Type, Union, TypeVar
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple, Type, Union, TypeVar
 from abc import abstractmethod, ABC
 import time
 from threading import Thread
@@ -9,6 +9,8 @@ from mcservercontrol.server import COLOR_T
 from .configReader import VERSION
 from .timeUtils import TimeUtils
 from .player import Player
+from .playerRegistry import PlayerRegistry
+from .onlineIndex import OnlineIndex
 from . import globalVar
 
 
@@ -22,18 +24,40 @@ class Observer():
         self.cmd: Callable[[str], Any] = self.server.cmd
 
         # set when registered to the listerner
-        self._all_players : dict[str, Player]
+        self._all_players : PlayerRegistry
+        self._online : OnlineIndex
 
     @property
-    def players(self) -> dict[str, Player]:
+    def players(self) -> PlayerRegistry:
         return self._all_players
 
+    @property
+    def online(self) -> OnlineIndex:
+        """
+        The players online, use it instead of going through all the players
+        """
+        return self._online
+
     def __init_subclass__(cls, flag: Optional[str] = None, **kwargs) -> None:
         super().__init_subclass__(**kwargs)
         if flag:
             cls.subclasses[flag] = cls
 
+HOOK_T = Literal["onPlayerLogin", "onPlayerLogout", "onPlayerSpeak"]
+
 class PlayerObserver(Observer, ABC):
+    HOOKS: Tuple[HOOK_T, ...] = ("onPlayerLogin", "onPlayerLogout", "onPlayerSpeak")
+
+    def subscribedHooks(self) -> List[HOOK_T]:
+        """
+        Hooks actually implemented by this observer, 
+        the listener will not call the hooks inherited from PlayerObserver
+        """
+        return [
+            hook for hook in self.HOOKS 
+            if getattr(type(self), hook) is not getattr(PlayerObserver, hook) or hook in vars(self)
+        ]
+
     def onPlayerLogin(self, player: Player):
         ...
 
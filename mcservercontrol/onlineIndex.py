@@ -0,0 +1,82 @@
+"""
+The players online, kept up to date by the listener from the login, logout and listplayer events
+"""
+import bisect
+from threading import Lock
+from typing import TYPE_CHECKING, Dict, Iterable, List
+
+from .player import Player
+
+if TYPE_CHECKING:
+    from .listenerBase import EVENT_ALL
+
+class OnlineIndex:
+    """
+    Online players by name, with the names sorted for prefix lookups
+    """
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._players: Dict[str, Player] = {}
+        self._names: List[str] = []         # sorted
+
+    def feed(self, event: "EVENT_ALL"):
+        """
+        Called by the listener with every event
+        """
+        etype = event["etype"]
+        if etype == "login":
+            self.add(event["player"])
+        elif etype == "logout":
+            self.remove(event["player"].name)
+        elif etype == "listplayer":
+            self.reconcile(event["players"])
+
+    def add(self, player: Player):
+        with self._lock:
+            if player.name not in self._players:
+                bisect.insort(self._names, player.name)
+            self._players[player.name] = player
+
+    def remove(self, name: str):
+        with self._lock:
+            if self._players.pop(name, None) is not None:
+                del self._names[bisect.bisect_left(self._names, name)]
+
+    def reconcile(self, players: Iterable[Player]):
+        """
+        Replace the players online, e.g. with the reply of /list
+        """
+        with self._lock:
+            self._players = {p.name: p for p in players}
+            self._names = sorted(self._players)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._players
+
+    def __len__(self) -> int:
+        return len(self._players)
+
+    def get(self, name: str):
+        return self._players.get(name)
+
+    def players(self) -> List[Player]:
+        with self._lock:
+            return list(self._players.values())
+
+    def names(self) -> List[str]:
+        """
+        Sorted
+        """
+        with self._lock:
+            return list(self._names)
+
+    def withPrefix(self, prefix: str) -> List[str]:
+        """
+        Sorted names starting with prefix
+        """
+        with self._lock:
+            i = bisect.bisect_left(self._names, prefix)
+            j = i
+            while j < len(self._names) and self._names[j].startswith(prefix):
+                j += 1
+            return self._names[i:j]
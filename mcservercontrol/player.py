@@ -1,105 +1,207 @@
 """
 Abstraction of the player
 """
-import os, pickle, hashlib
-from typing import Any, Optional
-from .configReader import config
+import hashlib
+from typing import Any, Callable, ClassVar, Dict, List, NamedTuple, Optional, Set, Tuple, Type, Union
 from .timeUtils import TimeUtils
+from .statusStore import getStatusStore
+
+class StatusField(NamedTuple):
+    type: Union[Type, Tuple[Type, ...]]
+    default: Any
+    persistent: bool
+    factory: Optional[Callable[[], Any]] = None     # for the defaults that should not be shared, e.g. list
+
+    def make(self) -> Any:
+        return self.factory() if self.factory is not None else self.default
+
+# status every player has, kept in slots
+_BUILTIN = ("is_online", "time_login", "time_online", "time_online_today")
 
 class PlayerStatus:
+    """
+    The built-in status are slots, the status of the addons are kept in one dict.
+    Addons declare their status with `PlayerStatus.register`, to get typed defaults and persistence
+    without calling setdefault for every player; status not registered can still be set at any time.
+    """
     # default status
     is_online: bool
     time_login: float
     time_online: float                  # Total online time since server start (befor this login)
     time_online_today: float            # Total online time since today (befor this login)
 
-    @property
-    def record_dir(self):
-        # save dir
-        d = os.path.join(config()["world_conf_dir"], "player_status")
-        if not os.path.exists(d):
-            print("Created status record_dir: ", d)
-            os.mkdir(d)
-        return d
+    __slots__ = _BUILTIN + ("_extra", "_persistent", "_dirty", "_saving")
+
+    SCHEMA: ClassVar[Dict[str, StatusField]] = {
+        "is_online": StatusField(bool, False, persistent=False),
+        "time_login": StatusField((int, float), None, persistent=True, factory=TimeUtils.nowStamp),
+        "time_online": StatusField((int, float), 0, persistent=True),
+        "time_online_today": StatusField((int, float), 0, persistent=True),
+    }
+
+    @classmethod
+    def register(
+            cls, name: str, type: Union[Type, Tuple[Type, ...]], default: Any = None,
+            persistent: bool = False, factory: Optional[Callable[[], Any]] = None
+            ):
+        """
+        Declare a status of every player, registering the same field again has no effect
+         - type: of the value, values loaded from the status store of another type are dropped
+         - persistent: saved to the status store, should be json serializable
+         - factory: called for the default value instead of sharing `default` between players
+        """
+        field = StatusField(type, default, persistent, factory)
+        if name.startswith("_"):
+            raise ValueError("Invalid status name: {}".format(name))
+        if name in cls.SCHEMA and cls.SCHEMA[name] != field:
+            raise ValueError("Status {} is already registered as {}".format(name, cls.SCHEMA[name]))
+        cls.SCHEMA[name] = field
 
     def __init__(self, **kwargs) -> None:
+        self._extra: Dict[str, Any] = {}                    # values of the status not built in
+        self._persistent: Optional[Dict[str, bool]] = None  # persistence set by `set`, when it differs from the schema
+        # names of the values changed since the last save, tracked by __setattr__
+        self._dirty: Set[str] = set()
+        # names of the values being saved, until the save succeeds
+        self._saving: Set[str] = set()
         self.is_online = False
         self.time_login = TimeUtils.nowStamp()
         self.time_online = 0
         self.time_online_today = 0
 
-        self.__keys = ["is_online", "time_login", "time_online", "time_online_today"] 
-        self.__persistent_keys = ["time_login", "time_online", "time_online_today"]
-
         for k, v in kwargs.items():
             self.set(k, v)
+        # the initial values are not changes
+        self._dirty.clear()
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        # values are also assigned directly, e.g. status.time_online += t;
+        # marked dirty after the assignment, so that a save beginning meanwhile saves it again
+        if name in _BUILTIN:
+            object.__setattr__(self, name, value)
+            self._dirty.add(name)
+        elif name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            self._extra[name] = value
+            self._dirty.add(name)
+
+    def __getattr__(self, name: str) -> Any:
+        # not a slot
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self._extra[name]
+        except KeyError:
+            ...
+        field = self.SCHEMA.get(name)
+        if field is None:
+            raise AttributeError("No player status: {}".format(name))
+        value = self._extra[name] = field.make()
+        return value
 
     def setdefault(self, name: str, value: Any, persistent: Optional[bool] = None) -> Any:
         if not self.has(name):
             self.set(name, value, persistent)
-            if name not in self.__keys:
-                self.__keys.append(name)
         return self.get(name)
 
     def has(self, name):
         """
         use this instead of hasattr() to check value existance
         """
-        return name in self.__keys
+        return name in _BUILTIN or name in self._extra or name in self.SCHEMA
 
     def set(self, name: str, value: Any, persistent: Optional[bool] = None):
         """
-         - persistent: will be saved to record_dir, so the value can be persistent after program exit
+         - persistent: will be saved to the status store, so the value can be persistent after program exit,
+            should be json serializable; default to the registered persistence, or not persistent
         """
-        if name not in self.__keys:
-            self.__keys.append(name)
-
         if persistent is not None:
-            if persistent:
-                if name not in self.__persistent_keys:
-                    self.__persistent_keys.append(name)
+            field = self.SCHEMA.get(name)
+            if persistent == (field is not None and field.persistent):
+                if self._persistent is not None:
+                    self._persistent.pop(name, None)
             else:
-                if name in self.__persistent_keys:
-                    self.__persistent_keys.pop(self.__persistent_keys.index(name))
-
+                if self._persistent is None:
+                    self._persistent = {}
+                self._persistent[name] = persistent
         setattr(self, name, value)
 
     def get(self, name: str) -> Any:
         return getattr(self, name)
 
-    def toDict(self):
-        d = {}
-        for k in self.__keys:
-            d[k] = self.get(k)
+    def isPersistent(self, name: str) -> bool:
+        if self._persistent is not None and name in self._persistent:
+            return self._persistent[name]
+        field = self.SCHEMA.get(name)
+        return field is not None and field.persistent
+
+    def toDict(self) -> Dict[str, Any]:
+        d = {k: object.__getattribute__(self, k) for k in _BUILTIN}
+        d.update(self._extra)
         return d
 
-    def saveToFile(self, fname: str):
+    def persistentKeys(self) -> List[str]:
+        return [k for k in _BUILTIN + tuple(self._extra) if self.isPersistent(k)]
+
+    def persistentDict(self, checkpoint: bool = False) -> Dict[str, Any]:
         """
-        Save persistent status to self.record_dir/fname.status
+        The values to save to the status store
+         - checkpoint: if the player is online, count the current session as if the player logged out now,
+            so that it is not lost if the program stops without the logout
         """
-        st = dict()
-        for k in self.__persistent_keys:
-            st[k] = self.get(k)
-        with open(os.path.join(self.record_dir, fname + ".status"), "wb") as fp:
-            pickle.dump(st, fp)
-        print("saved status record: ", fname)
+        st = {k: self.get(k) for k in self.persistentKeys()}
+        if checkpoint and self.is_online:
+            now = TimeUtils.nowStamp()
+            session = max(now - self.time_login, 0)
+            st["time_online"] = self.time_online + session
+            st["time_online_today"] = self.time_online_today + session
+            st["time_login"] = now
+        return st
 
-    def loadFromFile(self, fname: str) -> bool:
+    def loadDict(self, st: Dict[str, Any]):
         """
-        Load persistent status from self.record_dir/fname.status
+        Load the values saved to the status store
         """
-        f_path = os.path.join(self.record_dir, fname + ".status")
-        if not os.path.exists(f_path):
-            print("No status file found ({}), skip loading".format(f_path))
-            return False
-
-        with open(f_path, "rb") as fp:
-            st = pickle.load(fp)
         for k, v in st.items():
-            self.set(k, v, persistent=True)
-        print("loaded status record: ", fname)
+            field = self.SCHEMA.get(k)
+            if field is None:
+                self.set(k, v, persistent=True)
+            elif isinstance(v, field.type):
+                self.set(k, v)
+            else:
+                print("Dropped saved status {}: {!r} is not of type {}".format(k, v, field.type))
+        # the values are saved already
+        self._dirty.difference_update(st)
 
-        return True
+    @property
+    def dirty(self) -> bool:
+        """
+        If a persistent value changed since the last save, or is being saved
+        """
+        return any(self.isPersistent(k) for k in list(self._dirty) + list(self._saving))
+
+    def beginSave(self):
+        """
+        Called before the values are read for saving,
+        the status stays dirty until endSave, the changes made meanwhile are saved the next time
+        """
+        self._saving = self._saving | self._dirty
+        self._dirty = set()
+
+    def endSave(self, ok: bool = True):
+        """
+         - ok: if the save succeeded, otherwise the values being saved are saved the next time
+        """
+        if not ok:
+            self._dirty.update(self._saving)
+        self._saving = set()
+
+    def markDirty(self):
+        """
+        Save all the persistent values the next time, e.g. after a failed save
+        """
+        self._dirty.update(self.persistentKeys())
 
     def __str__(self) -> str:
         return "PlayerStatus: " + str(self.toDict())
@@ -110,7 +212,32 @@ class PlayerStatus:
 class Player:
     def __init__(self, name: str, status_dict: dict = {}) -> None:
         self._name = name
-        self.status = PlayerStatus(**status_dict)
+        self._status = PlayerStatus(**status_dict)
+        self._loaded = False
+        self._load_on_access = False
+
+    @classmethod
+    def fromStore(cls, name: str) -> "Player":
+        """
+        The status is loaded from the status store when it is first accessed
+        """
+        player = cls(name)
+        player._load_on_access = True
+        return player
+
+    @property
+    def status(self) -> PlayerStatus:
+        if self._load_on_access:
+            self._load_on_access = False
+            self.loadStatus()
+        return self._status
+
+    @property
+    def status_loaded(self) -> bool:
+        """
+        False if the status was not accessed since the player was created by fromStore
+        """
+        return not self._load_on_access
 
     @property
     def name(self) -> str:
@@ -121,10 +248,27 @@ class Player:
         return hashlib.sha256(string.encode("utf-8")).hexdigest()[::2]
 
     def saveStatus(self):
-        fname = self._hash(self.name)
-        self.status.saveToFile(fname)
+        self._status.beginSave()
+        try:
+            getStatusStore().save(self._hash(self.name), self._status.persistentDict())
+        except Exception:
+            self._status.endSave(ok = False)
+            raise
+        self._status.endSave()
 
-    def loadStatus(self):
-        fname = self._hash(self.name)
-        self.status.loadFromFile(fname)
+    def loadStatus(self) -> bool:
+        """
+        Load the saved status, once: afterwards the status in memory is the newer one,
+        it is saved by the StatusFlusher
+        return False if the player has no saved status
+        """
+        self._load_on_access = False
+        if self._loaded:
+            return True
+        self._loaded = True
+        st = getStatusStore().load(self._hash(self.name))
+        if st is None:
+            return False
+        self._status.loadDict(st)
+        return True
 
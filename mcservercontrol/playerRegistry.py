@@ -0,0 +1,104 @@
+"""
+The players in memory: the online players, and the offline players used the most recently
+"""
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from threading import RLock
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .player import Player
+from .onlineIndex import OnlineIndex
+
+class PlayerRegistry(MutableMapping):
+    """
+    Mapping of player name to Player, `registry[name]` never raises KeyError:
+    a player not in memory is created, its status is loaded from the status store when first accessed.
+    Beyond `capacity`, the offline players used the least recently are dropped from memory,
+    once their status is saved; online players are never dropped.
+    Iterating only goes through the players in memory.
+    """
+    def __init__(self, capacity: int = 256, online: Optional[OnlineIndex] = None) -> None:
+        """
+         - online: the players in it are never dropped, whatever their status says
+            (e.g. added from the reply of /list without a login)
+        """
+        self.capacity = capacity
+        self.online = online if online is not None else OnlineIndex()
+        self._lock = RLock()
+        self._players: "OrderedDict[str, Player]" = OrderedDict()
+        self.registry_stats: Dict[str, int] = {
+            "hits": 0,
+            "loaded": 0,        # players created, to be loaded from the status store
+            "evicted": 0,
+        }
+
+    def __getitem__(self, name: str) -> Player:
+        with self._lock:
+            player = self._players.get(name)
+            if player is not None:
+                self._players.move_to_end(name)
+                self.registry_stats["hits"] += 1
+                return player
+            player = Player.fromStore(name)
+            self.registry_stats["loaded"] += 1
+            self._players[name] = player
+            self.evict()
+            return player
+
+    def __setitem__(self, name: str, player: Player):
+        with self._lock:
+            self._players[name] = player
+            self._players.move_to_end(name)
+            self.evict()
+
+    def __delitem__(self, name: str):
+        with self._lock:
+            del self._players[name]
+
+    def __contains__(self, name: object) -> bool:
+        """
+        If the player is in memory
+        """
+        return name in self._players
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._players))
+
+    def __len__(self) -> int:
+        return len(self._players)
+
+    def values(self) -> List[Player]:      # type: ignore[override]
+        """
+        The players in memory, without counting as an access
+        """
+        with self._lock:
+            return list(self._players.values())
+
+    def items(self) -> List[Tuple[str, Player]]:       # type: ignore[override]
+        with self._lock:
+            return list(self._players.items())
+
+    def evict(self) -> int:
+        """
+        Drop offline players with their status saved (or never loaded), from the least recently used,
+        until within capacity; the player used last is kept
+        return the number of players dropped
+        """
+        with self._lock:
+            n_over = len(self._players) - self.capacity
+            if n_over <= 0:
+                return 0
+            evicted = []
+            for name, player in list(self._players.items())[:-1]:
+                if len(evicted) >= n_over:
+                    break
+                if name in self.online:
+                    continue
+                if player.status_loaded and (player.status.is_online or player.status.dirty):
+                    continue
+                evicted.append(name)
+            for name in evicted:
+                del self._players[name]
+            self.registry_stats["evicted"] += len(evicted)
+            return len(evicted)
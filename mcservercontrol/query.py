@@ -0,0 +1,248 @@
+"""
+Command request/response correlation,
+the response of a command is recognised from the server log by a matcher of the command
+"""
+import re
+from concurrent.futures import Future, InvalidStateError
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Pattern, Type
+
+from .logParser import LogLineParser
+from .scheduler import SCHEDULE_ID, getScheduler
+
+class QueryError(Exception):
+    """
+    The server responded with an error message
+    """
+
+class ResponseMatcher:
+    """
+    One matcher instance per query,
+    subclass it and set `pattern` (and maybe override `feed` and `result`) for other commands
+    """
+    # the first response line, None to accept any line (from the log, only lines no other pending query matches)
+    pattern: Optional[Pattern[str]] = None
+    error_pattern: Optional[Pattern[str]] = None      # error responses, the query fails with QueryError
+
+    def __init__(self) -> None:
+        self.messages: List[str] = []
+        self.error: Optional[str] = None
+
+    def match(self, message: str) -> bool:
+        """
+        Whether the log message is (part of) the response
+        """
+        if self.error_pattern is not None and self.error_pattern.match(message):
+            return True
+        return self.pattern is None or self.pattern.match(message) is not None
+
+    def feed(self, message: str) -> bool:
+        """
+        return True when the response is complete
+        """
+        if self.error_pattern is not None and self.error_pattern.match(message):
+            self.error = message.strip()
+            return True
+        self.messages.append(message)
+        return True
+
+    def result(self) -> Any:
+        return self.messages[0].strip()
+
+class ListMatcher(ResponseMatcher):
+    """
+    /list -> {"online": int, "max": int, "players": [names]}
+    """
+    pattern = re.compile(r"There are (\d+) of a max of (\d+) players online:(.*)", re.DOTALL)
+
+    def result(self) -> Dict[str, Any]:
+        m = self.pattern.match(self.messages[0])
+        assert m is not None
+        names = [n.strip() for n in m.group(3).split(",") if n.strip()]
+        return {"online": int(m.group(1)), "max": int(m.group(2)), "players": names}
+
+class DataGetMatcher(ResponseMatcher):
+    """
+    /data get ... -> the data in SNBT, as a string
+    """
+    pattern = re.compile(r".* has the following (entity|block|storage) data: (.*)", re.DOTALL)
+    error_pattern = re.compile(r"(No entity was found|Found no elements matching|The target block is not a block entity|That position is not loaded)")
+
+    def result(self) -> str:
+        m = self.pattern.match(self.messages[0])
+        assert m is not None
+        return m.group(2).strip()
+
+class SaveMatcher(ResponseMatcher):
+    """
+    /save-all -> "Saved the game"
+    """
+    pattern = re.compile(r"Saved the game")
+
+# response matchers by command name
+MATCHERS: Dict[str, Type[ResponseMatcher]] = {
+    "list": ListMatcher,
+    "data": DataGetMatcher,
+    "save-all": SaveMatcher,
+}
+
+def matcherFor(command: str, default: Optional[Type[ResponseMatcher]] = None) -> ResponseMatcher:
+    """
+    Matcher by command name, `execute ... run <command>` uses the matcher of <command>
+     - default: matcher of unknown commands, raise ValueError if None
+    """
+    command = command.strip().lstrip("/")
+    if command.startswith("execute ") and " run " in command:
+        command = command.split(" run ", 1)[1].strip().lstrip("/")
+    name = command.split(" ", 1)[0]
+    matcher = MATCHERS.get(name, default)
+    if matcher is None:
+        raise ValueError("No response matcher for command: {}, pass a matcher (see query.MATCHERS)".format(name))
+    return matcher()
+
+class _Query:
+    def __init__(self, command: str, matcher: ResponseMatcher) -> None:
+        self.command = command
+        self.matcher = matcher
+        self.future: "Future[Any]" = Future()
+        self.timer: Optional[SCHEDULE_ID] = None
+
+class QueryManager:
+    """
+    Pending queries in the order their commands were sent,
+    a log message is the response of the first pending query that matches it,
+    matchers accepting any line only get the lines no other pending query matches
+    """
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._pending: List[_Query] = []
+        self._header_parser = LogLineParser()
+
+    def submit(
+            self,
+            command: str,
+            send: Callable[[str], Any],
+            matcher: Optional[ResponseMatcher] = None,
+            timeout: Optional[float] = 5
+            ) -> "Future[Any]":
+        """
+        Send the command and return a future resolved by the response
+         - timeout: seconds, the future fails with TimeoutError afterwards
+        """
+        if matcher is None:
+            matcher = matcherFor(command)
+        q = _Query(command, matcher)
+        with self._lock:
+            self._pending.append(q)
+            send(command)
+        if timeout is not None:
+            q.timer = getScheduler().schedule(lambda: self._expire(q), timeout)
+        return q.future
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _remove(self, q: _Query) -> bool:
+        with self._lock:
+            if q not in self._pending:
+                return False
+            self._pending.remove(q)
+        return True
+
+    def _expire(self, q: _Query):
+        if self._remove(q):
+            q.future.set_exception(TimeoutError("No response for: {}".format(q.command)))
+
+    def feed(self, log_line: str):
+        """
+        Called with every server log line
+        """
+        if not self._pending:
+            return
+        header = self._header_parser.parseHeader(log_line)
+        if header is None:
+            return
+        message = header[3]
+
+        with self._lock:
+            fallback: Optional[_Query] = None
+            for q in self._pending:
+                if not q.matcher.match(message):
+                    continue
+                if q.matcher.pattern is not None:
+                    break
+                if fallback is None:
+                    fallback = q
+            else:
+                if fallback is None:
+                    return
+                q = fallback
+            if not q.matcher.feed(message):
+                # multi-line response
+                return
+            self._pending.remove(q)
+
+        self._resolve(q)
+
+    def submitDirect(
+            self,
+            command: str,
+            request: Callable[[str], "Future[str]"],
+            matcher: Optional[ResponseMatcher] = None,
+            timeout: Optional[float] = 5
+            ) -> "Future[Any]":
+        """
+        For transports that return the response text directly (e.g. RCON),
+        the response is parsed by the matcher instead of being scraped from the log,
+        unknown commands get the first line of their response
+        """
+        if matcher is None:
+            matcher = matcherFor(command, default = ResponseMatcher)
+        q = _Query(command, matcher)
+
+        def _onResponse(f: "Future[str]"):
+            error = f.exception()
+            if error is not None:
+                self._fail(q, error)
+                return
+            for line in f.result().split("\n"):
+                if q.matcher.match(line) and q.matcher.feed(line):
+                    self._resolve(q)
+                    return
+            self._fail(q, QueryError("Unexpected response: {}".format(f.result())))
+
+        if timeout is not None:
+            q.timer = getScheduler().schedule(
+                lambda: self._fail(q, TimeoutError("No response for: {}".format(q.command))), timeout
+            )
+        request(command).add_done_callback(_onResponse)
+        return q.future
+
+    @staticmethod
+    def _cancelTimer(q: _Query):
+        if q.timer is not None:
+            getScheduler().cancel(q.timer)
+
+    def _fail(self, q: _Query, error: BaseException):
+        self._cancelTimer(q)
+        try:
+            q.future.set_exception(error)
+        except InvalidStateError:
+            # resolved or expired in the meantime
+            ...
+
+    def _resolve(self, q: _Query):
+        self._cancelTimer(q)
+        if q.matcher.error is not None:
+            self._fail(q, QueryError(q.matcher.error))
+            return
+        try:
+            result = q.matcher.result()
+        except Exception as e:
+            self._fail(q, e)
+            return
+        try:
+            q.future.set_result(result)
+        except InvalidStateError:
+            # expired in the meantime
+            ...
@@ -0,0 +1,236 @@
+"""
+RCON client, an alternative command channel to the stdin of the minecraft server.
+Enable it in server.properties: enable-rcon=true, rcon.port, rcon.password
+"""
+import time, socket, struct, itertools
+from concurrent.futures import Future
+from collections import deque
+from threading import Lock, RLock, Thread
+from typing import Deque, List, Optional, Tuple
+
+from .configReader import config
+from .scheduler import SCHEDULE_ID, getScheduler
+
+# packet types
+_TYPE_COMMAND = 2
+_TYPE_AUTH_RESPONSE = 2
+_TYPE_AUTH = 3
+# not a valid type, sent once the response to a command has started: the server answers it ("Unknown request")
+# after the whole response, which may be split into several packets
+_TYPE_END_MARKER = 100
+
+class RconError(Exception):
+    ...
+
+def encodePacket(request_id: int, ptype: int, body: str) -> bytes:
+    payload = struct.pack("<ii", request_id, ptype) + body.encode("utf-8") + b"\x00\x00"
+    return struct.pack("<i", len(payload)) + payload
+
+def _recvExact(sock: socket.socket, n: int) -> bytes:
+    buf = b""
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("RCON connection closed")
+        buf += chunk
+    return buf
+
+def readPacket(sock: socket.socket) -> Tuple[int, int, str]:
+    """
+    return (request_id, type, body)
+    """
+    length, = struct.unpack("<i", _recvExact(sock, 4))
+    payload = _recvExact(sock, length)
+    request_id, ptype = struct.unpack("<ii", payload[:8])
+    return request_id, ptype, payload[8:-2].decode("utf-8", errors="replace")
+
+class _Request:
+    def __init__(self, command: str) -> None:
+        self.command = command
+        self.request_id = 0
+        self.marker_id = 0
+        self.marker_sent = False
+        self.future: "Future[str]" = Future()
+        self.parts: List[str] = []
+        self.timer: Optional[SCHEDULE_ID] = None
+
+class RconClient:
+    """
+    Persistent connection, reconnected on demand.
+    One request in flight per connection, the others wait in order:
+    the vanilla server handles a single packet per read, and drops the connection otherwise.
+    Responses are matched to the request by request id on a reader thread.
+    Can be used as the command interface of Server: `Server(cmd_interface=RconClient.fromConfig())`
+    """
+    def __init__(self, host: str, port: int, password: str, timeout: float = 5, reconnect_delay: float = 1) -> None:
+        """
+         - timeout: seconds to connect, and to wait for a response (the future fails with TimeoutError)
+         - reconnect_delay: min seconds between connection attempts
+        """
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.reconnect_delay = reconnect_delay
+
+        self._sock: Optional[socket.socket] = None
+        self._conn_lock = Lock()            # connecting
+        self._lock = RLock()                # the requests, and sending
+        self._ids = itertools.count(1)
+        self._current: Optional[_Request] = None    # in flight
+        self._queue: Deque[_Request] = deque()
+        self._last_attempt = 0.
+
+    @classmethod
+    def fromConfig(cls) -> "RconClient":
+        return cls(config()["rcon_host"], config()["rcon_port"], config()["rcon_password"])
+
+    @property
+    def connected(self) -> bool:
+        return self._sock is not None
+
+    def connect(self):
+        with self._conn_lock:
+            if self._sock is not None:
+                return
+            if time.monotonic() - self._last_attempt < self.reconnect_delay:
+                raise RconError("RCON not connected, retry later")
+            self._last_attempt = time.monotonic()
+
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            try:
+                auth_id = next(self._ids)
+                sock.sendall(encodePacket(auth_id, _TYPE_AUTH, self.password))
+                while True:
+                    request_id, ptype, _ = readPacket(sock)
+                    if ptype == _TYPE_AUTH_RESPONSE:
+                        break
+                if request_id == -1:
+                    raise RconError("RCON authentication failed")
+            except Exception:
+                sock.close()
+                raise
+            # the reader thread blocks on the socket
+            sock.settimeout(None)
+            self._sock = sock
+            Thread(target=self._readLoop, args=(sock, ), name="rcon-reader", daemon=True).start()
+
+    def close(self):
+        with self._conn_lock:
+            if self._sock is not None:
+                self._disconnect(self._sock, RconError("RCON connection closed"))
+
+    def _disconnect(self, sock: socket.socket, error: Exception):
+        with self._lock:
+            try:
+                sock.close()
+            except OSError:
+                ...
+            if self._sock is not None and self._sock is not sock:
+                # a former connection, its requests have failed already
+                return
+            self._sock = None
+            failed = list(self._queue)
+            if self._current is not None:
+                failed.insert(0, self._current)
+            self._current = None
+            self._queue.clear()
+        for req in failed:
+            self._fail(req, error)
+
+    @staticmethod
+    def _fail(req: _Request, error: BaseException):
+        if req.timer is not None:
+            getScheduler().cancel(req.timer)
+        if not req.future.done():
+            req.future.set_exception(error)
+
+    def _send(self, sock: socket.socket, packet: bytes):
+        try:
+            sock.sendall(packet)
+        except OSError as e:
+            # fails the pending requests, the next request reconnects
+            self._disconnect(sock, RconError("RCON connection lost: {}".format(e)))
+
+    def _sendNext(self):
+        """
+        Send the next waiting request, if none is in flight, called with self._lock held
+        """
+        while self._current is None and self._queue:
+            req = self._queue.popleft()
+            sock = self._sock
+            if sock is None:
+                self._fail(req, RconError("RCON connection lost"))
+                continue
+            req.request_id, req.marker_id = next(self._ids), next(self._ids)
+            self._current = req
+            self._send(sock, encodePacket(req.request_id, _TYPE_COMMAND, req.command))
+
+    def _expire(self, req: _Request):
+        with self._lock:
+            if req is self._current:
+                # a late response does not match the next request id
+                self._current = None
+                self._sendNext()
+            elif req in self._queue:
+                self._queue.remove(req)
+            else:
+                return
+        self._fail(req, TimeoutError("No RCON response within {}s".format(self.timeout)))
+
+    def _readLoop(self, sock: socket.socket):
+        try:
+            while True:
+                packet_id, _, body = readPacket(sock)
+                with self._lock:
+                    req = self._current
+                    if req is None:
+                        # expired
+                        continue
+                    if packet_id == req.request_id:
+                        req.parts.append(body)
+                        if not req.marker_sent:
+                            # the server has read the command, the marker is never in the same read
+                            req.marker_sent = True
+                            self._send(sock, encodePacket(req.marker_id, _TYPE_END_MARKER, ""))
+                        continue
+                    if packet_id != req.marker_id:
+                        continue
+                    # the whole response was received
+                    self._current = None
+                    self._sendNext()
+                if req.timer is not None:
+                    getScheduler().cancel(req.timer)
+                if not req.future.done():
+                    req.future.set_result("".join(req.parts))
+        except Exception as e:
+            self._disconnect(sock, RconError("RCON connection lost: {}".format(e)))
+
+    def request(self, command: str) -> "Future[str]":
+        """
+        Send a command, after the requests sent before it, the future is resolved with the response text
+        """
+        try:
+            self.connect()
+        except Exception as e:
+            fut: "Future[str]" = Future()
+            fut.set_exception(e if isinstance(e, RconError) else RconError(str(e)))
+            return fut
+
+        req = _Request(command.strip().lstrip("/"))
+        req.timer = getScheduler().schedule(lambda: self._expire(req), self.timeout)
+        with self._lock:
+            self._queue.append(req)
+            self._sendNext()
+        return req.future
+
+    def send(self, command: str):
+        """
+        Fire and forget, errors are printed
+        """
+        def _onDone(f: Future):
+            if f.exception() is not None:
+                print("Failed to send command via RCON ({}): {}".format(f.exception(), command))
+        self.request(command).add_done_callback(_onDone)
+
+    __call__ = send
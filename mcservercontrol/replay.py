@@ -0,0 +1,152 @@
+"""
+Replay old server logs (logs/latest.log and the rotated .log.gz archives) through the listener,
+without starting the minecraft server
+"""
+import os, re, gzip, time, datetime
+from threading import current_thread
+from typing import IO, Iterable, List, Optional, TYPE_CHECKING
+
+from .logParser import LogLineParser
+from .timeUtils import TimeUtils
+
+if TYPE_CHECKING:
+    from .listener import EventListener
+
+# rotated log archives are named like 2023-01-31-1.log.gz
+_ARCHIVE_NAME_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})-(\d+)\.log(\.gz)?$")
+
+def listLogFiles(log_dir: str) -> List[str]:
+    """
+    Log files in the log directory, in chronological order
+    """
+    archives = []
+    for f in os.listdir(log_dir):
+        match = _ARCHIVE_NAME_RE.match(f)
+        if match:
+            archives.append((match.group(1), int(match.group(2)), f))
+    archives.sort()
+    files = [os.path.join(log_dir, f) for _, _, f in archives]
+
+    latest = os.path.join(log_dir, "latest.log")
+    if os.path.exists(latest):
+        files.append(latest)
+    return files
+
+def openLog(path: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+def logDate(path: str) -> datetime.date:
+    """
+    The date of the first line in the log file,
+    inferred from the archive name, or for latest.log from its modification time (the date of the last line)
+    less the midnights the log spans
+    """
+    match = _ARCHIVE_NAME_RE.match(os.path.basename(path))
+    if match:
+        return datetime.date.fromisoformat(match.group(1))
+    last_date = TimeUtils.stamp2Local(os.path.getmtime(path)).date()
+    return last_date - datetime.timedelta(days = _midnightsSpanned(path))
+
+def _midnightsSpanned(path: str) -> int:
+    """
+    Log lines only record the time of the day, the day changes when the time goes back, as in LogReplayer._lineStamp
+    """
+    header_parser = LogLineParser()
+    days = 0
+    prev: Optional[int] = None
+    with openLog(path) as fp:
+        for line in fp:
+            header = header_parser.parseHeader(line)
+            if header is None:
+                continue
+            try:
+                t = datetime.time.fromisoformat(header[0])
+            except ValueError:
+                continue
+            seconds = t.hour * 3600 + t.minute * 60 + t.second
+            if prev is not None and seconds < prev - 12*3600:
+                days += 1
+            prev = seconds
+    return days
+
+class LogReplayer:
+    """
+    Feed log lines to EventListener.parse,
+    TimeUtils clock follows the log time during replay, so that observers record historical time
+    (on the replaying thread and the dispatcher workers, other threads keep the wall clock)
+    """
+    def __init__(self, listener: "EventListener", speed: float = 0) -> None:
+        """
+         - speed: time scale relative to the original log, e.g. 60 replays one minute per second,
+            0 for full speed
+        """
+        self.listener = listener
+        self.speed = speed
+        self._header_parser = LogLineParser()
+        self._log_stamp = 0.
+
+        self.n_lines = 0
+        self.n_failed = 0
+
+    def _lineStamp(self, line: str, date: datetime.date, prev_stamp: float) -> float:
+        header = self._header_parser.parseHeader(line)
+        if header is None:
+            return prev_stamp
+        try:
+            t = datetime.time.fromisoformat(header[0])
+        except ValueError:
+            return prev_stamp
+        stamp = datetime.datetime.combine(date, t, tzinfo=TimeUtils.LOCAL_TIMEZONE).timestamp()
+        # log lines only record time of the day
+        while stamp < prev_stamp - 12*3600:
+            stamp += 24*3600
+        return stamp
+
+    def replayFile(self, path: str):
+        date = logDate(path)
+        stamp = datetime.datetime.combine(date, datetime.time(), tzinfo=TimeUtils.LOCAL_TIMEZONE).timestamp()
+        wall_start = time.monotonic()
+        log_start: Optional[float] = None
+
+        with openLog(path) as fp:
+            for line in fp:
+                stamp = self._lineStamp(line, date, stamp)
+                self._log_stamp = stamp
+
+                if self.speed > 0:
+                    if log_start is None:
+                        log_start = stamp
+                    wait = (stamp - log_start) / self.speed - (time.monotonic() - wall_start)
+                    if wait > 0:
+                        time.sleep(wait)
+
+                self.n_lines += 1
+                try:
+                    self.listener.parse(line)
+                except Exception as e:
+                    # e.g. logout of a player whose login is not in the replayed logs
+                    self.n_failed += 1
+                    print("Failed to replay line ({}): {}".format(e, line), end="")
+
+    def replay(self, paths: Iterable[str]):
+        threads = [current_thread()]
+        if self.listener.dispatcher is not None:
+            threads += self.listener.dispatcher.threads
+        TimeUtils.setClock(lambda: self._log_stamp, threads)
+        t_start = time.monotonic()
+        try:
+            for path in paths:
+                print("Replaying: ", path)
+                self.replayFile(path)
+            self.listener.stopDispatcher()
+            # at the time of the last line, for the players still online
+            self.listener.status_flusher.flush()
+        finally:
+            TimeUtils.setClock(None, threads)
+
+        elapsed = time.monotonic() - t_start
+        print("Replayed {} lines ({} failed) in {:.2f}s, {:.0f} lines/sec".format(
+            self.n_lines, self.n_failed, elapsed, self.n_lines / max(elapsed, 1e-9)
+        ))
@@ -0,0 +1,135 @@
+"""
+Delayed and recurring calls, all run by one timer thread backed by a heap
+"""
+import time, heapq, uuid
+from threading import Condition, Lock, Thread
+from typing import Callable, Dict, List, NewType, Optional, Tuple
+
+from . import globalVar
+
+SCHEDULE_ID = NewType("SCHEDULE_ID", str)
+
+def newScheduleID() -> SCHEDULE_ID:
+    return SCHEDULE_ID(uuid.uuid4().hex)
+
+class ScheduledJob:
+    """
+    Handle of a scheduled call, kept in globalVar.scheduled_threads until it is done or stopped
+    """
+    def __init__(self, sid: SCHEDULE_ID, target: Callable[[], None], interval: Optional[float], scheduler: "Scheduler") -> None:
+        self.id = sid
+        self._target = target
+        self.interval = interval            # None for one-shot jobs
+        self._scheduler = scheduler
+        self.stopped = False
+
+    def stop(self):
+        self._scheduler.cancel(self.id)
+
+    def _onStop(self):
+        self.stopped = True
+        # Clear from global thread_id pool
+        if self.id in globalVar.scheduled_threads:
+            del globalVar.scheduled_threads[self.id]
+
+class Scheduler:
+    """
+    Jobs are run on the scheduler thread one after another,
+    long running jobs should start their own thread.
+    Cancelled jobs are removed from the heap lazily.
+    """
+    def __init__(self) -> None:
+        self._cond = Condition()
+        self._heap: List[Tuple[float, int, ScheduledJob]] = []
+        self._jobs: Dict[SCHEDULE_ID, ScheduledJob] = {}
+        self._seq = 0
+        self._thread: Optional[Thread] = None
+
+    def start(self):
+        self._thread = Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def schedule(self, target: Callable[[], None], delay: float, interval: Optional[float] = None) -> SCHEDULE_ID:
+        """
+         - delay: seconds before the first call
+         - interval: if not None, call repeatedly with this interval until cancelled
+        """
+        sid = newScheduleID()
+        job = ScheduledJob(sid, target, interval, self)
+        with self._cond:
+            self._jobs[sid] = job
+            globalVar.scheduled_threads[sid] = job
+            self._push(time.monotonic() + delay, job)
+        return sid
+
+    def cancel(self, sid: SCHEDULE_ID) -> bool:
+        """
+        return False if the job is not pending
+        """
+        with self._cond:
+            job = self._jobs.pop(sid, None)
+            if job is None:
+                return False
+            job._onStop()
+            # drop cancelled entries once they make up most of the heap
+            if len(self._heap) > 64 and len(self._heap) > 2 * len(self._jobs):
+                self._heap = [entry for entry in self._heap if entry[2].id in self._jobs]
+                heapq.heapify(self._heap)
+            self._cond.notify()
+        return True
+
+    def pending(self) -> int:
+        """
+        Number of jobs waiting to be run, recurring jobs included
+        """
+        return len(self._jobs)
+
+    def _push(self, when: float, job: ScheduledJob):
+        self._seq += 1
+        heapq.heappush(self._heap, (when, self._seq, job))
+        if self._heap[0][2] is job:
+            # the earliest deadline changed
+            self._cond.notify()
+
+    def _next(self) -> ScheduledJob:
+        with self._cond:
+            while True:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                when, _, job = self._heap[0]
+                if job.id not in self._jobs:
+                    heapq.heappop(self._heap)
+                    continue
+                wait = when - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+                if job.interval is None:
+                    del self._jobs[job.id]
+                    job._onStop()
+                else:
+                    self._push(when + job.interval, job)
+                return job
+
+    def _run(self):
+        while True:
+            job = self._next()
+            try:
+                job._target()
+            except Exception as e:
+                print("Error on scheduled call: {}".format(e))
+
+def getScheduler() -> Scheduler:
+    """
+    The scheduler shared by the process, started on first use
+    """
+    globalVar.init()
+    with _init_lock:
+        if globalVar.scheduler is None:
+            globalVar.scheduler = Scheduler()
+            globalVar.scheduler.start()
+        return globalVar.scheduler
+
+_init_lock = Lock()
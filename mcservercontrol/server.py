@@ -2,14 +2,19 @@
 An abstraction of the minecraft server actions
 """
 
-from typing import Any, Callable, Literal, Tuple, NewType, Optional, IO
+from typing import Any, Callable, List, Literal, Tuple, Optional, IO
+from concurrent.futures import Future
 from subprocess import Popen, PIPE, STDOUT
-import time, random, os, shutil, zipfile
-from threading import Thread
-import uuid
+import random
+from threading import Condition
 from . import globalVar
 from .configReader import config
 from .player import Player
+from .scheduler import SCHEDULE_ID, ScheduledJob, newScheduleID, getScheduler
+from .query import QueryManager, ResponseMatcher
+from .backup import BackupManager, BackupJob
+from .serverLoad import ServerLoad
+from .commandWriter import CommandWriter
 
 class MCPopen(Popen):
     # Type checking purpose
@@ -39,47 +44,27 @@ COLOR_T = Literal[
     "random",
 ]
 
-SCHEDULE_ID = NewType("SCHEDULE_ID", str)
-
-def newScheduleID() -> SCHEDULE_ID:
-    return SCHEDULE_ID(uuid.uuid4().hex)
-
-class ScheduleThread(Thread):
-    def __init__(self, sid: SCHEDULE_ID, target: Callable[[], None], delay: float) -> None:
-        super().__init__(target = target, daemon=True)
-        self.id = sid
-        self._target = target
-        self._delay = delay
-        self._stop_flag = False
-        self.stopped = False
-
-        # add to scheduled_threads pool
-        globalVar.scheduled_threads[self.id] = self
-
-    def run(self) -> None:
-        time.sleep(self._delay)
-        if not self._stop_flag:
-            self._target()
-        self._onStop()
-
-    def stop(self):
-        self._stop_flag = True
-        self._onStop()
-
-    def _onStop(self):
-        self.stopped = True
-        # Clear from global thread_id pool
-        if self.id in globalVar.scheduled_threads:
-            del globalVar.scheduled_threads[self.id]
+# ScheduleThread was the per-call thread used before the shared scheduler
+ScheduleThread = ScheduledJob
 
 class Server:
-    def __init__(self, cmd_interface: Callable[[str], Any]) -> None:
+    def __init__(self, cmd_interface: Callable[[str], Any], stdin_writer: Optional[CommandWriter] = None) -> None:
         """
         - command_interface: method to pass command to minecraft server
+        - stdin_writer: the writer of the stdin of the server, if any, the stop command goes through it
         """
         self._cmd = cmd_interface
+        self.stdin_writer = stdin_writer
         self._proc: MCPopen         # minecraft process
-        self.onWorldSaveCallback = lambda : None
+        # stopped by stopMCServer(restart = True), the listener waits for startMCServer
+        self._restart_pending = False
+        self._proc_changed = Condition()
+        self.queries = QueryManager()
+        # attached to a server started outside of this program, the process is not ours
+        self.attached = False
+        self.backups = BackupManager(self)
+        # players online (the index of the listener) and lag, fed by the listener
+        self.load = ServerLoad()
     
     @property
     def proc(self):
@@ -89,32 +74,95 @@ class Server:
             raise Exception("mc server not started.")
 
     def startMCServer(self):
-        self._proc = MCPopen(config()["entry"].split(" "), stdout = PIPE, stdin = PIPE, stderr = STDOUT)
+        if self.attached:
+            raise Exception("Can not start the server in attach mode, start it outside of this program.")
+        proc = MCPopen(config()["entry"].split(" "), stdout = PIPE, stdin = PIPE, stderr = STDOUT)
+        with self._proc_changed:
+            self._proc = proc
+            self._restart_pending = False
+            self._proc_changed.notify_all()
     
-    def stopMCServer(self):
-        # send command to minecraft server to stop gracefully
-        self.proc.stdin.write(b"stop\n")
-        self.proc.stdin.flush()
+    def stopMCServer(self, restart: bool = False):
+        """
+         - restart: the server is started again afterwards (e.g. restoring a backup), the listener waits for it
+            instead of exiting
+        """
+        if self.attached:
+            self.cmd("/stop")
+            print("Sent stop command to the minecraft server.")
+            return
+        # before the server exits, the listener checks it then
+        with self._proc_changed:
+            self._restart_pending = restart
+        # send command to minecraft server to stop gracefully, 
+        # after the commands queued before and never interleaved with them
+        if self.stdin_writer is not None:
+            self.stdin_writer.write("stop")
+            self.stdin_writer.flush()
+        else:
+            self.proc.stdin.write(b"stop\n")
+            self.proc.stdin.flush()
         self.proc.wait()
+        with self._proc_changed:
+            self._proc_changed.notify_all()
         print("Stopped minecraft server.")
 
+    def nextProc(self, proc: MCPopen) -> Optional[MCPopen]:
+        """
+        Wait for the process started after proc exited, None if the server is not restarted
+        """
+        with self._proc_changed:
+            while self._proc is proc:
+                if not self._restart_pending:
+                    return None
+                self._proc_changed.wait()
+            return self._proc
+
     @property
     def cmd(self) -> Callable[[str], Any]:
         return self._cmd
 
+    def query(self, command: str, timeout: Optional[float] = 5, matcher: Optional[ResponseMatcher] = None) -> "Future[Any]":
+        """
+        Send a command and get its response from the server log, e.g.
+        `server.query("/list").result()` -> {"online": 1, "max": 20, "players": ["Alex"]}
+         - timeout: seconds, the future fails with TimeoutError afterwards
+         - matcher: recognise the response, default to query.matcherFor(command),
+            required for commands without a matcher unless the transport returns responses directly (RCON)
+        (in async observers: `await asyncio.wrap_future(server.query(...))`)
+        """
+        request = getattr(self._cmd, "request", None)
+        if callable(request):
+            # the transport returns responses directly, e.g. RconClient
+            return self.queries.submitDirect(command, request, matcher = matcher, timeout = timeout)
+        return self.queries.submit(command, self.cmd, matcher = matcher, timeout = timeout)
+
     @staticmethod
     def schedule(func: Callable, delay: float, *args, **kwargs) -> SCHEDULE_ID:
         """
         Delay execution of a function
         """
-        thread_id = newScheduleID()
-        t = ScheduleThread(
-            thread_id,
-            target = lambda: func(*args, **kwargs), 
-            delay = delay
-        )
-        t.start()
-        return thread_id
+        return getScheduler().schedule(lambda: func(*args, **kwargs), delay)
+
+    @staticmethod
+    def scheduleRepeat(func: Callable, interval: float, *args, delay: Optional[float] = None, **kwargs) -> SCHEDULE_ID:
+        """
+        Call a function every interval seconds until cancelled
+         - delay: before the first call, default to interval
+        """
+        if delay is None:
+            delay = interval
+        return getScheduler().schedule(lambda: func(*args, **kwargs), delay, interval = interval)
+
+    @staticmethod
+    def cancelSchedule(sid: SCHEDULE_ID) -> bool:
+        """
+        return False if the call is not pending
+        """
+        if sid in globalVar.scheduled_threads:
+            globalVar.scheduled_threads[sid].stop()
+            return True
+        return False
 
     @staticmethod
     def randomHexColor() -> str:
@@ -167,88 +215,20 @@ class Server:
     
     @property
     def backup_home(self):
-        backup_home = os.path.join(config()["server_dir"], "backups")
-        if not os.path.exists(backup_home):
-            os.mkdir(backup_home)
-        return backup_home
+        return self.backups.backup_home
 
-    def backupWorld(self, remove_more_than: Optional[int] = None, save_timeout = 10):
+    def backupWorld(self, remove_more_than: Optional[int] = None, save_timeout = 10) -> BackupJob:
         """
-        Make a backup of the world
+        Make a backup of the world in the background, see backup.BackupManager
         - remove_more_than: if not None, remove old backups if there are more than this number
         """
-        world_dir = os.path.join(config()["server_dir"], config()["world_name"])
-        if not os.path.exists(world_dir):
-            self.cmd("/say saving faild, world (name:{}) not exists".format(config()["world_name"]))
-            return
-
-        __saved_flag = False
-        def _backupworld():
-            nonlocal __saved_flag
-            time_stamp = time.strftime('%Y-%m-%d_%H-%M-%S') 
-            new_backup_file = os.path.join(self.backup_home, f"{config()['world_name']}_{time_stamp}.zip")
-
-            # zip the world
-            def __pack(directory, zip_filename):
-                with zipfile.ZipFile(zip_filename, "w") as zipf:
-                    for root, _, files in os.walk(directory):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            zipf.write(file_path, arcname=os.path.relpath(file_path, directory))
-            __pack(config()["world_dir"], new_backup_file)
-
-
-            # make a link of the latest backup
-            latest_backup_link = os.path.join(self.backup_home, f"{config()['world_name']}_latest.zip")
-            if os.path.exists(latest_backup_link):
-                os.remove(latest_backup_link)
-            os.symlink(new_backup_file, latest_backup_link)
-
-            # remove old backups if there are too many
-            if remove_more_than:
-                backups = [ f for f in os.listdir(self.backup_home) if f.startswith(config()["world_name"]) and f.endswith(".zip") ]
-                backups.remove(f"{config()['world_name']}_latest.zip")
-                backups.sort()
-                if len(backups) > remove_more_than:
-                    print("removing old backups...")
-                    for f in backups[:len(backups)-remove_more_than]:
-                        os.remove(os.path.join(self.backup_home, f))
-            
-            self.cmd("/say Saved to: {}".format(time_stamp))
-
-            # clean up
-            self.onWorldSaveCallback = lambda: None
-            __saved_flag = True
-
-        def _unloadbackupIfTimeout():
-            time.sleep(save_timeout)
-            if not __saved_flag:
-                self.onWorldSaveCallback = lambda: None
-                self.cmd("/say Failed to save due to saving timeout.")
-        
-        # watch for next saved event (maximum wait for 10s), then do backup:
-        self.onWorldSaveCallback = _backupworld
-        self.cmd("/save-all flush")
-        Thread(target=_unloadbackupIfTimeout, daemon=True)
+        return self.backups.backup(remove_more_than = remove_more_than, save_timeout = save_timeout)
     
     def listBackups(self) -> list[str]:
-        res = [ f[len(config()["world_name"]) + 1:-4] for f in os.listdir(self.backup_home) if f.startswith(config()["world_name"]) and f.endswith('.zip') ]
-        res.sort()
-        return res
+        return self.backups.listBackups()
     
-    def loadBackup(self, backup_name: str):
-        backup_file = os.path.join(self.backup_home, config()["world_name"] + "_" + backup_name + ".zip")
-        if not os.path.exists(backup_file):
-            raise FileNotFoundError("Backup file not found")
-        
-        self.stopMCServer()
-        world_dir = config()['world_dir']
-
-        shutil.rmtree(world_dir)
-        print("Deleted old world")
-
-        with zipfile.ZipFile(backup_file, 'r') as zipref:
-            zipref.extractall(path=world_dir)
-        print("Extacted backup to ", world_dir)
-        
-        self.startMCServer()
\ No newline at end of file
+    def loadBackup(self, backup_name: str, patterns: Optional[List[str]] = None):
+        """
+        - patterns: restore only the matching files or dimensions, see backup.BackupManager.loadBackup
+        """
+        self.backups.loadBackup(backup_name, patterns = patterns)
\ No newline at end of file
@@ -0,0 +1,57 @@
+"""
+Load of the minecraft server as seen from its log: players online and "Can't keep up!" warnings,
+for the background jobs (e.g. backups) to leave the server alone when it is busy
+"""
+import re, time
+from collections import deque
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Deque, Dict, Optional, Tuple
+
+from .onlineIndex import OnlineIndex
+
+if TYPE_CHECKING:
+    from .listenerBase import EVENT_ALL
+
+_LAG_RE = re.compile(r"Can't keep up! .*?Running (\d+)ms")
+
+class ServerLoad:
+    LAG_WINDOW = 120        # seconds a "Can't keep up!" warning counts as recent
+
+    def __init__(self, online: Optional[OnlineIndex] = None) -> None:
+        """
+         - online: the players online, the listener attaches its own index (it keeps it up to date)
+        """
+        self._lock = Lock()
+        self.online = online if online is not None else OnlineIndex()
+        self._lags: Deque[Tuple[float, int]] = deque()      # (time, ms behind)
+
+    def feed(self, event: "EVENT_ALL"):
+        """
+        Called by the listener with every event
+        """
+        if event["etype"] == "general" and "Can't keep up!" in event["log_line"]:
+            m = _LAG_RE.search(event["log_line"])
+            with self._lock:
+                self._lags.append((time.monotonic(), int(m.group(1)) if m else 0))
+
+    def _recentLags(self):
+        with self._lock:
+            while self._lags and self._lags[0][0] < time.monotonic() - self.LAG_WINDOW:
+                self._lags.popleft()
+            return list(self._lags)
+
+    @property
+    def lagging(self) -> bool:
+        return len(self._recentLags()) > 0
+
+    @property
+    def empty(self) -> bool:
+        return len(self.online) == 0
+
+    def stats(self) -> Dict[str, Any]:
+        lags = self._recentLags()
+        return {
+            "online": len(self.online),
+            "lag_warnings": len(lags),                  # within LAG_WINDOW
+            "max_lag_ms": max([ms for _, ms in lags], default=0),
+        }
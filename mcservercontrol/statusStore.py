@@ -0,0 +1,253 @@
+"""
+Persistent player status, one record (a json object) per player keyed by Player._hash(name),
+all of them in one store instead of a file per player
+"""
+import os, json, time, atexit, sqlite3
+from abc import ABC, abstractmethod
+from threading import Event, Lock, Thread
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Type
+
+from . import globalVar
+from .configReader import config
+
+if TYPE_CHECKING:
+    from .player import Player
+
+STATUS_T = Dict[str, Any]
+
+class StatusStore(ABC):
+    """
+    Backend of the player status
+    """
+    @abstractmethod
+    def load(self, key: str) -> Optional[STATUS_T]:
+        """
+        return None if the player has no record
+        """
+        ...
+
+    def save(self, key: str, status: STATUS_T):
+        self.saveMany({key: status})
+
+    @abstractmethod
+    def saveMany(self, records: Dict[str, STATUS_T]):
+        """
+        Write the records at once (in one transaction)
+        """
+        ...
+
+    @abstractmethod
+    def keys(self) -> List[str]:
+        ...
+
+    def close(self):
+        ...
+
+class MemoryStatusStore(StatusStore):
+    """
+    Not persistent, e.g. for replays and tests
+    """
+    def __init__(self, path: Optional[str] = None) -> None:
+        self._records: Dict[str, str] = {}
+
+    def load(self, key: str) -> Optional[STATUS_T]:
+        data = self._records.get(key)
+        return json.loads(data) if data is not None else None
+
+    def saveMany(self, records: Dict[str, STATUS_T]):
+        for key, status in records.items():
+            self._records[key] = json.dumps(status)
+
+    def keys(self) -> List[str]:
+        return list(self._records.keys())
+
+class SqliteStatusStore(StatusStore):
+    """
+    Records in a sqlite database in WAL mode, safe to use from several threads
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread = False, isolation_level = None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL commits are durable on checkpoint, enough for the status
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS player_status (key TEXT PRIMARY KEY, status TEXT NOT NULL, time_saved REAL NOT NULL)"
+        )
+
+    def load(self, key: str) -> Optional[STATUS_T]:
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM player_status WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def saveMany(self, records: Dict[str, STATUS_T]):
+        if not records:
+            return
+        now = time.time()
+        rows = [(key, json.dumps(status), now) for key, status in records.items()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO player_status (key, status, time_saved) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET status = excluded.status, time_saved = excluded.time_saved",
+                    rows
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT key FROM player_status")]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+STATUS_BACKENDS: Dict[str, Type[StatusStore]] = {
+    "sqlite": SqliteStatusStore,
+    "memory": MemoryStatusStore,
+}
+
+def statusStorePath() -> str:
+    return os.path.join(config()["world_conf_dir"], "player_status.sqlite3")
+
+def legacyStatusDir() -> str:
+    """
+    The pickle files of the player status, before the store
+    """
+    return os.path.join(config()["world_conf_dir"], "player_status")
+
+def getStatusStore() -> StatusStore:
+    """
+    The store of `status_backend` shared by the process, opened on first use
+    """
+    globalVar.init()
+    with _init_lock:
+        if globalVar.status_store is None:
+            globalVar.status_store = STATUS_BACKENDS[config()["status_backend"]](statusStorePath())
+            if os.path.isdir(legacyStatusDir()) and not globalVar.status_store.keys():
+                print("Found player status of a previous version, import it with `mcservercontrol migrate-status`")
+        return globalVar.status_store
+
+_init_lock = Lock()
+
+class StatusFlusher:
+    """
+    Write-behind of the player status: the players whose status changed since the last flush,
+    and the players online (their session time grows), are saved in one batch
+    every `status_flush_interval` seconds and on exit
+    """
+    def __init__(self, players: Callable[[], Iterable["Player"]], on_flushed: Optional[Callable[[], Any]] = None) -> None:
+        """
+         - players: all the players in memory
+         - on_flushed: called after each flush, e.g. to drop the players saved from memory
+        """
+        self._players = players
+        self._on_flushed = on_flushed
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+        self.flush_stats: Dict[str, float] = {
+            "flushes": 0,           # batches written
+            "players": 0,           # player records written
+            "last_batch": 0,        # players in the last batch
+            "max_batch": 0,
+            "last_ms": 0,           # time to write the last batch
+            "max_ms": 0,
+        }
+
+    def start(self):
+        if self._thread is None:
+            self._thread = Thread(target = self._run, name = "status-flusher", daemon = True)
+            self._thread.start()
+            # the status of the players online when the program exits
+            atexit.register(self.stop)
+
+    def stop(self):
+        """
+        Stop the thread, and flush what is left
+        """
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(config()["status_flush_interval"]):
+            try:
+                self.flush()
+            except Exception as e:
+                print("Failed to save player status: {}".format(e))
+                continue
+            if self._on_flushed is not None:
+                self._on_flushed()
+
+    def flush(self) -> int:
+        """
+        return the number of players saved
+        """
+        with self._lock:
+            records: Dict[str, STATUS_T] = {}
+            batch = [
+                p for p in list(self._players()) if p.status_loaded and (p.status.dirty or p.status.is_online)
+            ]
+            for player in batch:
+                # still dirty until written, so that they are not dropped from memory meanwhile
+                player.status.beginSave()
+                records[player._hash(player.name)] = player.status.persistentDict(checkpoint = True)
+            if not records:
+                return 0
+            t_start = time.monotonic()
+            try:
+                getStatusStore().saveMany(records)
+            except Exception:
+                for player in batch:
+                    player.status.endSave(ok = False)
+                raise
+            for player in batch:
+                player.status.endSave()
+            ms = (time.monotonic() - t_start) * 1000
+            stats = self.flush_stats
+            stats["flushes"] += 1
+            stats["players"] += len(records)
+            stats["last_batch"] = len(records)
+            stats["max_batch"] = max(stats["max_batch"], len(records))
+            stats["last_ms"] = ms
+            stats["max_ms"] = max(stats["max_ms"], ms)
+            return len(records)
+
+def migrateStatus(src_dir: Optional[str] = None, store: Optional[StatusStore] = None) -> int:
+    """
+    Import the <hash>.status pickle files of the player status into the store, in one transaction,
+    nothing is imported if a value can not be saved as json (ValueError)
+    return the number of players imported
+    """
+    import pickle
+    if src_dir is None:
+        src_dir = legacyStatusDir()
+    if store is None:
+        store = getStatusStore()
+    records: Dict[str, STATUS_T] = {}
+    for f in sorted(os.listdir(src_dir)):
+        if not f.endswith(".status"):
+            continue
+        with open(os.path.join(src_dir, f), "rb") as fp:
+            status = pickle.load(fp)
+        # merged into the record of the store, if the player logged in since the upgrade
+        key = f[:-len(".status")]
+        merged = store.load(key) or {}
+        for k, v in status.items():
+            try:
+                json.dumps(v)
+            except (TypeError, ValueError) as e:
+                raise ValueError("Can not import {}, the value of {} is not json serializable: {}".format(
+                    os.path.join(src_dir, f), k, e
+                )) from e
+            merged.setdefault(k, v)
+        records[key] = merged
+    store.saveMany(records)
+    return len(records)
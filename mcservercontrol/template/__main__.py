@@ -3,6 +3,7 @@ from mcservercontrol import EventListener, getDefaultObservers
 
 if __name__ == "__main__":
     # Have to start the minecraft server before initialize observers
+    # (EventListener(workers=2) runs the observers on worker threads, so that slow observers never stall log reading)
     listener = EventListener()
     listener.startServer()
 
@@ -0,0 +1,116 @@
+import sys, asyncio, threading, time
+from mcservercontrol import asyncListener
+from mcservercontrol.backup import autoBackup, manager as backup_manager
+from mcservercontrol.asyncListener import AsyncEventListener, AsyncServer, AsyncDaemonObserver
+from mcservercontrol.observer import PlayerObserver, PlayerCommandObserver
+from mcservercontrol.player import Player
+
+# echoes its input to the log until "stop"
+FAKE_SERVER = """
+import sys
+print("[12:00:00] [Server thread/INFO]: Done", flush=True)
+for line in sys.stdin:
+    if line.strip() == "stop":
+        break
+    print("[12:00:00] [Server thread/INFO]: " + line.strip(), flush=True)
+"""
+
+def test_async_dispatch_awaits_hooks_in_order():
+    calls = []
+    class _Observer(PlayerObserver):
+        async def onPlayerSpeak(self, player, content):
+            await asyncio.sleep(0.01)
+            calls.append(("async", content))
+    class _SyncObserver(PlayerObserver):
+        def onPlayerSpeak(self, player, content):
+            calls.append(("sync", content))
+    class _Command(PlayerCommandObserver):
+        async def onTriggered(self, player, args):
+            raise ValueError("boom")
+        def help(self):
+            return ""
+
+    listener = AsyncEventListener()
+    listener._setServer(AsyncServer(listener.loop))
+    listener.register(_Observer(), _SyncObserver(), _Command("boom"))
+    alex = Player("Alex")
+    try:
+        listener.loop.run_until_complete(listener.dispatchAsync(
+            {"etype": "speak", "time": 0, "log_line": "", "player": alex, "content": "hi "}
+        ))
+        # the error of the command is reported, not raised
+        listener.loop.run_until_complete(listener.dispatchAsync(
+            {"etype": "cmd", "time": 0, "log_line": "", "player": alex, "cmd_split": ["boom", []]}
+        ))
+    finally:
+        listener.loop.close()
+    assert calls == [("async", "hi"), ("sync", "hi")]
+    assert listener.dispatch_stats["calls"] == 2
+
+def test_async_server_restarts_during_restore(tmp_path, monkeypatch):
+    script = tmp_path / "server.py"
+    script.write_text(FAKE_SERVER)
+    cfg = {"entry": "{} -u {}".format(sys.executable, script), "backup_interval": 3600, "backup_verify_interval": 3600}
+    monkeypatch.setattr(asyncListener, "config", lambda: cfg)
+    monkeypatch.setattr(autoBackup, "config", lambda: cfg)
+    monkeypatch.setattr(backup_manager, "config", lambda: cfg)
+
+    listener = AsyncEventListener()
+    server = AsyncServer(listener.loop)
+    listener._setServer(server)
+    listener.daemon = AsyncDaemonObserver(listener.loop)
+    lines = []
+    listener.parse = lines.append                   # type: ignore
+    listener._readInput = lambda: None              # type: ignore
+
+    def _restore():
+        while not hasattr(server, "_aproc"):
+            time.sleep(0.01)
+        # as BackupManager.loadBackup does, from another thread
+        server.stopMCServer(restart=True)
+        server.cmd("sent while stopped")
+        server.startMCServer()
+        server.cmd("after restart")
+        time.sleep(0.2)
+        asyncio.run_coroutine_threadsafe(server.stopMCServerAsync(), listener.loop).result(5)
+
+    thread = threading.Thread(target=_restore, daemon=True)
+    thread.start()
+    try:
+        code = listener.loop.run_until_complete(asyncio.wait_for(listener._main(), 10))
+    finally:
+        listener.loop.close()
+    thread.join(1)
+    assert code == 0
+    # started as by the sync listener
+    backups = server.backups
+    assert backups.scheduler._sid is not None and hasattr(backups, "_verifier")
+    backups.scheduler.stop()
+    server.cancelSchedule(backups._verifier)
+    messages = [line.split(": ", 1)[1].strip() for line in lines]
+    assert messages == ["Done", "Done", "sent while stopped", "after restart"]
+
+def test_async_schedule_cancelled_from_other_threads():
+    loop = asyncio.new_event_loop()
+    server = AsyncServer(loop)
+    calls = []
+    async def _repeated():
+        calls.append("repeat")
+
+    def _other_thread():
+        sid = server.schedule(lambda: calls.append("cancelled"), 0.05)
+        assert server.cancelSchedule(sid)
+        server.schedule(lambda: calls.append("run"), 0.05)
+        # on the shared scheduler, the coroutine on the event loop
+        calls.append(server.scheduleRepeat(_repeated, 0.05))
+    thread = threading.Thread(target=_other_thread)
+    try:
+        thread.start()
+        thread.join()
+        repeat_sid = calls.pop()
+        loop.run_until_complete(asyncio.sleep(0.3))
+        assert server.cancelSchedule(repeat_sid)
+    finally:
+        loop.close()
+    assert calls.count("run") == 1 and "cancelled" not in calls
+    assert calls.count("repeat") >= 2
@@ -0,0 +1,504 @@
+import os, tarfile, threading
+import pytest
+from concurrent.futures import Future
+from mcservercontrol.backup import manager as backup_manager
+from mcservercontrol.backup import BackupManager
+from mcservercontrol.backup.writer import CODECS, ArchiveWriter, extractArchive, fileChecksum
+from mcservercontrol.serverLoad import ServerLoad
+from mcservercontrol.player import Player
+
+class _Server:
+    attached = False
+    load = ServerLoad()
+
+    def __init__(self, release: threading.Event) -> None:
+        self.commands = []
+        self.release = release
+        self.fail_start = False
+
+    def stopMCServer(self, restart = False):
+        self.commands.append("stop")
+
+    def startMCServer(self):
+        self.commands.append("start")
+        if self.fail_start:
+            self.fail_start = False
+            raise OSError("failed to start")
+
+    def cmd(self, command: str):
+        self.commands.append(command)
+
+    def say(self, text: str):
+        self.commands.append("/say " + text)
+
+    def query(self, command: str, timeout = None) -> Future:
+        self.commands.append(command)
+        self.release.wait(5)
+        fut = Future()
+        fut.set_result("Saved the game")
+        return fut
+
+def test_backup_protocol_and_coalescing(tmp_path, monkeypatch):
+    world_dir = tmp_path / "world"
+    (world_dir / "region").mkdir(parents=True)
+    (world_dir / "level.dat").write_bytes(b"level")
+    (world_dir / "region" / "r.0.0.mca").write_bytes(os.urandom(10000))
+    cfg = {
+        "server_dir": str(tmp_path), "world_name": "world", "world_dir": str(world_dir),
+        "backup_format": "tar", "backup_codec": "deflate", "backup_level": None, "backup_workers": 2, "backup_snapshot": True,
+        "backup_rate_limit": 0, "backup_nice": 0, "backup_retention": None,
+    }
+    monkeypatch.setattr(backup_manager, "config", lambda: cfg)
+
+    release = threading.Event()
+    server = _Server(release)
+    manager = BackupManager(server)     # type: ignore
+
+    first = manager.backup()
+    # the first job is waiting for the save, the next requests join the queued one
+    while manager.current is None:
+        threading.Event().wait(0.01)
+    second = manager.backup()
+    third = manager.backup()
+    assert second is third and second is not first and second.requests == 2
+
+    release.set()
+    name = first.future.result(5)
+    second.future.result(5)
+    assert first.status == "done" and first.progress == 1.
+
+    i_off, i_save, i_on = (server.commands.index(c) for c in ("/save-off", "/save-all flush", "/save-on"))
+    assert i_off < i_save < i_on
+    assert server.commands.count("/save-off") == 2
+
+    assert name in manager.listBackups() and "latest" in manager.listBackups()
+    assert first.stats["bytes_in"] == 10005
+    # a standard .tar.gz
+    with tarfile.open(tmp_path / "backups" / "world_{}.tar.gz".format(name)) as tar:
+        assert sorted(tar.getnames()) == [".backup-checksums.json", "level.dat", "region/r.0.0.mca"]
+
+@pytest.mark.parametrize("fmt, codec", [("tar", c) for c in CODECS] + [("zip", "deflate"), ("zip", "lzma")])
+def test_archive_roundtrip(tmp_path, fmt, codec):
+    src = tmp_path / "src"
+    src.mkdir()
+    files = {"a.bin": os.urandom(300000), "b.txt": b"abc" * 500000, "empty": b""}
+    for name, data in files.items():
+        (src / name).write_bytes(data)
+
+    # small blocks, many of them compressed in parallel
+    writer = ArchiveWriter(fmt, codec, workers=4)
+    writer.BLOCK_SIZE = 64 * 1024
+    archive = str(tmp_path / ("backup" + writer.suffix))
+    progress = []
+    stats = writer.write(str(src), archive, lambda done, total: progress.append((done, total)))
+    assert progress[-1] == (stats["bytes_in"], stats["bytes_in"]) and stats["mb_per_sec"] > 0
+    # hashed while written
+    assert writer.checksum == fileChecksum(archive) and stats["bytes_out"] == os.path.getsize(archive)
+
+    extractArchive(archive, str(tmp_path / "dst"))
+    for name, data in files.items():
+        assert (tmp_path / "dst" / name).read_bytes() == data
+
+def test_snapshot_store_dedup_and_gc(tmp_path):
+    from mcservercontrol.backup.store import SnapshotStore
+    src = tmp_path / "world"
+    (src / "region").mkdir(parents=True)
+    (src / "region" / "r.0.0.mca").write_bytes(os.urandom(50000))
+    (src / "region" / "r.0.1.mca").write_bytes(os.urandom(50000))
+    (src / "level.dat").write_bytes(b"v1")
+    store = SnapshotStore(str(tmp_path / "store"), workers=2)
+
+    s1 = store.snapshot(str(src), "world_1")
+    (src / "level.dat").write_bytes(b"v2")
+    s2 = store.snapshot(str(src), "world_2", parent="world_1")
+    assert s2["files_reused"] == 2 and s2["bytes_out"] < s1["bytes_out"] / 10
+    assert store.stats() == {"snapshots": 2, "objects": 4}
+
+    store.restore("world_1", str(tmp_path / "restored"))
+    assert (tmp_path / "restored" / "level.dat").read_bytes() == b"v1"
+    assert (tmp_path / "restored" / "region" / "r.0.1.mca").read_bytes() == (src / "region" / "r.0.1.mca").read_bytes()
+
+    store.delete("world_1")
+    assert store.gc()[0] == 1          # only the old level.dat is unreferenced
+    store.restore("world_2", str(tmp_path / "restored2"))
+    assert (tmp_path / "restored2" / "level.dat").read_bytes() == b"v2"
+
+def test_store_format_retention(tmp_path, monkeypatch):
+    world_dir = tmp_path / "world"
+    world_dir.mkdir()
+    (world_dir / "level.dat").write_bytes(b"v0")
+    cfg = {
+        "server_dir": str(tmp_path), "world_name": "world", "world_dir": str(world_dir),
+        "backup_format": "store", "backup_codec": "deflate", "backup_level": None, "backup_workers": 1, "backup_snapshot": False,
+        "backup_rate_limit": 0, "backup_nice": 0, "backup_retention": None,
+    }
+    monkeypatch.setattr(backup_manager, "config", lambda: cfg)
+    release = threading.Event()
+    release.set()
+    manager = BackupManager(_Server(release))       # type: ignore
+
+    names = []
+    for i in range(3):
+        (world_dir / "level.dat").write_bytes("v{}".format(i).encode())
+        names.append(manager.backup(remove_more_than=2).future.result(5))
+    assert manager.listBackups() == sorted(names[1:] + ["latest"])
+    assert manager.store.stats()["objects"] == 2
+
+def test_verify_does_not_overlap_removal(tmp_path, monkeypatch):
+    world_dir = tmp_path / "world"
+    world_dir.mkdir()
+    cfg = {
+        "server_dir": str(tmp_path), "world_name": "world", "world_dir": str(world_dir),
+        "backup_format": "store", "backup_codec": "deflate", "backup_level": None, "backup_workers": 1, "backup_snapshot": False,
+        "backup_rate_limit": 0, "backup_nice": 0, "backup_retention": None,
+    }
+    monkeypatch.setattr(backup_manager, "config", lambda: cfg)
+    release = threading.Event()
+    release.set()
+    manager = BackupManager(_Server(release))       # type: ignore
+    (world_dir / "a.dat").write_bytes(b"a0")
+    (world_dir / "b.dat").write_bytes(b"b0")
+    name = manager.backup().future.result(5)
+
+    # the verification pauses after its first object, meanwhile a backup removes the verified one
+    reading, resume = threading.Event(), threading.Event()
+    def _throttle(n: int):
+        reading.set()
+        resume.wait(5)
+    problems = []
+    verifier = threading.Thread(target=lambda: problems.append(manager.verify(name, _throttle)))
+    verifier.start()
+    assert reading.wait(5)
+    (world_dir / "a.dat").write_bytes(b"a1")
+    (world_dir / "b.dat").write_bytes(b"b1")
+    job = manager.backup(remove_more_than=1)
+    with pytest.raises(TimeoutError):
+        job.future.result(0.3)
+    resume.set()
+    verifier.join(5)
+    assert problems == [[]]
+    new_name = job.future.result(5)
+    assert manager.listBackups() == [new_name, "latest"]
+    assert manager.store.stats()["objects"] == 2
+
+def test_region_chunk_delta(tmp_path):
+    from mcservercontrol.backup.store import SnapshotStore
+    from mcservercontrol.backup.region import RegionChunk, buildRegion, parseRegion
+
+    def chunk(index, offset, timestamp, payload):
+        data = (len(payload) + 1).to_bytes(4, "big") + b"\x02" + payload
+        return RegionChunk(index, offset, (len(data) + 4095) // 4096, timestamp, data)
+
+    chunks = [chunk(i, 2 + 2 * i, 100, os.urandom(5000)) for i in range(8)]
+    region = buildRegion(chunks, 0)
+    assert parseRegion(region) == chunks
+
+    src = tmp_path / "world" / "region"
+    src.mkdir(parents=True)
+    (src / "r.0.0.mca").write_bytes(region)
+    (src / "r.9.9.mca").write_bytes(b"not a region")
+    store = SnapshotStore(str(tmp_path / "store"), codec="store", workers=2)
+    s1 = store.snapshot(str(tmp_path / "world"), "world_1")
+    assert s1["chunks_stored"] == 8
+
+    chunks[3] = chunk(3, 8, 200, os.urandom(5000))
+    # saved again within the same second, same timestamp and length
+    chunks[5] = chunk(5, 12, 100, os.urandom(5000))
+    region = buildRegion(chunks, 0)
+    (src / "r.0.0.mca").write_bytes(region)
+    s2 = store.snapshot(str(tmp_path / "world"), "world_2", parent="world_1")
+    assert (s2["chunks_reused"], s2["chunks_stored"]) == (6, 2)
+    assert 10000 < s2["bytes_out"] < 12000
+
+    store.restore("world_2", str(tmp_path / "restored"))
+    assert (tmp_path / "restored" / "region" / "r.0.0.mca").read_bytes() == region
+    assert (tmp_path / "restored" / "region" / "r.9.9.mca").read_bytes() == b"not a region"
+
+@pytest.mark.parametrize("fmt", ["zip", "store"])
+def test_restore_staged_partial_and_rollback(tmp_path, monkeypatch, fmt):
+    world_dir = tmp_path / "world"
+    for d in ("region", "DIM-1/region"):
+        (world_dir / d).mkdir(parents=True)
+    (world_dir / "level.dat").write_bytes(b"old")
+    (world_dir / "region" / "r.0.0.mca").write_bytes(b"old overworld")
+    (world_dir / "DIM-1" / "region" / "r.0.0.mca").write_bytes(b"old nether")
+    cfg = {
+        "server_dir": str(tmp_path), "world_name": "world", "world_dir": str(world_dir),
+        "backup_format": fmt, "backup_codec": "deflate", "backup_level": None, "backup_workers": 2, "backup_snapshot": True,
+        "backup_rate_limit": 0, "backup_nice": 0, "backup_retention": None,
+    }
+    monkeypatch.setattr(backup_manager, "config", lambda: cfg)
+    release = threading.Event()
+    release.set()
+    server = _Server(release)
+    manager = BackupManager(server)       # type: ignore
+    name = manager.backup().future.result(5)
+
+    (world_dir / "level.dat").write_bytes(b"new")
+    (world_dir / "region" / "r.0.0.mca").write_bytes(b"new overworld")
+    (world_dir / "DIM-1" / "region" / "r.0.0.mca").write_bytes(b"new nether")
+    (world_dir / "DIM-1" / "region" / "r.1.0.mca").write_bytes(b"new nether region")
+
+    manager.loadBackup(name, ["nether"])
+    assert (world_dir / "DIM-1" / "region" / "r.0.0.mca").read_bytes() == b"old nether"
+    assert not (world_dir / "DIM-1" / "region" / "r.1.0.mca").exists()
+    assert (world_dir / "level.dat").read_bytes() == b"new"
+    assert server.commands[-2:] == ["stop", "start"]
+
+    server.fail_start = True
+    with pytest.raises(OSError):
+        manager.loadBackup(name)
+    assert (world_dir / "level.dat").read_bytes() == b"new"
+    assert server.commands[-3:] == ["stop", "start", "start"]
+
+    manager.loadBackup(name)
+    assert (world_dir / "level.dat").read_bytes() == b"old"
+    assert (world_dir / "region" / "r.0.0.mca").read_bytes() == b"old overworld"
+    assert sorted(os.listdir(tmp_path)) == ["backups", "world"]
+
+def test_snapshot_tree(tmp_path):
+    from mcservercontrol.backup.snapshot import snapshotTree
+    src = tmp_path / "world"
+    (src / "region").mkdir(parents=True)
+    (src / "level.dat").write_bytes(b"level")
+    (src / "region" / "r.0.0.mca").write_bytes(b"region")
+    os.utime(src / "region" / "r.0.0.mca", ns=(10 ** 18, 10 ** 18))
+
+    stats = snapshotTree(str(src), str(tmp_path / "snap"))
+    assert stats["hardlinked"] == 1 and stats["reflinked"] + stats["copied"] == 1
+    assert os.stat(tmp_path / "snap" / "level.dat").st_ino == os.stat(src / "level.dat").st_ino
+    # region files are written in place, the copy must not change with them
+    assert os.stat(tmp_path / "snap" / "region" / "r.0.0.mca").st_ino != os.stat(src / "region" / "r.0.0.mca").st_ino
+    assert os.stat(tmp_path / "snap" / "region" / "r.0.0.mca").st_mtime_ns == 10 ** 18
+
+def test_throttle_follows_server_load():
+    import time
+    from mcservercontrol.backup.throttle import RateLimiter, adaptiveRate
+
+    load = ServerLoad()
+    limiter = RateLimiter(adaptiveRate(load, 1000000), burst=0.01)
+    t0 = time.monotonic()
+    for _ in range(100):
+        limiter(100000)         # empty server, unlimited
+    assert time.monotonic() - t0 < 0.1
+
+    load.online.add(Player("Alex"))
+    t0 = time.monotonic()
+    for _ in range(3):
+        limiter(100000)
+    assert 0.15 < time.monotonic() - t0 < 0.5
+
+    load.feed({"etype": "general", "time": 0, "log_line": "[12:00:00] [Server thread/WARN]: Can't keep up! Is the server overloaded? Running 2107ms or 42 ticks behind\n"})
+    assert load.stats() == {"online": 1, "lag_warnings": 1, "max_lag_ms": 2107}
+    t0 = time.monotonic()
+    for _ in range(3):
+        limiter(100000)         # a quarter of the rate
+    assert 0.9 < time.monotonic() - t0 < 1.6
+
+def test_tiered_retention():
+    import time
+    from mcservercontrol.backup.catalog import selectExpired
+    t0 = time.mktime((2024, 1, 31, 23, 50, 0, 0, 0, -1))
+    # every 15 minutes for 3 days
+    entries = [{"name": str(i), "time": t0 - i * 900} for i in range(3 * 24 * 4)]
+    expired = set(selectExpired(entries, {"last": 2, "hourly": 6, "daily": 3}))      # type: ignore
+    kept = sorted((int(e["name"]) for e in entries if e["name"] not in expired))
+    # 2 newest, the newest of the 6 last hours (the 1st is among the newest), the newest of the 2 days before
+    assert kept == [0, 1, 4, 8, 12, 16, 20, 96, 192]
+    assert selectExpired(entries, {}) == []     # type: ignore
+
+def test_catalog_reads_while_updated(tmp_path):
+    from mcservercontrol.backup.catalog import BackupCatalog
+    catalog = BackupCatalog(str(tmp_path / "catalog.json"), lambda: [])
+    errors = []
+
+    def _add():
+        for i in range(200):
+            entry = {"name": "b{:03d}".format(i), "path": "", "format": "zip", "codec": None, "time": float(i), "size": 0,
+                     "bytes_in": 0, "files": None, "checksum": None, "parent": None, "verified": None, "valid": None}
+            catalog.add(entry)      # type: ignore
+            catalog.update(entry["name"], {"valid": True})
+    thread = threading.Thread(target=_add)
+    thread.start()
+    while thread.is_alive():
+        try:
+            catalog.names(), catalog.entries(), catalog.latest, catalog.get("latest"), catalog.expired({"last": 2})
+        except Exception as e:
+            errors.append(e)
+    thread.join()
+    assert errors == [] and len(catalog.names()) == 200
+    # copies, the catalog is only changed through update
+    catalog.latest["valid"] = False         # type: ignore
+    assert catalog.get("b199")["valid"] is True      # type: ignore
+
+@pytest.mark.parametrize("fmt", ["tar", "zip", "store"])
+def test_verify_detects_corruption(tmp_path, monkeypatch, fmt):
+    world_dir = tmp_path / "world"
+    (world_dir / "region").mkdir(parents=True)
+    (world_dir / "level.dat").write_bytes(b"level")
+    (world_dir / "region" / "r.0.0.mca").write_bytes(os.urandom(100000))
+    cfg = {
+        "server_dir": str(tmp_path), "world_name": "world", "world_dir": str(world_dir),
+        "backup_format": fmt, "backup_codec": "deflate", "backup_level": None, "backup_workers": 1, "backup_snapshot": True,
+        "backup_rate_limit": 0, "backup_nice": 0, "backup_retention": None,
+    }
+    monkeypatch.setattr(backup_manager, "config", lambda: cfg)
+    release = threading.Event()
+    release.set()
+    manager = BackupManager(_Server(release))       # type: ignore
+    name = manager.backup().future.result(5)
+
+    assert manager.verify(name) == []
+    entry = manager.catalog.get(name)
+    assert entry is not None and entry["valid"] is True and entry["verified"] is not None
+
+    # flip a byte in the middle of the largest file of the backup
+    if fmt == "store":
+        objects = [os.path.join(d, f) for d, _, fs in os.walk(tmp_path / "backups" / "store" / "objects") for f in fs]
+        target = max(objects, key=os.path.getsize)
+    else:
+        target = os.path.join(manager.backup_home, entry["path"])
+    with open(target, "r+b") as fp:
+        fp.seek(os.path.getsize(target) // 2)
+        b = fp.read(1)
+        fp.seek(-1, os.SEEK_CUR)
+        fp.write(bytes([b[0] ^ 0xff]))
+
+    assert manager.verify(name) != []
+    assert manager.catalog.get(name)["valid"] is False       # type: ignore
+
+def test_backup_scheduler(tmp_path, monkeypatch):
+    from mcservercontrol.backup import autoBackup
+    world_dir = tmp_path / "world"
+    (world_dir / "region").mkdir(parents=True)
+    (world_dir / "region" / "r.0.0.mca").write_bytes(b"chunks")
+    cfg = {
+        "server_dir": str(tmp_path), "world_name": "world", "world_dir": str(world_dir), "max_backup": 16,
+        "backup_format": "tar", "backup_codec": "deflate", "backup_level": None, "backup_workers": 1, "backup_snapshot": True,
+        "backup_rate_limit": 0, "backup_nice": 0, "backup_retention": None, "backup_interval": 3600, "backup_max_delay": 600,
+    }
+    monkeypatch.setattr(backup_manager, "config", lambda: cfg)
+    monkeypatch.setattr(autoBackup, "config", lambda: cfg)
+    release = threading.Event()
+    server = _Server(release)
+    server.load = ServerLoad()
+    manager = BackupManager(server)     # type: ignore
+    scheduler = manager.scheduler
+
+    # no backup yet: due, but players are online
+    server.load.online.add(Player("Steve"))
+    assert scheduler.tick() is None
+    # the server is empty: go, and never start a second one meanwhile
+    server.load.online.reconcile([])
+    job = scheduler.tick()
+    assert job is not None and scheduler.tick() is None
+    release.set()
+    job.future.result(5)
+    assert len(manager.catalog.names()) == 1
+
+    # the next one is not due yet
+    assert scheduler.tick() is None
+    # due, but no chunk was saved since
+    latest = manager.catalog.latest
+    manager.catalog.update(latest["name"], {"time": latest["time"] - 7200})       # type: ignore
+    os.utime(world_dir / "region" / "r.0.0.mca", (latest["time"] - 7300, latest["time"] - 7300))      # type: ignore
+    assert scheduler.tick() is None
+    # a chunk was saved, players online beyond the max delay
+    os.utime(world_dir / "region" / "r.0.0.mca")
+    server.load.online.add(Player("Alex"))
+    job = scheduler.tick()
+    assert job is not None
+    job.future.result(5)
+
+FAKE_SERVER = """
+import sys
+print("[12:00:00] [Server thread/INFO]: Done", flush=True)
+for line in sys.stdin:
+    if line.strip() == "stop":
+        break
+    if line.lstrip("/").startswith("save-all"):
+        print("[12:00:00] [Server thread/INFO]: Saved the game", flush=True)
+"""
+
+def test_rollback_restarts_under_the_listener(tmp_path, monkeypatch):
+    import sys
+    from mcservercontrol import server as server_module
+    from mcservercontrol.addons.save import CommandBackup
+    from mcservercontrol.commandWriter import CommandWriter
+    from mcservercontrol.listener import EventListener
+    from mcservercontrol.server import Server
+    world_dir = tmp_path / "world"
+    world_dir.mkdir()
+    (world_dir / "level.dat").write_bytes(b"v0")
+    (tmp_path / "server.py").write_text(FAKE_SERVER)
+    cfg = {
+        "server_dir": str(tmp_path), "world_name": "world", "world_dir": str(world_dir),
+        "backup_format": "tar", "backup_codec": "deflate", "backup_level": None, "backup_workers": 1, "backup_snapshot": True,
+        "backup_rate_limit": 0, "backup_nice": 0, "backup_retention": None,
+        "entry": "{} -u {}".format(sys.executable, tmp_path / "server.py"),
+    }
+    monkeypatch.setattr(backup_manager, "config", lambda: cfg)
+    monkeypatch.setattr(server_module, "config", lambda: cfg)
+
+    listener = EventListener()
+    listener.echo = False
+    writer = CommandWriter(lambda: listener.mc_server.proc.stdin)
+    server = Server(writer, stdin_writer=writer)
+    listener._setServer(server)
+    server.startMCServer()
+    first_proc = server.proc
+    restored = []
+
+    def _rollback():
+        try:
+            name = server.backupWorld().future.result(5)
+            (world_dir / "level.dat").write_bytes(b"v1")
+            # as `\backup rollback <name>` does, on another thread
+            CommandBackup("backup")._rollback(name, None)
+            restored.append(server.proc is not first_proc and server.proc.poll() is None)
+        finally:
+            server.stopMCServer()
+    thread = threading.Thread(target=_rollback, daemon=True)
+    thread.start()
+    # returns once the server is stopped for good
+    listener._readLines()
+    thread.join(5)
+    assert restored == [True]
+    assert (world_dir / "level.dat").read_bytes() == b"v0"
+    assert not os.path.exists(str(world_dir) + ".restore-old")
+
+def test_one_restore_at_a_time(tmp_path, monkeypatch):
+    world_dir = tmp_path / "world"
+    world_dir.mkdir()
+    (world_dir / "level.dat").write_bytes(b"v0")
+    cfg = {
+        "server_dir": str(tmp_path), "world_name": "world", "world_dir": str(world_dir),
+        "backup_format": "tar", "backup_codec": "deflate", "backup_level": None, "backup_workers": 1, "backup_snapshot": True,
+        "backup_rate_limit": 0, "backup_nice": 0, "backup_retention": None, "backup_interval": 3600, "backup_max_delay": 600,
+    }
+    monkeypatch.setattr(backup_manager, "config", lambda: cfg)
+    release = threading.Event()
+    release.set()
+    server = _Server(release)
+    manager = BackupManager(server)     # type: ignore
+    name = manager.backup().future.result(5)
+
+    # the server is down for the swap, meanwhile
+    in_restore, resume = threading.Event(), threading.Event()
+    def _stop(restart = False):
+        in_restore.set()
+        resume.wait(5)
+    server.stopMCServer = _stop         # type: ignore
+    restore = threading.Thread(target=manager.loadBackup, args=(name, ))
+    restore.start()
+    assert in_restore.wait(5) and manager.restoring
+    with pytest.raises(RuntimeError):
+        manager.loadBackup(name)
+    assert manager.scheduler.tick() is None
+    job = manager.backup()
+    with pytest.raises(TimeoutError):
+        job.future.result(0.2)
+    resume.set()
+    restore.join(5)
+    # the backup waited for the restore
+    assert job.future.result(5) and not manager.restoring
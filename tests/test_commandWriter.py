@@ -0,0 +1,63 @@
+import threading
+from mcservercontrol.commandWriter import CommandWriter
+
+class _Stream:
+    def __init__(self) -> None:
+        self.writes = []
+        self.flushes = 0
+
+    def write(self, data: bytes):
+        self.writes.append(data)
+
+    def flush(self):
+        self.flushes += 1
+
+def test_commands_are_written_as_whole_lines():
+    stream = _Stream()
+    writer = CommandWriter(lambda: stream, flush_window=0)
+
+    def _send(i: int):
+        for j in range(50):
+            writer.write("/say {} {}\n/say {} {} again".format(i, j, i, j))
+    threads = [threading.Thread(target=_send, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert writer.flush(5)
+
+    assert all(w.endswith(b"\n") for w in stream.writes)
+    lines = b"".join(stream.writes).decode().splitlines()
+    assert len(lines) == 400
+    # the two lines of a command are never split by another command
+    for first, second in zip(lines[::2], lines[1::2]):
+        assert second == first + " again"
+
+def test_commands_are_batched_and_counted():
+    stream = _Stream()
+    writer = CommandWriter(lambda: stream, flush_window=0.2)
+    writer.write("")            # nothing to send
+    for i in range(10):
+        writer.write("/say {}".format(i))
+    assert writer.flush(5)
+
+    assert len(stream.writes) < 10 and stream.flushes == len(stream.writes)
+    assert b"".join(stream.writes) == b"".join("/say {}\n".format(i).encode() for i in range(10))
+    stats = writer.stats()
+    assert stats["commands"] == 10 and stats["writes"] == len(stream.writes)
+    assert stats["commands_per_sec"] == 10 / CommandWriter.RATE_WINDOW
+
+def test_stop_goes_through_the_writer():
+    from mcservercontrol.server import Server
+    stream = _Stream()
+    writer = CommandWriter(lambda: stream, flush_window=0.2)
+
+    class _Proc:
+        stdin = stream
+        def wait(self):
+            return 0
+    server = Server(writer, stdin_writer=writer)
+    server._proc = _Proc()          # type: ignore
+    server.cmd("/say bye")
+    server.stopMCServer()
+    assert b"".join(stream.writes) == b"/say bye\nstop\n"
@@ -0,0 +1,56 @@
+import time
+from mcservercontrol.dispatcher import EventDispatcher
+from mcservercontrol.player import Player
+
+def _event(etype, player=None):
+    ev = {"etype": etype, "time": 0, "log_line": ""}
+    if player is not None:
+        ev["player"] = player
+    return ev
+
+def test_per_player_order():
+    handled = []
+    def handler(event):
+        if event["etype"] == "general":
+            time.sleep(0.05)        # a slow observer does not hold up player events
+        handled.append((event["etype"], event["player"].name if "player" in event else None))
+
+    dispatcher = EventDispatcher(handler, n_workers=4, queue_size=8)
+    dispatcher.start()
+    players = [Player(n) for n in ["Alex", "Steve", "Monsoon"]]
+    dispatcher.submit(_event("general"))
+    for i in range(20):
+        for p in players:
+            dispatcher.submit(_event("speak" if i else "login", p))
+    dispatcher.stop()
+
+    assert len(handled) == 61
+    for p in players:
+        mine = [etype for etype, name in handled if name == p.name]
+        assert mine == ["login"] + ["speak"] * 19
+    stats = dispatcher.stats()
+    assert stats["submitted"] == stats["handled"] == 61
+    assert stats["depth"] == 0
+
+def test_drop_general_events_on_overflow():
+    dispatcher = EventDispatcher(lambda e: None, n_workers=1, queue_size=2, overflow="drop")
+    results = [dispatcher.submit(_event("general")) for _ in range(4)]      # not started, nothing consumed
+    assert results == [True, True, False, False]
+    assert dispatcher.stats()["dropped"] == 2
+
+def test_listener_stats_on_workers():
+    from mcservercontrol import PlayerObserver
+    from mcservercontrol.listener import EventListener
+
+    class _Speak(PlayerObserver):
+        def onPlayerSpeak(self, player, content):
+            ...
+
+    listener = EventListener(workers=4)
+    listener.startReplay()
+    listener.echo = False
+    listener.register(_Speak(), _Speak())
+    for i in range(2000):
+        listener.parse("[12:00:00] [Server thread/INFO]: <P{}> hello\n".format(i % 16))
+    listener.stopDispatcher()
+    assert listener.dispatch_stats == {"calls": 4000, "skipped": 0}
@@ -0,0 +1,46 @@
+import os, queue, threading
+import pytest
+from mcservercontrol.logFollower import LogFollower
+
+@pytest.mark.parametrize("inotify", [True, False])
+def test_follow_rotation_truncation_and_partial_lines(tmp_path, inotify):
+    path = tmp_path / "latest.log"
+    path.write_text("old\n")
+    follower = LogFollower(str(path), from_start=True, poll_interval=0.01)
+    if not inotify:
+        follower.close()
+        follower._watcher = None
+    received: "queue.Queue[str]" = queue.Queue()
+
+    def _follow():
+        for line in follower.lines():
+            received.put(line)
+    threading.Thread(target=_follow, daemon=True).start()
+
+    def _next() -> str:
+        return received.get(timeout=5)
+
+    def _append(text: str):
+        with open(path, "a") as fp:
+            fp.write(text)
+
+    assert _next() == "old\n"
+    # a line is only yielded once complete
+    _append("a\n[12:00:00] par")
+    assert _next() == "a\n"
+    _append("tial\n")
+    assert _next() == "[12:00:00] partial\n"
+
+    # rotated: the rest of the old file, then the new file from its start
+    _append("b\n")
+    os.rename(path, tmp_path / "2024-01-01-1.log")
+    path.write_text("c, a longer line\n")
+    assert _next() == "b\n"
+    assert _next() == "c, a longer line\n"
+
+    # truncated: from the start again
+    with open(path, "w") as fp:
+        fp.write("d\n")
+    assert _next() == "d\n"
+    with pytest.raises(queue.Empty):
+        received.get(timeout=0.1)
@@ -0,0 +1,53 @@
+from mcservercontrol.listener import EventListener
+from mcservercontrol.logParser import LogLineParser
+
+LINES = [
+    "[12:00:00] [Server thread/INFO]: Starting minecraft server version 1.19.2\n",
+    "[12:00:01] [Server thread/INFO]: Alex joined the game\n",
+    "[12:00:01] [Server thread/INFO]: Steve joined the game\n",
+    "[12:00:02] [Server thread/INFO]: <Alex> hello there\n",
+    "[12:00:03] [Server thread/INFO]: <Steve> \\kill-item 30\n",
+    "[12:00:03] [Server thread/INFO]: <Steve> \\help\n",
+    "[12:00:04] [Server thread/INFO]: There are 2 of a max of 20 players online: Alex, Steve\n",
+    "[12:00:05] [Server thread/WARN]: Can't keep up! Is the server overloaded? Running 2107ms or 42 ticks behind\n",
+    "[12:00:06] [Server thread/INFO]: [Alex: Set the time to 1000]\n",
+    "[12:00:06] [Server thread/INFO]: <Alex> look [here]\n",
+    "[12:00:07] [Server thread/INFO]: Alex left the game\n",
+    "[12:00:08] [Server thread/INFO] [minecraft/DedicatedServer]: Done (1.0s)!\n",
+    "java.lang.NullPointerException: oops\n",
+    "\n",
+]
+
+class _Collector(EventListener):
+    def __init__(self, parser):
+        super().__init__(parser)
+        self.events = []
+
+    def emit(self, event):
+        self.events.append(event)
+
+def _normalize(event):
+    ev = dict(event)
+    ev.pop("time")
+    if "player" in ev:
+        ev["player"] = ev["player"].name
+    if "players" in ev:
+        ev["players"] = [p.name for p in ev["players"]]
+    if "content" in ev:
+        ev["content"] = ev["content"].strip()
+    return ev
+
+def test_compiled_parser_matches_legacy():
+    legacy, compiled = _Collector("legacy"), _Collector("compiled")
+    for line in LINES:
+        legacy.parse(line)
+        compiled.parse(line)
+    assert [_normalize(e) for e in compiled.events] == [_normalize(e) for e in legacy.events]
+    assert [e["etype"] for e in compiled.events] == [
+        "general", "login", "login", "speak", "cmd", "cmd", "listplayer", "general", "general", "speak", "logout"
+    ]
+
+def test_header_thread_level():
+    parsed = LogLineParser().parse(LINES[7])
+    assert parsed is not None
+    assert (parsed.time, parsed.thread, parsed.level) == ("12:00:05", "Server thread", "WARN")
@@ -0,0 +1,29 @@
+from mcservercontrol import globalVar, PlayerObserver, Player
+from mcservercontrol.listener import EventListener
+
+class _Speak(PlayerObserver):
+    def __init__(self):
+        super().__init__()
+        self.heard = []
+
+    def onPlayerSpeak(self, player, content):
+        self.heard.append(content)
+
+class _Login(PlayerObserver):
+    def onPlayerLogin(self, player):
+        return super().onPlayerLogin(player)
+
+def test_dispatch_only_to_implemented_hooks():
+    listener = EventListener()
+    listener.startReplay()
+    listener.echo = False
+    speak, login = _Speak(), _Login()
+    listener.register(speak, login)
+
+    assert speak.subscribedHooks() == ["onPlayerSpeak"]
+    assert login.subscribedHooks() == ["onPlayerLogin"]
+
+    listener.players["Alex"] = Player("Alex")
+    listener.parse("[12:00:00] [Server thread/INFO]: <Alex> hello\n")
+    assert speak.heard == ["hello"]
+    assert listener.dispatch_stats == {"calls": 1, "skipped": 1}
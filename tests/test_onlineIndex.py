@@ -0,0 +1,27 @@
+from mcservercontrol import globalVar
+from mcservercontrol.listener import EventListener
+from mcservercontrol.statusStore import MemoryStatusStore
+
+def test_online_index_follows_events(monkeypatch):
+    globalVar.init()
+    monkeypatch.setattr(globalVar, "status_store", MemoryStatusStore())
+    listener = EventListener()
+    listener.startReplay()
+    listener.echo = False
+    online = listener.online
+
+    for name in ("Steve", "Alex", "Alice"):
+        listener.parse("[12:00:00] [Server thread/INFO]: {} joined the game\n".format(name))
+    assert len(online) == 3 and "Alex" in online
+    assert online.names() == ["Alex", "Alice", "Steve"]
+    assert online.withPrefix("Al") == ["Alex", "Alice"] and online.withPrefix("B") == []
+
+    listener.parse("[12:00:01] [Server thread/INFO]: Alex left the game\n")
+    assert "Alex" not in online and online.withPrefix("Al") == ["Alice"]
+
+    # /list is the truth, e.g. the logouts missed while not listening
+    listener.parse("[12:00:02] [Server thread/INFO]: There are 2 of a max of 20 players online: Steve, Bob\n")
+    assert online.names() == ["Bob", "Steve"]
+    assert online.get("Bob") is listener.players["Bob"]
+    listener.parse("[12:00:03] [Server thread/INFO]: There are 0 of a max of 20 players online:\n")
+    assert len(online) == 0
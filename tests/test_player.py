@@ -8,3 +8,33 @@ ok = player.status.setdefault("ok_status", "ok")
 print(player.status.has("ok_status"))
 print(ok)
 #  print(player.status.notok_status)
+
+def test_status_schema():
+    import pytest
+    from mcservercontrol.player import PlayerStatus
+    PlayerStatus.register("test_flag", bool, True, persistent=True)
+    PlayerStatus.register("test_ids", list, factory=list)
+    PlayerStatus.register("test_flag", bool, True, persistent=True)
+    with pytest.raises(ValueError):
+        PlayerStatus.register("test_flag", int, 0)
+
+    a, b = Player("a"), Player("b")
+    assert a.status.has("test_ids") and a.status.test_flag is True
+    a.status.get("test_ids").append(1)
+    assert b.status.get("test_ids") == []
+    # registered persistence, and per-player persistence of the status not registered
+    assert not a.status.dirty
+    a.status.set("test_ids", [2])
+    assert not a.status.dirty
+    a.status.test_flag = False
+    a.status.set("note", "hi", persistent=True)
+    assert a.status.dirty
+    assert a.status.persistentDict() == {
+        "time_login": a.status.time_login, "time_online": 0, "time_online_today": 0, "test_flag": False, "note": "hi"
+    }
+    # values of the wrong type are not loaded
+    b.status.loadDict({"test_flag": "yes", "time_online": 5, "other": 1})
+    assert b.status.test_flag is True and b.status.time_online == 5 and b.status.isPersistent("other")
+    # neither the initial nor the loaded values are changes to save
+    assert not b.status.dirty
+    assert not hasattr(b.status, "missing")
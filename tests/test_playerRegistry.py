@@ -0,0 +1,49 @@
+from mcservercontrol import globalVar
+from mcservercontrol.player import Player
+from mcservercontrol.playerRegistry import PlayerRegistry
+from mcservercontrol.statusStore import MemoryStatusStore, StatusFlusher
+
+def test_registry_evicts_offline_players_once_saved(monkeypatch):
+    globalVar.init()
+    store = MemoryStatusStore()
+    monkeypatch.setattr(globalVar, "status_store", store)
+    store.save(Player._hash("old"), {"time_online": 42})
+
+    registry = PlayerRegistry(capacity=2)
+    flusher = StatusFlusher(lambda: registry.values(), on_flushed=registry.evict)
+    # unknown players are created, or loaded from the store on first access
+    assert registry["old"].status.time_online == 42
+    online = registry["online"]
+    online.status.is_online = True
+    registry["offline"].status.time_online = 5
+    # the players with unsaved changes are kept, not the one only loaded
+    assert len(registry) == 2 and "old" not in registry
+
+    flusher.flush()
+    assert registry.evict() == 0
+    assert "online" in registry and "offline" in registry
+    registry["another"]
+    # the online player is pinned
+    assert "offline" not in registry and registry["online"] is online
+    # loaded again, in place of the player never accessed
+    assert registry["offline"].status.time_online == 5
+    assert "another" not in registry and registry.registry_stats["evicted"] == 3
+
+def test_registry_pins_index_and_snapshots(monkeypatch):
+    from mcservercontrol.onlineIndex import OnlineIndex
+    globalVar.init()
+    monkeypatch.setattr(globalVar, "status_store", MemoryStatusStore())
+
+    online = OnlineIndex()
+    registry = PlayerRegistry(capacity=1, online=online)
+    listed = registry["listed"]
+    # online from the reply of /list only, the status does not say so
+    online.reconcile([listed])
+    registry["a"]
+    registry["b"]
+    assert registry["listed"] is listed and registry.registry_stats["loaded"] == 3
+
+    # reading all the players is not an access
+    hits = registry.registry_stats["hits"]
+    assert [p.name for p in registry.values()] == [name for name, _ in registry.items()] == list(registry)
+    assert registry.registry_stats["hits"] == hits
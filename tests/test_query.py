@@ -0,0 +1,41 @@
+import pytest
+from mcservercontrol.query import QueryManager, QueryError
+
+def test_concurrent_queries_resolved_from_log():
+    sent = []
+    manager = QueryManager()
+    f_list = manager.submit("/list", sent.append)
+    f_data = manager.submit("/data get entity Alex Health", sent.append)
+    f_missing = manager.submit("/execute as Bob run data get entity @s Pos", sent.append)
+    f_say = manager.submit("/save-all", sent.append, timeout=0.05)
+    assert len(sent) == 4 and manager.pending() == 4
+
+    manager.feed("[12:00:00] [Server thread/INFO]: <Alex> unrelated chat\n")      # not a response to any query
+    manager.feed("[12:00:00] [Server thread/INFO]: Alex has the following entity data: 20.0f\n")
+    manager.feed("[12:00:00] [Server thread/INFO]: No entity was found\n")
+    manager.feed("[12:00:00] [Server thread/INFO]: There are 1 of a max of 20 players online: Alex\n")
+
+    assert f_list.result(1) == {"online": 1, "max": 20, "players": ["Alex"]}
+    assert f_data.result(1) == "20.0f"
+    with pytest.raises(QueryError):
+        f_missing.result(1)
+    with pytest.raises(TimeoutError):
+        f_say.result(1)
+    assert manager.pending() == 0
+
+def test_unknown_commands_and_catch_all():
+    from mcservercontrol.query import ResponseMatcher
+    sent = []
+    manager = QueryManager()
+    with pytest.raises(ValueError):
+        manager.submit("/weather clear", sent.append)
+    assert sent == [] and manager.pending() == 0
+
+    # sent first, but it does not take the response of /list
+    f_any = manager.submit("/weather clear", sent.append, matcher=ResponseMatcher())
+    f_list = manager.submit("/list", sent.append)
+    manager.feed("[12:00:00] [Server thread/INFO]: There are 0 of a max of 20 players online: \n")
+    assert f_list.result(1) == {"online": 0, "max": 20, "players": []}
+    assert not f_any.done()
+    manager.feed("[12:00:00] [Server thread/INFO]: Set the weather to clear\n")
+    assert f_any.result(1) == "Set the weather to clear"
@@ -0,0 +1,138 @@
+import socket, struct, threading, time
+import pytest
+from mcservercontrol.rcon import RconClient, RconError, encodePacket
+from mcservercontrol.server import Server
+
+class StandInRconServer:
+    """
+    Answers like a minecraft server: /list, echoes other commands,
+    and drops the connection when a read holds more than one packet
+    """
+    def __init__(self, password="secret"):
+        self.password = password
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]
+        self.conns = []
+        self.commands = []
+        self.rejected = 0
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.conns.append(conn)
+            threading.Thread(target=self._serve, args=(conn, ), daemon=True).start()
+
+    def _read(self, conn):
+        # as the vanilla server, a single packet per read
+        data = conn.recv(4096)
+        length, = struct.unpack("<i", data[:4])
+        if len(data) != 4 + length:
+            self.rejected += 1
+            raise ConnectionError("more than one packet in a read")
+        rid, ptype = struct.unpack("<ii", data[4:12])
+        return rid, ptype, data[12:-2].decode()
+
+    def _serve(self, conn):
+        try:
+            rid, ptype, body = self._read(conn)
+            assert ptype == 3
+            conn.sendall(encodePacket(rid if body == self.password else -1, 2, ""))
+            while True:
+                rid, ptype, body = self._read(conn)
+                if ptype != 2:
+                    # the end marker sent by the client after each command
+                    conn.sendall(encodePacket(rid, 0, "Unknown request {:x}".format(ptype)))
+                    continue
+                self.commands.append(body)
+                if body == "list":
+                    resp = [encodePacket(rid, 0, "There are 1 of a max of 20 players online: Alex")]
+                elif body.startswith("slow"):
+                    time.sleep(0.2)
+                    resp = [encodePacket(rid, 0, "slow done")]
+                elif body == "hang":
+                    # never answered
+                    continue
+                elif body.startswith("size "):
+                    # split in packets of 4096 bytes at most
+                    text = "x" * int(body.split()[1])
+                    resp = [encodePacket(rid, 0, text[i:i + 4096]) for i in range(0, len(text), 4096)]
+                else:
+                    resp = [encodePacket(rid, 0, "Echo: " + body)]
+                conn.sendall(b"".join(resp))
+        except Exception:
+            conn.close()
+
+    def dropConnections(self):
+        for c in self.conns:
+            c.shutdown(socket.SHUT_RDWR)
+            c.close()
+        self.conns = []
+
+def test_one_request_at_a_time_and_reconnect():
+    srv = StandInRconServer()
+    client = RconClient("127.0.0.1", srv.port, "secret", reconnect_delay=0)
+    slow = client.request("/slow")
+    fast = client.request("/say hi")
+    assert fast.result(2) == "Echo: say hi"
+    assert slow.done() and slow.result() == "slow done"
+    assert srv.commands == ["slow", "say hi"]
+
+    # from several threads
+    futures = []
+    def _send(i: int):
+        for j in range(10):
+            futures.append(client.request("/say {} {}".format(i, j)))
+    threads = [threading.Thread(target=_send, args=(i, )) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(f.result(2) for f in futures) == sorted("Echo: say {} {}".format(i, j) for i in range(4) for j in range(10))
+    assert srv.rejected == 0
+
+    server = Server(client)
+    assert server.query("/list").result(2)["players"] == ["Alex"]
+
+    pending = client.request("/slow")
+    srv.dropConnections()
+    with pytest.raises(RconError):
+        pending.result(2)
+    # reconnected on demand
+    assert client.request("/say again").result(2) == "Echo: say again"
+
+def test_auth_failure():
+    srv = StandInRconServer()
+    client = RconClient("127.0.0.1", srv.port, "wrong")
+    with pytest.raises(RconError):
+        client.request("/list").result(2)
+
+def test_responses_end_with_the_marker():
+    srv = StandInRconServer()
+    client = RconClient("127.0.0.1", srv.port, "secret", timeout=0.5)
+    assert client.request("/size 4096").result(2) == "x" * 4096
+    assert client.request("/size 10000").result(2) == "x" * 10000
+    hang = client.request("/hang")
+    with pytest.raises(TimeoutError):
+        hang.result(2)
+    # the connection is still usable
+    assert client.request("/say hi").result(2) == "Echo: say hi"
+
+def test_failed_request_cancels_query_timeout():
+    from mcservercontrol import globalVar
+    globalVar.init()
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    n_jobs = len(globalVar.scheduled_threads)
+    # nothing listens on the port
+    server = Server(RconClient("127.0.0.1", port, "secret"))
+    with pytest.raises(RconError):
+        server.query("/list", timeout=60).result(2)
+    assert len(globalVar.scheduled_threads) == n_jobs
@@ -0,0 +1,63 @@
+import os, gzip, datetime, threading
+from mcservercontrol import globalVar, PlayerObserver
+from mcservercontrol.observer import OnlineTimeObserver
+from mcservercontrol.listener import EventListener
+from mcservercontrol.replay import LogReplayer, listLogFiles, logDate
+from mcservercontrol.statusStore import MemoryStatusStore
+from mcservercontrol.timeUtils import TimeUtils
+
+def _stamp(*args) -> float:
+    return datetime.datetime(*args, tzinfo=TimeUtils.LOCAL_TIMEZONE).timestamp()
+
+class _Recorder(PlayerObserver):
+    def __init__(self):
+        super().__init__()
+        self.events = []
+        self.other_thread = []
+
+    def _record(self, hook, player):
+        self.events.append((hook, player.name, TimeUtils.nowStamp()))
+        # the replay clock is not seen by other threads
+        t = threading.Thread(target=lambda: self.other_thread.append(TimeUtils.nowStamp()))
+        t.start()
+        t.join()
+
+    def onPlayerLogin(self, player):
+        self._record("login", player)
+
+    def onPlayerLogout(self, player):
+        self._record("logout", player)
+
+def test_replay_archive_and_latest_log(tmp_path, monkeypatch):
+    globalVar.init()
+    monkeypatch.setattr(globalVar, "status_store", MemoryStatusStore())
+    with gzip.open(tmp_path / "2024-01-30-1.log.gz", "wt") as fp:
+        fp.write("[23:59:00] [Server thread/INFO]: Alex joined the game\n")
+        fp.write("[00:01:00] [Server thread/INFO]: Alex left the game\n")
+    # spans midnight, last written the day after its first line
+    (tmp_path / "latest.log").write_text(
+        "[23:50:00] [Server thread/INFO]: Steve joined the game\n"
+        "[00:10:00] [Server thread/INFO]: Steve left the game\n"
+    )
+    os.utime(tmp_path / "latest.log", (_stamp(2024, 2, 1, 0, 10), _stamp(2024, 2, 1, 0, 10)))
+    paths = listLogFiles(str(tmp_path))
+    assert [os.path.basename(p) for p in paths] == ["2024-01-30-1.log.gz", "latest.log"]
+    assert logDate(paths[1]) == datetime.date(2024, 1, 31)
+
+    listener = EventListener()
+    listener.startReplay()
+    listener.echo = False
+    recorder = _Recorder()
+    listener.register(OnlineTimeObserver(), recorder)
+    LogReplayer(listener).replay(paths)
+
+    assert recorder.events == [
+        ("login", "Alex", _stamp(2024, 1, 30, 23, 59)),
+        ("logout", "Alex", _stamp(2024, 1, 31, 0, 1)),
+        ("login", "Steve", _stamp(2024, 1, 31, 23, 50)),
+        ("logout", "Steve", _stamp(2024, 2, 1, 0, 10)),
+    ]
+    assert all(t > _stamp(2025, 1, 1) for t in recorder.other_thread)
+    assert listener.players["Steve"].status.time_online == 20 * 60
+    # the wall clock again
+    assert TimeUtils.nowStamp() > _stamp(2025, 1, 1)
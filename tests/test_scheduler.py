@@ -0,0 +1,26 @@
+import time
+from mcservercontrol import globalVar
+from mcservercontrol.scheduler import Scheduler
+
+def test_order_cancel_and_repeat():
+    globalVar.init()
+    scheduler = Scheduler()
+    scheduler.start()
+    calls = []
+    scheduler.schedule(lambda: calls.append("b"), 0.1)
+    scheduler.schedule(lambda: calls.append("a"), 0.05)
+    sid = scheduler.schedule(lambda: calls.append("cancelled"), 0.08)
+    rid = scheduler.schedule(lambda: calls.append("r"), 0.02, interval=0.04)
+    assert scheduler.pending() == 4
+    assert sid in globalVar.scheduled_threads
+
+    globalVar.scheduled_threads[sid].stop()
+    assert sid not in globalVar.scheduled_threads
+    assert not scheduler.cancel(sid)
+
+    time.sleep(0.2)
+    assert scheduler.cancel(rid)
+    assert "cancelled" not in calls
+    assert [c for c in calls if c != "r"] == ["a", "b"]
+    assert calls.count("r") >= 3
+    assert scheduler.pending() == 0
@@ -0,0 +1,117 @@
+import os, pickle
+from mcservercontrol.player import Player
+from mcservercontrol.statusStore import SqliteStatusStore, migrateStatus
+
+def test_sqlite_store_roundtrip(tmp_path):
+    path = str(tmp_path / "status.sqlite3")
+    store = SqliteStatusStore(path)
+    assert store.load("nobody") is None
+    store.saveMany({"a": {"time_online": 1.5}, "b": {"time_warn_flag": True}})
+    store.save("a", {"time_online": 3})
+    store.close()
+
+    # persisted, and the last write wins
+    store = SqliteStatusStore(path)
+    assert store.load("a") == {"time_online": 3}
+    assert store.load("b") == {"time_warn_flag": True}
+    assert sorted(store.keys()) == ["a", "b"]
+
+def test_player_status_and_migration(tmp_path, monkeypatch):
+    from mcservercontrol import globalVar
+    globalVar.init()
+    store = SqliteStatusStore(str(tmp_path / "status.sqlite3"))
+    monkeypatch.setattr(globalVar, "status_store", store)
+
+    legacy = tmp_path / "player_status"
+    legacy.mkdir()
+    with open(legacy / (Player._hash("Steve") + ".status"), "wb") as fp:
+        pickle.dump({"time_online": 100, "time_login": 1.0, "time_last_warn": 0}, fp)
+    assert migrateStatus(str(legacy), store) == 1
+
+    steve = Player("Steve")
+    assert steve.loadStatus()
+    assert steve.status.time_online == 100 and steve.status.get("time_last_warn") == 0
+    steve.status.time_online += 20
+    steve.status.set("not_saved", 1)
+    steve.saveStatus()
+    assert store.load(Player._hash("Steve")) == {"time_login": 1.0, "time_online": 120, "time_online_today": 0, "time_last_warn": 0}
+
+    assert not Player("Alex").loadStatus()
+
+def test_flusher_writes_dirty_and_online_players(monkeypatch):
+    from mcservercontrol import globalVar
+    from mcservercontrol.statusStore import MemoryStatusStore, StatusFlusher
+    from mcservercontrol.timeUtils import TimeUtils
+    globalVar.init()
+    store = MemoryStatusStore()
+    monkeypatch.setattr(globalVar, "status_store", store)
+
+    online = Player("Steve", {"is_online": True, "time_login": TimeUtils.nowStamp() - 10})
+    offline = Player("Alex")
+    players = {p.name: p for p in (online, offline)}
+    flusher = StatusFlusher(lambda: players.values())
+    # the new offline player has nothing to save
+    assert flusher.flush() == 1
+    # the session time so far is saved, not counted in memory before the logout
+    assert store.load(Player._hash("Steve"))["time_online"] >= 10        # type: ignore
+    assert online.status.time_online == 0
+
+    # unchanged offline players are not written again
+    assert flusher.flush() == 1
+    offline.status.time_online += 5
+    assert flusher.flush() == 2
+    assert store.load(Player._hash("Alex"))["time_online"] == 5      # type: ignore
+    assert flusher.flush_stats["flushes"] == 3 and flusher.flush_stats["players"] == 4
+    assert flusher.flush_stats["max_batch"] == 2
+
+def test_flusher_keeps_players_dirty_until_written(monkeypatch):
+    import pytest
+    from mcservercontrol import globalVar
+    from mcservercontrol.playerRegistry import PlayerRegistry
+    from mcservercontrol.statusStore import MemoryStatusStore, StatusFlusher
+    globalVar.init()
+
+    registry = PlayerRegistry(capacity=0)
+    seen = []
+    class _Store(MemoryStatusStore):
+        fail = False
+        def saveMany(self, records):
+            # evicting while the batch is written must not drop the player
+            registry.evict()
+            seen.append("Alex" in registry and registry["Alex"].status.dirty)
+            if self.fail:
+                raise IOError("disk full")
+            super().saveMany(records)
+    store = _Store()
+    monkeypatch.setattr(globalVar, "status_store", store)
+
+    alex = registry["Alex"]
+    alex.status.time_online = 5
+    registry["Steve"]
+    flusher = StatusFlusher(lambda: registry.values())
+    store.fail = True
+    with pytest.raises(IOError):
+        flusher.flush()
+    assert alex.status.dirty
+    store.fail = False
+    assert flusher.flush() == 1
+    assert seen == [True, True] and not alex.status.dirty
+    assert store.load(Player._hash("Alex")) is not None and store.load(Player._hash("Alex"))["time_online"] == 5   # type: ignore
+
+def test_migration_rejects_values_not_json(tmp_path):
+    import pytest
+    from mcservercontrol.statusStore import MemoryStatusStore, StatusStore
+    with pytest.raises(TypeError):
+        StatusStore()       # type: ignore
+
+    legacy = tmp_path / "player_status"
+    legacy.mkdir()
+    with open(legacy / (Player._hash("Alex") + ".status"), "wb") as fp:
+        pickle.dump({"time_online": 1}, fp)
+    with open(legacy / (Player._hash("Steve") + ".status"), "wb") as fp:
+        pickle.dump({"time_online": 100, "homes": {"base", "farm"}}, fp)
+    store = MemoryStatusStore()
+    with pytest.raises(ValueError, match="{}.status.*homes".format(Player._hash("Steve"))):
+        migrateStatus(str(legacy), store)
+    # nothing imported
+    assert store.keys() == []